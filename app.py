@@ -1,10 +1,37 @@
 import os
 import json
 import requests
+from urllib.parse import urlencode
 from flask import Flask, redirect, request, session, jsonify, send_from_directory
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import threading
+import time
+import random
+import base64
+import hashlib
+import asyncio
+import itertools
+import bisect
+import csv
+import io
+import atexit
+import logging
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from collections import OrderedDict
+from storage import create_storage, try_lock, set_observer as set_storage_observer
+from metrics import Registry, Histogram, CallbackMetric, begin_request, end_request, request_phase, add_phase_time
+from assets import AssetPipeline, compress_response, etag_matches
+from logs import configure_logging, log_body
+from resilience import SingleFlight, TokenBucket, CircuitBreaker
+from events import EventBus
+from search import TextIndex, snippet
+try:
+    import asgiref  # noqa: F401 (needed by Flask for async views)
+    from fhir_async import AsyncFHIRClient
+except ImportError:  # aiohttp / flask[async] not installed: sync FHIR client only
+    AsyncFHIRClient = None
 
 # =========================
 # Flask App Setup
@@ -20,51 +47,392 @@ CORS(app)  # Enable CORS for all routes
 CLIENT_ID = os.environ.get("CLIENT_ID", "0oa14yyj478KHYYYC2p8")
 CLIENT_SECRET = os.environ.get("CLIENT_SECRET", "pqmKTPrFTbTCwUQWGbVGjSY0YgIhUaol15FdYBva8NsajcNjfDEZkel2lz5AxYD3")
 REDIRECT_URI = os.environ.get("REDIRECT_URI", "https://ssvf-vet-connect-7eb35b893d8e.herokuapp.com/oauth/callback")
-AUTH_URL = "https://sandbox-api.va.gov/oauth2/health/v1/authorization"
-TOKEN_URL = "https://sandbox-api.va.gov/oauth2/health/v1/token"
-FHIR_API_BASE = "https://sandbox-api.va.gov/services/fhir/v0/r4"
+# Overridable to point at a local stub (see bench/stub_server.py)
+AUTH_URL = os.environ.get("AUTH_URL", "https://sandbox-api.va.gov/oauth2/health/v1/authorization")
+TOKEN_URL = os.environ.get("TOKEN_URL", "https://sandbox-api.va.gov/oauth2/health/v1/token")
+FHIR_API_BASE = os.environ.get("FHIR_API_BASE", "https://sandbox-api.va.gov/services/fhir/v0/r4")
 
 TOKEN_DB = "tokens.json"
 CASE_NOTES_DB = "case_notes.json"
-case_notes_lock = threading.Lock()
+ASSIGNMENTS_DB = "./assignments.json"
+
+# Storage backend: "json" (the files above) or "sqlite" (SQLITE_DB, WAL mode;
+# the JSON files are imported on first start)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+SQLITE_DB = os.environ.get("SQLITE_DB", "ssvf.db")
+# JSON backend: case note edits go to an append-only journal that is folded
+# into case_notes.json every CASE_NOTES_COMPACT_INTERVAL seconds
+CASE_NOTES_COMPACT_INTERVAL = float(os.environ.get("CASE_NOTES_COMPACT_INTERVAL", "300"))
+# JSON backend: per-veteran FHIR snapshots for incremental sync (one file per ICN)
+FHIR_SNAPSHOT_DIR = os.environ.get("FHIR_SNAPSHOT_DIR", "fhir_snapshots")
+storage = create_storage(STORAGE_BACKEND, ASSIGNMENTS_DB, TOKEN_DB, CASE_NOTES_DB, SQLITE_DB,
+                         compact_interval=CASE_NOTES_COMPACT_INTERVAL, snapshots_path=FHIR_SNAPSHOT_DIR)
+assignment_store = storage.assignments
+token_store = storage.tokens
+case_notes_store = storage.case_notes
+snapshot_store = storage.snapshots
+
+# Dashboard change events (/api/events): appended to EVENTS_LOG, which every
+# worker tails every EVENTS_POLL_INTERVAL seconds; rotated past EVENTS_MAX_BYTES.
+# Streams send a keepalive every EVENTS_HEARTBEAT seconds and are closed after
+# EVENTS_STREAM_MAX_AGE seconds (the browser reconnects and resumes). Each open
+# stream holds a worker thread, so a worker serves at most EVENTS_MAX_STREAMS of
+# them (keep it well below the Procfile's --threads) and refuses more with a 503.
+EVENTS_LOG = os.environ.get("EVENTS_LOG", "events.log")
+EVENTS_POLL_INTERVAL = float(os.environ.get("EVENTS_POLL_INTERVAL", "0.25"))
+EVENTS_MAX_BYTES = int(os.environ.get("EVENTS_MAX_BYTES", str(1024 * 1024)))
+EVENTS_HEARTBEAT = float(os.environ.get("EVENTS_HEARTBEAT", "15"))
+EVENTS_STREAM_MAX_AGE = float(os.environ.get("EVENTS_STREAM_MAX_AGE", "300"))
+EVENTS_MAX_STREAMS = int(os.environ.get("EVENTS_MAX_STREAMS", "8"))
+EVENTS_RETRY_AFTER = float(os.environ.get("EVENTS_RETRY_AFTER", "30"))
+event_bus = EventBus(EVENTS_LOG, EVENTS_POLL_INTERVAL, EVENTS_MAX_BYTES, max_subscribers=EVENTS_MAX_STREAMS)
+
+# Upstream FHIR fetches: bounded worker pool and per-call timeout (seconds)
+FHIR_MAX_WORKERS = int(os.environ.get("FHIR_MAX_WORKERS", "16"))
+FHIR_TIMEOUT = float(os.environ.get("FHIR_TIMEOUT", "10"))
+fhir_executor = ThreadPoolExecutor(max_workers=FHIR_MAX_WORKERS, thread_name_prefix="fhir")
+
+# FHIR search paging: _count per page and a cap on next links followed.
+# Appointments are limited to LOOKBACK days back and LOOKAHEAD days ahead.
+FHIR_PAGE_SIZE = int(os.environ.get("FHIR_PAGE_SIZE", "50"))
+FHIR_MAX_PAGES = int(os.environ.get("FHIR_MAX_PAGES", "10"))
+APPOINTMENT_LOOKBACK_DAYS = int(os.environ.get("APPOINTMENT_LOOKBACK_DAYS", "365"))
+APPOINTMENT_LOOKAHEAD_DAYS = int(os.environ.get("APPOINTMENT_LOOKAHEAD_DAYS", "180"))
+
+# Optional FHIR batch mode: one batch Bundle per veteran instead of one GET per
+# resource. If the upstream rejects batches, fall back to individual GETs and
+# try batching again after FHIR_BATCH_RETRY seconds.
+FHIR_BATCH_ENABLED = os.environ.get("FHIR_BATCH", "false") == "true"
+FHIR_BATCH_RETRY = float(os.environ.get("FHIR_BATCH_RETRY", "3600"))
+
+# Optional incremental FHIR sync: each veteran's parsed Patient, Appointment
+# and PractitionerRole resources are persisted with their versionId and
+# lastUpdated. Snapshots hold PHI (name, contact details, appointments), so
+# only enable this where the snapshot store is encrypted at rest; the SSN is
+# never written and is kept in memory only. Later fetches ask only for
+# changes: a conditional Patient read (If-None-Match) and _lastUpdated=gt
+# searches starting FHIR_SYNC_OVERLAP seconds before the previous sync.
+# Everything is re-fetched every FHIR_FULL_SYNC_INTERVAL seconds so deleted
+# resources drop out. If the upstream rejects _lastUpdated, full fetches are
+# used for FHIR_INCREMENTAL_RETRY seconds. With FHIR_BATCH=true the sync reads
+# go out as one batch Bundle. The async client reads and writes snapshots on
+# snapshot_executor so file and SQLite I/O never blocks its event loop.
+FHIR_INCREMENTAL_ENABLED = os.environ.get("FHIR_INCREMENTAL", "false") == "true"
+FHIR_FULL_SYNC_INTERVAL = float(os.environ.get("FHIR_FULL_SYNC_INTERVAL", "86400"))
+FHIR_SYNC_OVERLAP = float(os.environ.get("FHIR_SYNC_OVERLAP", "300"))
+FHIR_INCREMENTAL_RETRY = float(os.environ.get("FHIR_INCREMENTAL_RETRY", "3600"))
+fhir_incremental_rejected_at = None
+snapshot_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("FHIR_SNAPSHOT_WORKERS", "4")),
+                                       thread_name_prefix="snapshot")
+FHIR_BATCH_REJECT_STATUSES = {400, 404, 405, 415, 422, 501}
+fhir_batch_rejected_at = None
+
+# Batch summary fetches get their own pool so they never starve fhir_executor
+SUMMARY_MAX_WORKERS = int(os.environ.get("SUMMARY_MAX_WORKERS", "8"))
+SUMMARY_BATCH_TIMEOUT = float(os.environ.get("SUMMARY_BATCH_TIMEOUT", "30"))
+MAX_BATCH_IDS = int(os.environ.get("MAX_BATCH_IDS", "500"))
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_MAX_WORKERS, thread_name_prefix="summary")
+
+# Async FHIR client (aiohttp, one event loop per worker) for batch summaries and
+# /api/async/patient; FHIR_ASYNC=false keeps everything on the sync client
+FHIR_ASYNC_ENABLED = AsyncFHIRClient is not None and os.environ.get("FHIR_ASYNC", "true") == "true"
+FHIR_ASYNC_CONNECTIONS = int(os.environ.get("FHIR_ASYNC_CONNECTIONS", "100"))
+SUMMARY_ASYNC_CONCURRENCY = int(os.environ.get("SUMMARY_ASYNC_CONCURRENCY", "50"))
+
+# Shared VA API client: connection pool size, (connect, read) timeouts and
+# retry policy for 429/5xx responses (exponential backoff with full jitter)
+VA_POOL_SIZE = int(os.environ.get("VA_POOL_SIZE", str(FHIR_MAX_WORKERS + 4)))
+VA_CONNECT_TIMEOUT = float(os.environ.get("VA_CONNECT_TIMEOUT", "3.05"))
+VA_READ_TIMEOUT = float(os.environ.get("VA_READ_TIMEOUT", str(FHIR_TIMEOUT)))
+VA_MAX_RETRIES = int(os.environ.get("VA_MAX_RETRIES", "2"))
+VA_BACKOFF_BASE = float(os.environ.get("VA_BACKOFF_BASE", "0.5"))
+VA_BACKOFF_MAX = float(os.environ.get("VA_BACKOFF_MAX", "8"))
+VA_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# FHIR upstream protection (per worker): a token bucket of FHIR_RATE_LIMIT
+# calls/second with bursts of FHIR_RATE_BURST (0 = unlimited); calls that
+# would queue longer than FHIR_RATE_MAX_WAIT seconds fail instead. The
+# defaults let a cold 50-veteran page (about 200 calls) go out at once, and
+# batch summary fetches are paced to the bucket (see summary_fetch_limit). After
+# FHIR_BREAKER_THRESHOLD consecutive errors, 429/5xx or calls slower than
+# FHIR_BREAKER_SLOW seconds, FHIR calls are refused for FHIR_BREAKER_COOLDOWN
+# seconds and summaries are served from the cache.
+FHIR_RATE_LIMIT = float(os.environ.get("FHIR_RATE_LIMIT", "50"))
+FHIR_RATE_BURST = int(os.environ.get("FHIR_RATE_BURST", "200"))
+FHIR_RATE_MAX_WAIT = float(os.environ.get("FHIR_RATE_MAX_WAIT", "5"))
+FHIR_BREAKER_THRESHOLD = int(os.environ.get("FHIR_BREAKER_THRESHOLD", "5"))
+FHIR_BREAKER_COOLDOWN = float(os.environ.get("FHIR_BREAKER_COOLDOWN", "30"))
+FHIR_BREAKER_SLOW = float(os.environ.get("FHIR_BREAKER_SLOW", "5"))
+
+# Background OAuth token refresh: tokens within TOKEN_REFRESH_MARGIN seconds
+# of expiry are refreshed every TOKEN_REFRESH_INTERVAL seconds
+TOKEN_REFRESH_ENABLED = os.environ.get("TOKEN_REFRESH_ENABLED", "true") == "true"
+TOKEN_REFRESH_INTERVAL = float(os.environ.get("TOKEN_REFRESH_INTERVAL", "60"))
+TOKEN_REFRESH_MARGIN = float(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+TOKEN_REFRESH_RETRY = float(os.environ.get("TOKEN_REFRESH_RETRY", "900"))
+TOKEN_REFRESH_WORKERS = int(os.environ.get("TOKEN_REFRESH_WORKERS", "4"))
+# Only the worker holding this lock refreshes tokens (refresh tokens may be single-use)
+TOKEN_REFRESH_LOCK = os.environ.get("TOKEN_REFRESH_LOCK", "token_refresh.lock")
+
+# Patient summary cache: fresh for TTL seconds, then served stale (while a
+# background refresh runs) for up to STALE_TTL more seconds
+SUMMARY_CACHE_TTL = float(os.environ.get("SUMMARY_CACHE_TTL", "300"))
+SUMMARY_CACHE_STALE_TTL = float(os.environ.get("SUMMARY_CACHE_STALE_TTL", "3600"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", "2000"))
+SUMMARY_CACHE_MAX_BYTES = int(os.environ.get("SUMMARY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Cache warmer: every SUMMARY_WARM_INTERVAL seconds, precompute summaries for
+# all assigned veterans with a valid token, SUMMARY_WARM_CONCURRENCY at a time,
+# each fetch delayed by up to SUMMARY_WARM_JITTER seconds to spread the load
+SUMMARY_WARM_ENABLED = os.environ.get("SUMMARY_WARM_ENABLED", "true") == "true"
+SUMMARY_WARM_INTERVAL = float(os.environ.get("SUMMARY_WARM_INTERVAL", "300"))
+SUMMARY_WARM_CONCURRENCY = int(os.environ.get("SUMMARY_WARM_CONCURRENCY", "2"))
+SUMMARY_WARM_JITTER = float(os.environ.get("SUMMARY_WARM_JITTER", "2"))
+
+# Static assets served fingerprinted from /assets/ (logical name -> source file under the app directory)
+STATIC_ASSETS = {
+    "SSVF_Dashboard.js": "frontend/SSVF_Dashboard.js",
+    "VeteranPortal.js": "frontend/VeteranPortal.js",
+    "style.css": "static/style.css",
+}
+# JSON responses at least this large are gzip/brotli compressed
+JSON_COMPRESS_MIN_BYTES = int(os.environ.get("JSON_COMPRESS_MIN_BYTES", "1024"))
+
+# /api/veterans pagination
+VETERANS_MAX_PAGE_SIZE = int(os.environ.get("VETERANS_MAX_PAGE_SIZE", "500"))
+
+# /api/case_notes/search: default page size
+CASE_NOTES_SEARCH_PAGE_SIZE = int(os.environ.get("CASE_NOTES_SEARCH_PAGE_SIZE", "25"))
+VETERAN_FIELDS = ("id", "name", "dob", "case_manager_id")
+
+# /api/caseload/export: veterans are joined with their notes and summaries
+# EXPORT_CHUNK_SIZE at a time, so memory stays flat however large the agency
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "50"))
+
+# Log requests slower than this many milliseconds with a per-phase breakdown (0 = off)
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Logging: LOG_LEVEL is DEBUG/INFO/WARNING/ERROR, LOG_FORMAT "text" or "json".
+# Payload dumps (FHIR responses, summaries, token responses) need LOG_BODIES
+# and DEBUG; dumps over LOG_BODY_MAX_CHARS are sampled at LOG_BODY_SAMPLE_RATE.
+# Body logging is off unless APP_ENV is something other than "production".
+APP_ENV = os.environ.get("APP_ENV", "production")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json" if APP_ENV == "production" else "text")
+LOG_BODIES = os.environ.get("LOG_BODIES", "false" if APP_ENV == "production" else "true") == "true"
+LOG_BODY_SAMPLE_RATE = float(os.environ.get("LOG_BODY_SAMPLE_RATE", "0.01"))
+LOG_BODY_MAX_CHARS = int(os.environ.get("LOG_BODY_MAX_CHARS", "2000"))
 
 # =========================
-# Utility Functions
+# Logging
+# =========================
+
+configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_BODIES, LOG_BODY_SAMPLE_RATE, LOG_BODY_MAX_CHARS)
+log = logging.getLogger(__name__)
+
+# =========================
+# Metrics
+# =========================
+
+# Metrics are per process: each gunicorn worker exposes its own /metrics
+metrics_registry = Registry()
+http_request_duration = metrics_registry.register(Histogram(
+    "ssvf_http_request_duration_seconds", "Request latency by route.", ("method", "route", "status")))
+request_phase_duration = metrics_registry.register(Histogram(
+    "ssvf_http_request_phase_seconds", "Request time spent upstream, in storage and in app code.", ("route", "phase")))
+upstream_request_duration = metrics_registry.register(Histogram(
+    "ssvf_upstream_request_duration_seconds", "VA API call latency per attempt by resource type and status.",
+    ("method", "resource", "status")))
+storage_operation_duration = metrics_registry.register(Histogram(
+    "ssvf_storage_operation_duration_seconds", "Storage load/save/query latency.", ("store", "operation")))
+metrics_registry.register(CallbackMetric(
+    "ssvf_summary_cache_lookups_total", "Patient summary cache lookups by result.", "counter",
+    lambda: [((result,), summary_cache.stats()[key]) for result, key in
+             (("hit", "hits"), ("stale_hit", "stale_hits"), ("miss", "misses"))], ("result",)))
+metrics_registry.register(CallbackMetric(
+    "ssvf_summary_cache_hit_ratio", "Share of summary cache lookups served from the cache.", "gauge",
+    lambda: [((), summary_cache.stats()["hit_ratio"])]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_summary_cache_entries", "Summaries currently cached.", "gauge",
+    lambda: [((), summary_cache.stats()["entries"])]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_summary_cache_bytes", "Approximate JSON size of the cached summaries.", "gauge",
+    lambda: [((), summary_cache.stats()["bytes"])]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_cache_warmer_summaries_total", "Summaries precomputed by the cache warmer by outcome.", "counter",
+    lambda: [(("warmed",), cache_warmer.stats()["warmed"]), (("failed",), cache_warmer.stats()["failures"])],
+    ("outcome",)))
+metrics_registry.register(CallbackMetric(
+    "ssvf_cache_warmer_last_run_seconds", "Duration of the last cache warmer pass.", "gauge",
+    lambda: [((), cache_warmer.stats()["last_run"].get("duration", 0))]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_event_streams", "Open /api/events streams.", "gauge",
+    lambda: [((), event_bus.stats()["subscribers"])]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_events_total", "Dashboard change events published and delivered to, or dropped for, open streams, "
+    "and streams refused at EVENTS_MAX_STREAMS.",
+    "counter", lambda: [((outcome,), event_bus.stats()[outcome]) for outcome in ("published", "delivered", "dropped", "refused")],
+    ("outcome",)))
+
+def upstream_resource(url):
+    """Metric label for a VA API URL: the FHIR resource type, "batch", "token" or "other"."""
+    if url.startswith(TOKEN_URL):
+        return "token"
+    if not url.startswith(FHIR_API_BASE):
+        return "other"
+    path = url[len(FHIR_API_BASE):].split("?", 1)[0].strip("/")
+    return path.split("/", 1)[0] or "batch"
+
+def observe_upstream(method, url, status, seconds):
+    """Record one VA API attempt; FHIR outcomes also feed the circuit breaker."""
+    upstream_request_duration.observe(seconds, method, upstream_resource(url), status)
+    if url.startswith(FHIR_API_BASE):
+        fhir_breaker.record(not (status == "error" or status == 429 or status >= 500), seconds)
+
+def observe_storage(store, operation, seconds):
+    storage_operation_duration.observe(seconds, store, operation)
+    add_phase_time("storage", seconds)
+
+set_storage_observer(observe_storage)
+
+# =========================
+# Upstream Protection
 # =========================
 
-def load_tokens():
-    """Load tokens from the tokens.json file."""
-    if not os.path.exists(TOKEN_DB):
-        return {}
-    with open(TOKEN_DB, "r") as f:
-        return json.load(f)
-
-def save_tokens(tokens):
-    """Save tokens to the tokens.json file."""
-    print("Saving tokens to tokens.json")
-    with open(TOKEN_DB, "w") as f:
-        json.dump(tokens, f)
-
-def load_case_notes():
-    """Load case notes from the case_notes.json file."""
-    if not os.path.exists(CASE_NOTES_DB):
-        return {}
-    with open(CASE_NOTES_DB, "r") as f:
-        content = f.read().strip()
-        if not content:
-            return {}
-        return json.loads(content)
-
-def save_case_notes(notes):
-    """Save case notes to the case_notes.json file."""
-    with case_notes_lock:
-        with open(CASE_NOTES_DB, "w") as f:
-            json.dump(notes, f)
-
-def load_data():
-    """Load agency/case manager/veteran assignments from assignments.json."""
-    with open("./assignments.json", "r") as file:
-        return json.load(file)
+summary_flights = SingleFlight()
+fhir_rate_limiter = TokenBucket(FHIR_RATE_LIMIT, FHIR_RATE_BURST)
+fhir_breaker = CircuitBreaker("fhir", FHIR_BREAKER_THRESHOLD, FHIR_BREAKER_COOLDOWN, FHIR_BREAKER_SLOW)
+
+# Batch summary fetches (/api/patients, the export) run no more veterans at
+# once than the rate limiter can queue calls for within FHIR_RATE_MAX_WAIT, so
+# a large page waits for tokens instead of having its calls refused
+SUMMARY_CALLS_PER_VETERAN = 4  # Patient, two Appointment searches, PractitionerRole
+if FHIR_RATE_LIMIT > 0:
+    summary_fetch_limit = max(1, int(FHIR_RATE_LIMIT * FHIR_RATE_MAX_WAIT) // SUMMARY_CALLS_PER_VETERAN)
+else:
+    summary_fetch_limit = SUMMARY_ASYNC_CONCURRENCY
+summary_sync_slots = threading.BoundedSemaphore(min(SUMMARY_MAX_WORKERS, summary_fetch_limit))
+summary_async_slots = None  # asyncio.Semaphore, created on the async client's loop
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """A FHIR call was not sent: the circuit is open or the rate limit queue is too long."""
+
+def upstream_gate(method, url):
+    """
+    Admit a VA API call: returns the seconds to wait under the FHIR rate
+    limit (0 for non-FHIR URLs) or raises UpstreamUnavailable. Called
+    before every attempt by both the sync and the async client.
+    """
+    if not url.startswith(FHIR_API_BASE):
+        return 0.0
+    if not fhir_breaker.allow():
+        raise UpstreamUnavailable(f"FHIR circuit open; not calling {method} {url}")
+    delay = fhir_rate_limiter.reserve(FHIR_RATE_MAX_WAIT)
+    if delay is None:
+        raise UpstreamUnavailable(f"FHIR rate limit queue full; not calling {method} {url}")
+    return delay
+
+metrics_registry.register(CallbackMetric(
+    "ssvf_upstream_circuit_open", "1 while FHIR calls are refused by the circuit breaker.", "gauge",
+    lambda: [((), int(fhir_breaker.is_open()))]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_upstream_circuit_rejected_total", "FHIR calls refused by the open circuit.", "counter",
+    lambda: [((), fhir_breaker.stats()["rejected"])]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_upstream_rate_limited_total", "FHIR calls delayed or rejected by the rate limiter.", "counter",
+    lambda: [((outcome,), fhir_rate_limiter.stats()[outcome]) for outcome in ("delayed", "rejected")], ("outcome",)))
+metrics_registry.register(CallbackMetric(
+    "ssvf_upstream_rate_limit_wait_seconds_total", "Time FHIR calls waited for the rate limiter.", "counter",
+    lambda: [((), fhir_rate_limiter.stats()["wait_seconds"])]))
+metrics_registry.register(CallbackMetric(
+    "ssvf_summary_fetches_coalesced_total", "Summary fetches that joined one already in flight for the same ICN.",
+    "counter", lambda: [((), summary_flights.stats()["shared"])]))
+
+# =========================
+# VA API Client
+# =========================
+
+def create_va_session():
+    """Create the pooled keep-alive session shared by all VA API calls."""
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=VA_POOL_SIZE, max_retries=0)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+va_session = create_va_session()
+
+def va_request(method, url, **kwargs):
+    """
+    Send a request to the VA API over the shared session.
+    Applies default (connect, read) timeouts and retries 429/5xx responses
+    with exponential backoff and jitter, honoring Retry-After. Non-idempotent
+    methods are only retried when the server cannot have processed them
+    (429 or a failed connection).
+    """
+    with request_phase("upstream"):
+        return send_with_retries(method, url, **kwargs)
+
+def send_with_retries(method, url, **kwargs):
+    kwargs.setdefault("timeout", (VA_CONNECT_TIMEOUT, VA_READ_TIMEOUT))
+    idempotent = method.upper() in ("GET", "HEAD", "OPTIONS")
+    attempt = 0
+    while True:
+        delay = upstream_gate(method, url)
+        if delay:
+            time.sleep(delay)
+        started = time.perf_counter()
+        try:
+            resp = va_session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            observe_upstream(method, url, "error", time.perf_counter() - started)
+            retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+            if not retryable or attempt >= VA_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            log.warning("%s %s failed (%s); retrying in %.2fs", method, url, e, delay)
+        else:
+            observe_upstream(method, resp.url or url, resp.status_code, time.perf_counter() - started)
+            retryable = resp.status_code == 429 or (idempotent and resp.status_code in VA_RETRY_STATUSES)
+            if not retryable or attempt >= VA_MAX_RETRIES:
+                return resp
+            delay = backoff_delay(attempt, resp.headers.get("Retry-After"))
+            log.warning("%s %s returned %s; retrying in %.2fs", method, url, resp.status_code, delay)
+            resp.close()
+        time.sleep(delay)
+        attempt += 1
+
+if FHIR_ASYNC_ENABLED:
+    fhir_async_client = AsyncFHIRClient(
+        FHIR_API_BASE, limit=FHIR_ASYNC_CONNECTIONS, limit_per_host=FHIR_ASYNC_CONNECTIONS,
+        connect_timeout=VA_CONNECT_TIMEOUT, read_timeout=VA_READ_TIMEOUT,
+        max_retries=VA_MAX_RETRIES, backoff_base=VA_BACKOFF_BASE, backoff_max=VA_BACKOFF_MAX,
+        page_size=FHIR_PAGE_SIZE, max_pages=FHIR_MAX_PAGES, observer=observe_upstream, gate=upstream_gate)
+    fhir_async_client.start()
+    atexit.register(fhir_async_client.close)
+else:
+    fhir_async_client = None
+
+def va_get(url, **kwargs):
+    return va_request("GET", url, **kwargs)
+
+def va_post(url, **kwargs):
+    return va_request("POST", url, **kwargs)
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, or the server's Retry-After (seconds) if given."""
+    if retry_after:
+        try:
+            return min(float(retry_after), VA_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(VA_BACKOFF_MAX, VA_BACKOFF_BASE * (2 ** attempt)))
+
+# =========================
+# Utility Functions
+# =========================
 
 def authorize_agency(agency_id):
     """Check if the logged-in user is authorized for the given agency."""
@@ -81,23 +449,557 @@ def refresh_access_token(refresh_token):
         "client_id": CLIENT_ID,
         "client_secret": CLIENT_SECRET,
     }
-    resp = requests.post(TOKEN_URL, data=data)
+    resp = va_post(TOKEN_URL, data=data)
     if resp.status_code == 200:
         return resp.json()
     return None
 
+# =========================
+# OAuth Token Manager
+# =========================
+
+def jwt_expiry(token):
+    """Return the exp claim (epoch seconds) of a JWT without verifying it, or None."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+def token_expiry(token_info):
+    """Expiry of a stored token: expires_at if recorded, else the access token's exp claim."""
+    return token_info.get("expires_at") or jwt_expiry(token_info.get("access_token") or "")
+
+def token_info_from_response(token_data, previous_refresh_token=None):
+    """Build the stored token record from a token endpoint response."""
+    info = {
+        "access_token": token_data.get("access_token"),
+        "refresh_token": token_data.get("refresh_token") or previous_refresh_token,
+    }
+    if token_data.get("expires_in"):
+        info["expires_at"] = int(time.time() + int(token_data["expires_in"]))
+    return info
+
+class TokenManager:
+    """
+    In-memory view of the token store that keeps access tokens fresh.
+    A background thread refreshes tokens shortly before they expire (bounded
+    concurrency, at most one refresh per ICN at a time) and writes refreshed
+    tokens back to the store in one batch per pass, so request handlers only
+    ever read from memory. The memory copy is resynced whenever the store's
+    version changes (e.g. another worker saved or revoked a token), and only
+    the worker holding the leader lock refreshes, so gunicorn workers never
+    race each other with the same refresh token.
+    """
+
+    def __init__(self, store, margin, interval, retry_after, max_workers, leader_lock_path):
+        self.store = store
+        self.margin = margin
+        self.interval = interval
+        self.retry_after = retry_after
+        self.leader_lock_path = leader_lock_path
+        self.leader_lock = None
+        self.lock = threading.Lock()
+        self.synced_version = store.version
+        self.tokens = store.all()
+        self.dirty = {}  # refreshed tokens not yet written to the store
+        self.in_flight = set()
+        self.failed_at = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="token-refresh")
+
+    # --- Reads and writes used by request handlers ---
+
+    def get(self, icn):
+        self.sync()
+        with self.lock:
+            return self.tokens.get(icn)
+
+    def get_many(self, icns):
+        self.sync()
+        with self.lock:
+            return {icn: self.tokens[icn] for icn in icns if icn in self.tokens}
+
+    def sync(self, force=False):
+        """Reload from the store if it changed since the last sync; unflushed refreshes win."""
+        version = self.store.version
+        if not force and version == self.synced_version:
+            return
+        stored = self.store.all()
+        with self.lock:
+            stored.update(self.dirty)
+            self.tokens = stored
+            self.synced_version = version
+
+    def set(self, icn, token_info):
+        self.store.set(icn, token_info)
+        with self.lock:
+            self.tokens[icn] = token_info
+            self.dirty.pop(icn, None)
+            self.failed_at.pop(icn, None)
+
+    def delete(self, icn):
+        self.store.delete(icn)
+        with self.lock:
+            self.tokens.pop(icn, None)
+            self.dirty.pop(icn, None)
+
+    def is_expired(self, token_info):
+        expiry = token_expiry(token_info)
+        return expiry is not None and expiry <= time.time()
+
+    def request_refresh(self, icn):
+        """Schedule a refresh for one ICN without waiting for it (leader worker only)."""
+        if self.leader_lock is None:
+            return
+        with self.lock:
+            info = self.tokens.get(icn)
+            if not info or not info.get("refresh_token") or icn in self.in_flight:
+                return
+            if time.time() - self.failed_at.get(icn, 0) < self.retry_after:
+                return
+            self.in_flight.add(icn)
+        self.executor.submit(self._refresh, icn, info)
+
+    # --- Background refresh ---
+
+    def start(self):
+        threading.Thread(target=self._run, name="token-scheduler", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                log.exception("Token refresh pass failed: %s", e)
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Flush refreshed tokens, resync from the store and schedule due refreshes."""
+        if self.leader_lock is None:
+            self.leader_lock = try_lock(self.leader_lock_path)
+            if self.leader_lock is None:
+                self.sync()
+                return
+        self.flush()
+        self.sync(force=True)
+        with self.lock:
+            due = [
+                icn for icn, info in self.tokens.items()
+                if info.get("refresh_token")
+                and (token_expiry(info) or float("inf")) - time.time() < self.margin
+            ]
+        for icn in due:
+            self.request_refresh(icn)
+
+    def flush(self):
+        """Persist refreshed tokens in a single store write."""
+        with self.lock:
+            batch, self.dirty = self.dirty, {}
+        if batch:
+            try:
+                self.store.set_many(batch)
+                log.info("Persisted %d refreshed tokens", len(batch))
+            except Exception as e:
+                log.error("Could not persist refreshed tokens: %s", e)
+                with self.lock:
+                    for icn, info in batch.items():
+                        self.dirty.setdefault(icn, info)
+
+    def _refresh(self, icn, old_info):
+        try:
+            token_data = refresh_access_token(old_info["refresh_token"])
+        except Exception as e:
+            log.error("Token refresh failed for %s: %s", icn, e)
+            token_data = None
+        with self.lock:
+            self.in_flight.discard(icn)
+            if token_data is None or not token_data.get("access_token"):
+                self.failed_at[icn] = time.time()
+                log.warning("Could not refresh token for %s", icn)
+                return
+            # Skip if the token was replaced or revoked while we were refreshing
+            current = self.tokens.get(icn)
+            if not current or current.get("access_token") != old_info["access_token"]:
+                return
+            new_info = token_info_from_response(token_data, old_info["refresh_token"])
+            self.tokens[icn] = new_info
+            self.dirty[icn] = new_info
+            self.failed_at.pop(icn, None)
+        summary_cache.retoken(icn, old_info["access_token"], new_info["access_token"])
+        log.info("Refreshed token for %s", icn)
+
+# =========================
+# Patient Summary Cache
+# =========================
+
+class SummaryCache:
+    """
+    In-process LRU cache of patient summaries keyed by ICN.
+    Bounded by entry count and by the approximate JSON size of the summaries.
+    """
+
+    def __init__(self, ttl, stale_ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # icn -> (summary, access_token, stored_at, size)
+        self.total_bytes = 0
+        self.refreshing = set()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "refreshes": 0}
+
+    def get(self, icn, access_token):
+        """
+        Return (summary, state) where state is "fresh", "stale" or None (miss).
+        Entries cached under a different access token count as a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(icn)
+            if entry and entry[1] == access_token:
+                age = time.monotonic() - entry[2]
+                if age < self.ttl + self.stale_ttl:
+                    self.entries.move_to_end(icn)
+                    if age < self.ttl:
+                        self.counters["hits"] += 1
+                        return dict(entry[0]), "fresh"
+                    self.counters["stale_hits"] += 1
+                    return dict(entry[0]), "stale"
+            self.counters["misses"] += 1
+            return None, None
+
+    def put(self, icn, access_token, summary):
+        """Store a summary and evict least recently used entries over the caps."""
+        size = len(json.dumps(summary))
+        with self.lock:
+            self._remove(icn)
+            self.entries[icn] = (dict(summary), access_token, time.monotonic(), size)
+            self.total_bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+
+    def invalidate(self, icn):
+        """Drop the cached summary for an ICN (e.g. after its token changed)."""
+        with self.lock:
+            if self._remove(icn):
+                self.counters["invalidations"] += 1
+
+    def retoken(self, icn, old_token, new_token):
+        """Keep a cached summary valid when its ICN's access token is refreshed."""
+        with self.lock:
+            entry = self.entries.get(icn)
+            if entry and entry[1] == old_token:
+                self.entries[icn] = (entry[0], new_token, entry[2], entry[3])
+
+    def age(self, icn, access_token):
+        """Seconds since the entry was stored, or None if absent (does not count as a lookup)."""
+        with self.lock:
+            entry = self.entries.get(icn)
+            if entry and entry[1] == access_token:
+                return time.monotonic() - entry[2]
+            return None
+
+    def last_known(self, icn, access_token):
+        """The cached summary however old it is, or None; a fallback while the VA API is unavailable."""
+        with self.lock:
+            entry = self.entries.get(icn)
+            if entry and entry[1] == access_token:
+                return dict(entry[0])
+            return None
+
+    def peek_many(self, tokens_by_icn):
+        """
+        {icn: summary} for the cached entries (any age) matching each ICN's
+        token, under one lock and without copying or counting lookups;
+        callers must not modify the summaries.
+        """
+        with self.lock:
+            found = {}
+            for icn, access_token in tokens_by_icn.items():
+                entry = self.entries.get(icn)
+                if entry and entry[1] == access_token:
+                    found[icn] = entry[0]
+            return found
+
+    def start_refresh(self, icn):
+        """Claim the background refresh for an ICN; False if one is already running."""
+        with self.lock:
+            if icn in self.refreshing:
+                return False
+            self.refreshing.add(icn)
+            self.counters["refreshes"] += 1
+            return True
+
+    def end_refresh(self, icn):
+        with self.lock:
+            self.refreshing.discard(icn)
+
+    def stats(self):
+        """Return hit/miss counters and current size for TTL tuning."""
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+            })
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remove(self, icn):
+        entry = self.entries.pop(icn, None)
+        if entry:
+            self.total_bytes -= entry[3]
+        return entry is not None
+
+class CacheWarmer:
+    """
+    Periodically precomputes patient summaries for every assigned veteran
+    with a valid token, so opening the dashboard is a cache read instead of
+    a burst of upstream calls. Entries that will still be fresh at the next
+    pass are skipped. The summary cache is per process, so every worker
+    warms its own copy; concurrency and per-fetch jitter keep the combined
+    load under the sandbox rate limits.
+    """
+
+    def __init__(self, cache, interval, concurrency, jitter):
+        self.cache = cache
+        self.interval = interval
+        self.jitter = jitter
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cache-warmer")
+        self.lock = threading.Lock()
+        self.running = False
+        self.last_run = {}
+        self.counters = {"runs": 0, "warmed": 0, "failures": 0}
+
+    def start(self):
+        threading.Thread(target=self._run, name="cache-warmer-scheduler", daemon=True).start()
+
+    def _run(self):
+        # Workers start together; spread their first passes
+        time.sleep(random.uniform(0, self.jitter))
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                log.exception("Cache warm pass failed: %s", e)
+            time.sleep(self.interval + random.uniform(0, self.jitter))
+
+    def run_once(self):
+        """Warm every due summary and record how the pass went."""
+        if fhir_breaker.is_open():
+            log.info("Cache warm pass skipped: FHIR circuit open")
+            return
+        started = time.time()
+        with self.lock:
+            self.running = True
+        icns = {
+            v["id"]
+            for agency in assignment_store.agencies()
+            for v in assignment_store.veterans(agency["id"])
+        }
+        tokens = token_manager.get_many(icns)
+        futures = []
+        skipped = 0
+        for icn, token_info in tokens.items():
+            access_token = token_info["access_token"]
+            age = self.cache.age(icn, access_token)
+            if token_manager.is_expired(token_info) or (age is not None and age + self.interval < self.cache.ttl):
+                skipped += 1
+                continue
+            if not self.cache.start_refresh(icn):
+                skipped += 1  # a request-triggered refresh is already running
+                continue
+            futures.append(self.executor.submit(self._warm, icn, access_token))
+        warmed = failures = 0
+        for future in futures:
+            if future.result():
+                warmed += 1
+            else:
+                failures += 1
+        duration = time.time() - started
+        with self.lock:
+            self.running = False
+            self.counters["runs"] += 1
+            self.counters["warmed"] += warmed
+            self.counters["failures"] += failures
+            self.last_run = {
+                "started_at": datetime.utcfromtimestamp(started).isoformat() + "Z",
+                "duration": round(duration, 3),
+                "veterans": len(icns),
+                "warmed": warmed,
+                "skipped": skipped,
+                "no_token": len(icns) - len(tokens),
+                "failures": failures,
+            }
+        log.info("Cache warm pass: %d warmed, %d skipped, %d failed in %.1fs", warmed, skipped, failures, duration)
+
+    def _warm(self, icn, access_token):
+        """Fetch one summary into the cache; True if a complete summary was cached."""
+        try:
+            time.sleep(random.uniform(0, self.jitter))
+            summary, complete = fetch_patient_summary(icn, access_token)
+            if complete:
+                self.cache.put(icn, access_token, summary)
+            return complete
+        except Exception as e:
+            log.error("Cache warm failed for %s: %s", icn, e)
+            return False
+        finally:
+            self.cache.end_refresh(icn)
+
+    def stats(self):
+        """Return the last pass (start time, duration, counts) and cumulative counters."""
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({"running": self.running, "interval": self.interval, "last_run": dict(self.last_run)})
+        return stats
+
+summary_cache = SummaryCache(SUMMARY_CACHE_TTL, SUMMARY_CACHE_STALE_TTL, SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_MAX_BYTES)
+token_manager = TokenManager(token_store, TOKEN_REFRESH_MARGIN, TOKEN_REFRESH_INTERVAL,
+                             TOKEN_REFRESH_RETRY, TOKEN_REFRESH_WORKERS, TOKEN_REFRESH_LOCK)
+if TOKEN_REFRESH_ENABLED:
+    token_manager.start()
+cache_warmer = CacheWarmer(summary_cache, SUMMARY_WARM_INTERVAL, SUMMARY_WARM_CONCURRENCY, SUMMARY_WARM_JITTER)
+if SUMMARY_WARM_ENABLED:
+    cache_warmer.start()
+
+def get_cached_patient_summary(icn, access_token, allow_fetch=True):
+    """
+    Return a patient summary from the cache, fetching it on a miss.
+    Stale entries are returned immediately while a background refresh runs.
+    Only complete summaries (every FHIR resource succeeded) are cached.
+    With allow_fetch=False (e.g. the token is known to be expired) only
+    cached data is returned and the upstream is never called.
+    """
+    if not allow_fetch:
+        summary, _ = summary_cache.get(icn, access_token)
+        return summary if summary is not None else {"id": icn}
+    summary = lookup_cached_summary(icn, access_token)
+    if summary is not None:
+        return summary
+    if fhir_breaker.is_open():
+        return cached_fallback(icn, access_token)
+    with request_phase("upstream"):
+        summary, complete = fetch_patient_summary(icn, access_token)
+    if complete:
+        summary_cache.put(icn, access_token, summary)
+    return summary
+
+def lookup_cached_summary(icn, access_token):
+    """Return a cached summary (refreshing it in the background if stale), or None on a miss."""
+    summary, state = summary_cache.get(icn, access_token)
+    if state == "stale" and not fhir_breaker.is_open() and summary_cache.start_refresh(icn):
+        summary_executor.submit(refresh_cached_summary, icn, access_token)
+    return summary
+
+def cached_fallback(icn, access_token):
+    """While the FHIR circuit is open: the last cached summary however old, else just the ICN."""
+    summary = summary_cache.last_known(icn, access_token)
+    return summary if summary is not None else {"id": icn}
+
+def fetch_patient_summary(icn, access_token):
+    """
+    build_patient_summary shared by concurrent callers: while a fetch for
+    this ICN and token is running, other requests wait for its result
+    instead of repeating the upstream calls. Returns (summary, complete).
+    """
+    summary, complete = summary_flights.do((icn, access_token), build_patient_summary, icn, access_token)
+    return dict(summary), complete
+
+async def fetch_patient_summary_async(icn, access_token):
+    """Async counterpart of fetch_patient_summary; joins sync and async fetches alike."""
+    key = (icn, access_token)
+    future, leader = summary_flights.begin(key)
+    if not leader:
+        # Shielded: a cancelled follower must not cancel the shared fetch
+        summary, complete = await asyncio.shield(asyncio.wrap_future(future))
+        return dict(summary), complete
+    try:
+        result = await build_patient_summary_async(icn, access_token)
+    except asyncio.CancelledError:
+        # The batch timed out: followers (sync ones included) get a degraded
+        # summary, never the CancelledError, which `except Exception` misses
+        summary_flights.finish(key, future, ({"id": icn, "error": "Timed out"}, False))
+        raise
+    except BaseException as e:
+        summary_flights.finish(key, future, error=e)
+        raise
+    summary_flights.finish(key, future, result)
+    return dict(result[0]), result[1]
+
+def refresh_cached_summary(icn, access_token):
+    """Background refresh of a stale cache entry."""
+    try:
+        summary, complete = fetch_patient_summary(icn, access_token)
+        if complete:
+            summary_cache.put(icn, access_token, summary)
+    except Exception as e:
+        log.error("Background summary refresh failed for %s: %s", icn, e)
+    finally:
+        summary_cache.end_refresh(icn)
+
 # =========================
 # Static & Frontend Routes
 # =========================
 
+@app.before_request
+def start_request_timer():
+    begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record route latency and its phase breakdown; log slow requests. Runs after compression."""
+    total, phases = end_request()
+    if total is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    http_request_duration.observe(total, request.method, route, response.status_code)
+    phases["app"] = max(0.0, total - sum(phases.values()))
+    for phase, seconds in phases.items():
+        request_phase_duration.observe(seconds, route, phase)
+    if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+        breakdown = {f"{phase}_ms": round(seconds * 1000) for phase, seconds in sorted(phases.items())}
+        log.warning("Slow request %s %s %s %.0fms", request.method, request.path, response.status_code, total * 1000,
+                    extra=dict(breakdown, route=route, duration_ms=round(total * 1000)))
+    return response
+
+# Resolved against the app, not the working directory (like send_from_directory)
+asset_pipeline = AssetPipeline({name: os.path.join(app.root_path, path) for name, path in STATIC_ASSETS.items()},
+                               os.path.join(app.root_path, "frontend"))
+
+@app.after_request
+def compress_json(response):
+    """Compress large JSON API responses."""
+    return compress_response(response, JSON_COMPRESS_MIN_BYTES)
+
+def serve_page(filename):
+    """Serve an HTML page with fingerprinted asset URLs (404 if missing)."""
+    response = asset_pipeline.page_response(filename)
+    return response if response is not None else send_from_directory('frontend', filename)
+
 @app.route("/")
 def index():
     """Serve the main index.html page."""
-    return send_from_directory('frontend', 'index.html')
+    return serve_page('index.html')
+
+@app.route("/assets/<name>")
+def serve_asset(name):
+    """Serve a fingerprinted JS/CSS asset with immutable caching."""
+    response = asset_pipeline.asset_response(name)
+    if response is None:
+        return jsonify({"error": "Not found"}), 404
+    return response
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve any other frontend file (HTML, JS, etc.)."""
+    if filename.endswith(".html") and "/" not in filename:
+        return serve_page(filename)
     return send_from_directory('frontend', filename)
 
 # =========================
@@ -121,18 +1023,13 @@ def case_manager_login():
     if not agency_id or not username or not password:
         return jsonify({"error": "Missing required fields"}), 400
 
-    agencies = load_data()
-    agency = next((a for a in agencies if a["id"] == agency_id), None)
+    agency = assignment_store.agency(agency_id)
     if not agency:
         return jsonify({"error": "Invalid agency"}), 400
 
-    case_manager = next(
-        (cm for cm in agency["case_managers"]
-         if cm["username"].lower() == username.lower() and cm["password"] == password),
-        None
-    )
+    case_manager = assignment_store.case_manager_by_username(agency_id, username)
 
-    if case_manager:
+    if case_manager and case_manager["password"] == password:
         # Store user info in session
         session["user"] = {
             "id": case_manager["id"],
@@ -185,7 +1082,7 @@ def oauth_callback():
     OAuth2 callback endpoint.
     Exchanges code for tokens and stores them by ICN (patient id).
     """
-    print("Callback query parameters:", dict(request.args))
+    log.debug("OAuth callback parameters: %s", sorted(request.args))
     code = request.args.get("code")
     if not code:
         return "No code provided", 400
@@ -198,29 +1095,24 @@ def oauth_callback():
         "client_id": CLIENT_ID,
         "client_secret": CLIENT_SECRET
     }
-    resp = requests.post(TOKEN_URL, data=data)
+    resp = va_post(TOKEN_URL, data=data)
     token_data = resp.json()
     access_token = token_data.get("access_token")
-    refresh_token = token_data.get("refresh_token")
     icn = token_data.get("patient")  # Patient identifier
 
-    print(f"OAuth callback ICN: {icn}")
-    print(f"Token data: {token_data}")
+    log.info("OAuth callback ICN: %s", icn)
+    log_body(log, token_data, "Token response for %s", icn)
 
     if not icn:
         return "No patient context provided", 400
 
     # Store tokens by ICN
-    tokens = load_tokens()
-    tokens[icn] = {
-        "access_token": access_token,
-        "refresh_token": refresh_token
-    }
     try:
-        save_tokens(tokens)
-        print(f"Saved tokens for ICN: {icn}")
+        token_manager.set(icn, token_info_from_response(token_data))
+        log.info("Saved tokens for ICN: %s", icn)
     except Exception as e:
-        print(f"Error saving tokens: {e}")
+        log.error("Error saving tokens: %s", e)
+    summary_cache.invalidate(icn)
     session["icn"] = icn
     session["access_token"] = access_token
     next_url = session.pop("next", None) or "/approval_success.html"
@@ -229,7 +1121,7 @@ def oauth_callback():
 @app.route("/approval-success")
 def approval_success():
     """Serve the approval success page after OAuth."""
-    return send_from_directory('frontend', 'approval_success.html')
+    return serve_page('approval_success.html')
 
 # =========================
 # Dashboard & Patient Data
@@ -240,7 +1132,7 @@ def dashboard():
     """Serve the Case Manager Dashboard if logged in."""
     if "user" not in session:
         return redirect("/login")
-    return send_from_directory('frontend', 'SSVF_Dashboard.html')
+    return serve_page('SSVF_Dashboard.html')
 
 @app.route("/api/patient")
 def get_patient():
@@ -254,144 +1146,1050 @@ def get_patient():
     if not patient_id:
         return jsonify({"error": "Missing patient id"}), 401
 
-    tokens = load_tokens()
-    token_info = tokens.get(patient_id)
+    token_info = token_manager.get(patient_id)
+    if not token_info:
+        return jsonify({"error": "Not authorized for this patient"}), 403
+
+    # An expired token would only earn a 401 upstream: serve cached data and refresh in the background
+    expired = token_manager.is_expired(token_info)
+    if expired:
+        token_manager.request_refresh(patient_id)
+    summary = get_cached_patient_summary(patient_id, token_info["access_token"], allow_fetch=not expired)
+    return jsonify(summary)
+
+@app.route("/api/async/patient")
+async def get_patient_async():
+    """
+    Async variant of /api/patient: on a cache miss the FHIR fan-out runs on
+    the async client's event loop instead of the sync thread pool. Falls back
+    to the sync handler when the async client is unavailable.
+    """
+    if fhir_async_client is None:
+        return get_patient()
+    patient_id = request.args.get("id")
+    if not patient_id or patient_id == "session":
+        patient_id = session.get("icn")
+    if not patient_id:
+        return jsonify({"error": "Missing patient id"}), 401
+
+    token_info = token_manager.get(patient_id)
     if not token_info:
         return jsonify({"error": "Not authorized for this patient"}), 403
 
     access_token = token_info["access_token"]
-    summary = get_patient_summary(patient_id, access_token)
+    if token_manager.is_expired(token_info):
+        token_manager.request_refresh(patient_id)
+        return jsonify(get_cached_patient_summary(patient_id, access_token, allow_fetch=False))
+    summary = lookup_cached_summary(patient_id, access_token)
+    if summary is None and fhir_breaker.is_open():
+        summary = cached_fallback(patient_id, access_token)
+    elif summary is None:
+        future = fhir_async_client.submit(fetch_patient_summary_async(patient_id, access_token))
+        summary, complete = await asyncio.wrap_future(future)
+        if complete:
+            summary_cache.put(patient_id, access_token, summary)
     return jsonify(summary)
 
+@app.route("/api/patients")
+def get_patients():
+    """
+    Return summaries for several veterans (ICNs) in one request.
+    Expects ids as a comma-separated list; only the logged-in user's agency
+    veterans are returned. Each result carries a token_status field.
+    """
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    ids = [i.strip() for i in request.args.get("ids", "").split(",") if i.strip()]
+    if not ids:
+        return jsonify({"error": "Missing patient ids"}), 400
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Too many patient ids (max {MAX_BATCH_IDS})"}), 400
+
+    if not assignment_store.agency(user["agency_id"]):
+        return jsonify({"error": "Invalid agency"}), 400
+
+    results = {}
+    allowed = []
+    for icn in dict.fromkeys(ids):
+        if assignment_store.veteran_case_manager(user["agency_id"], icn):
+            allowed.append(icn)
+        else:
+            results[icn] = {"id": icn, "error": "Not authorized for this patient", "token_status": "missing"}
+    results.update(get_patient_summaries(allowed, token_manager.get_many(allowed)))
+    return jsonify(results)
+
+def get_patient_summaries(icns, tokens):
+    """
+    Fetch summaries for many ICNs with bounded concurrency.
+    Returns {icn: summary} where each summary has a token_status of
+    "active", "expired", "missing" or "unavailable" (see with_token_status);
+    a slow or failing veteran never holds up the rest. Expired tokens are
+    refreshed in the background and their veterans get cached data only.
+    """
+    results = {}
+    futures = {}
+    misses = {}  # icn -> access token, fetched on the async client
+    for icn in icns:
+        token_info = tokens.get(icn)
+        if not token_info:
+            results[icn] = {"id": icn, "token_status": "missing"}
+            continue
+        if token_manager.is_expired(token_info):
+            token_manager.request_refresh(icn)
+            summary = get_cached_patient_summary(icn, token_info["access_token"], allow_fetch=False)
+            summary["token_status"] = "expired"
+            results[icn] = summary
+            continue
+        if fhir_async_client is None:
+            futures[summary_executor.submit(paced_patient_summary, icn, token_info["access_token"])] = icn
+            continue
+        summary = lookup_cached_summary(icn, token_info["access_token"])
+        if summary is None and fhir_breaker.is_open():
+            summary = cached_fallback(icn, token_info["access_token"])
+        if summary is not None:
+            results[icn] = with_token_status(summary)
+        else:
+            misses[icn] = token_info["access_token"]
+
+    if misses:
+        with request_phase("upstream"):
+            results.update(fetch_summaries_async(misses))
+
+    with request_phase("upstream"):
+        done, not_done = wait(futures, timeout=SUMMARY_BATCH_TIMEOUT)
+    for future in done:
+        icn = futures[future]
+        try:
+            summary = future.result()
+        except Exception as e:
+            log.error("Summary fetch failed for %s: %s", icn, e)
+            summary = {"id": icn, "error": "Upstream unavailable"}
+        results[icn] = with_token_status(summary)
+    for future in not_done:
+        icn = futures[future]
+        future.cancel()
+        log.error("Summary fetch timed out for %s", icn)
+        results[icn] = {"id": icn, "error": "Timed out", "token_status": "unavailable"}
+    return results
+
+# The upstream refused the veteran's token for the Patient read
+TOKEN_REJECTED_STATUSES = ("401", "403")
+
+class TokenRejected(Exception):
+    """A Patient read was refused with 401/403: the veteran's token is no longer honored."""
+
+def note_token_rejected(summary, resource_type, status):
+    """Mark a summary whose Patient read was refused (status may be an int or a batch "403 Forbidden")."""
+    if resource_type == "Patient" and str(status)[:3] in TOKEN_REJECTED_STATUSES:
+        summary["token_status"] = "missing"
+
+def paced_patient_summary(icn, access_token):
+    """get_cached_patient_summary for a batch, holding one of the worker's summary fetch slots."""
+    with summary_sync_slots:
+        return get_cached_patient_summary(icn, access_token)
+
+def with_token_status(summary):
+    """
+    Tag a fetched summary: "active" if the Patient read returned an SSN,
+    "missing" if the upstream refused the token or returned the Patient
+    without one (consent expired or revoked), and "unavailable" if the
+    Patient read failed for any other reason (error, timeout, rate limit,
+    open circuit), which says nothing about consent.
+    """
+    if summary.get("ssn"):
+        summary["token_status"] = "active"
+    elif summary.get("token_status") == "missing" or "name" in summary:
+        summary["token_status"] = "missing"
+    else:
+        summary["token_status"] = "unavailable"
+    return summary
+
+def fetch_summaries_async(tokens_by_icn):
+    """
+    Fetch uncached summaries concurrently on the async FHIR client and cache
+    the complete ones. Veterans not finished within SUMMARY_BATCH_TIMEOUT are
+    reported as timed out instead of holding up the batch.
+    """
+    future = fhir_async_client.submit(build_patient_summaries_async(tokens_by_icn))
+    try:
+        built = future.result(timeout=SUMMARY_BATCH_TIMEOUT + 1)
+    except Exception as e:
+        log.error("Async summary batch failed: %s", e)
+        future.cancel()
+        built = {}
+    results = {}
+    for icn, access_token in tokens_by_icn.items():
+        if icn not in built:
+            log.error("Summary fetch timed out for %s", icn)
+            results[icn] = {"id": icn, "error": "Timed out", "token_status": "unavailable"}
+            continue
+        summary, complete = built[icn]
+        if complete:
+            summary_cache.put(icn, access_token, summary)
+        results[icn] = with_token_status(summary)
+    return results
+
+async def build_patient_summaries_async(tokens_by_icn):
+    """
+    Build summaries for many ICNs on the event loop; returns {icn: (summary,
+    complete)} for those that finished. Concurrent batches in the worker
+    share min(SUMMARY_ASYNC_CONCURRENCY, summary_fetch_limit) slots.
+    """
+    global summary_async_slots
+    if summary_async_slots is None:
+        summary_async_slots = asyncio.Semaphore(min(SUMMARY_ASYNC_CONCURRENCY, summary_fetch_limit))
+
+    async def build(icn, access_token):
+        async with summary_async_slots:
+            return icn, await fetch_patient_summary_async(icn, access_token)
+
+    tasks = [asyncio.ensure_future(build(icn, token)) for icn, token in tokens_by_icn.items()]
+    done, pending = await asyncio.wait(tasks, timeout=SUMMARY_BATCH_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    built = {}
+    for task in done:
+        if task.exception() is None:
+            icn, result = task.result()
+            built[icn] = result
+    return built
+
 def get_patient_summary(icn, access_token):
     """
     Build a summary of patient info, appointments, and care teams from FHIR API.
+    The independent FHIR requests run concurrently on the shared fetch pool;
+    a resource that fails or times out is left out of the summary.
+    """
+    summary, _ = fetch_patient_summary(icn, access_token)
+    return summary
+
+def build_patient_summary(icn, access_token):
+    """
+    Fetch and merge the FHIR resources for a patient summary.
+    Returns (summary, complete); complete is False if any resource failed.
     """
     headers = {"Authorization": f"Bearer {access_token}"}
     summary = {"id": icn}
 
-    # 1. Patient Info
+    now = datetime.utcnow()
+    if fhir_incremental_available():
+        result = sync_patient_summary(icn, headers, now)
+        if result is not None:
+            log_body(log, result[0], "Final summary for %s", icn)
+            return result
+
+    if fhir_batch_available():
+        result = fetch_summary_batch(icn, headers, now)
+        if result is not None:
+            summary, complete = result
+            log_body(log, summary, "Final summary for %s", icn)
+            return summary, complete
+
+    futures = [
+        fhir_executor.submit(fetch_patient_info, icn, headers),
+        fhir_executor.submit(fetch_appointments, icn, headers, "past", appointment_window("past", now)),
+        fhir_executor.submit(fetch_appointments, icn, headers, "upcoming", appointment_window("upcoming", now)),
+        fhir_executor.submit(fetch_care_teams, icn, headers),
+    ]
+    deadline = time.monotonic() + FHIR_TIMEOUT
+    complete = True
+    # Merge in submission order so the summary keys stay in a stable order
+    for future in futures:
+        try:
+            result = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            log.error("FHIR request timed out for %s", icn)
+            result = None
+        except TokenRejected as e:
+            log.error("FHIR request refused for %s: %s", icn, e)
+            summary["token_status"] = "missing"
+            result = None
+        except Exception as e:
+            log.error("FHIR request failed for %s: %s", icn, e)
+            result = None
+        if result is None:
+            complete = False
+        else:
+            summary.update(result)
+
+    log_body(log, summary, "Final summary for %s", icn)
+    return summary, complete
+
+async def build_patient_summary_async(icn, access_token):
+    """
+    Async counterpart of build_patient_summary; must run on the async FHIR
+    client's event loop. Returns (summary, complete).
+    """
+    client = fhir_async_client
+    now = datetime.utcnow()
+    if fhir_incremental_available():
+        result = await sync_patient_summary_async(icn, access_token, now)
+        if result is not None:
+            return result
+
+    if fhir_batch_available():
+        result = await fetch_summary_batch_async(icn, access_token, now)
+        if result is not None:
+            return result
+
+    past = appointment_window("past", now)
+    upcoming = appointment_window("upcoming", now)
+    # Searches follow next links and return the resources of every page
+    requests_and_parsers = [
+        ("Patient", client.patient(icn, access_token), parse_patient),
+        ("Appointment", client.appointments(icn, access_token, appointment_date_filters(past)),
+         lambda resources: parse_appointments(resources, "past", past)),
+        ("Appointment", client.appointments(icn, access_token, appointment_date_filters(upcoming)),
+         lambda resources: parse_appointments(resources, "upcoming", upcoming)),
+        ("PractitionerRole", client.practitioner_roles(icn, access_token), parse_care_teams),
+    ]
+    results = await asyncio.gather(
+        *(asyncio.wait_for(coro, FHIR_TIMEOUT) for _, coro, _ in requests_and_parsers),
+        return_exceptions=True)
+
+    summary = {"id": icn}
+    complete = True
+    for (resource, _, parse), result in zip(requests_and_parsers, results):
+        if isinstance(result, asyncio.TimeoutError):
+            log.error("FHIR %s request timed out for %s", resource, icn)
+            complete = False
+        elif isinstance(result, Exception):
+            log.error("FHIR %s request failed for %s: %r", resource, icn, result)
+            complete = False
+        else:
+            status, body, text = result
+            log.debug("%s for %s: status %s", resource, icn, status)
+            if status == 200 and body is not None:
+                summary.update(parse(body))
+            else:
+                log.error("Failed to fetch %s resource: %.200s", resource, text)
+                note_token_rejected(summary, resource, status)
+                complete = False
+    return summary, complete
+
+def fetch_patient_info(icn, headers):
+    """Fetch the Patient resource and return its demographic summary fields (None on failure)."""
     url = f"{FHIR_API_BASE}/Patient/{icn}"
-    print(f"[INFO] Requesting: {url}")
-    resp = requests.get(url, headers=headers)
-    print(f"[INFO] Status: {resp.status_code}")
+    log.debug("Requesting: %s", url)
+    resp = va_get(url, headers=headers)
+    log.debug("Status: %s", resp.status_code)
+    if str(resp.status_code) in TOKEN_REJECTED_STATUSES:
+        raise TokenRejected(f"Patient read returned {resp.status_code}")
+    if resp.status_code != 200:
+        log.error("Failed to fetch Patient resource: %.200s", resp.text)
+        return None
+    try:
+        patient = resp.json()
+    except ValueError as e:
+        log.error("Could not parse JSON: %s", e)
+        return None
+    log_body(log, patient, "Patient %s", icn)
+    return parse_patient(patient)
+
+def fetch_appointments(icn, headers, appt_type, window):
+    """Fetch past or upcoming Appointments in a (start, end) window under the matching summary key (None on failure)."""
+    url = f"{FHIR_API_BASE}/Appointment"
+    params = {"patient": icn, "date": appointment_date_filters(window)}
+    try:
+        return parse_appointments(iter_bundle_resources(url, headers, params), appt_type, window)
+    except FHIRSearchError as e:
+        if e.status_code == 403:
+            log.error("Access denied for Appointment resource: %.200s", e.text)
+        else:
+            log.error("Failed to fetch Appointment resource: %s", e)
+        return None
+
+def fetch_care_teams(icn, headers):
+    """Fetch PractitionerRole resources and return the patient's care teams (None on failure)."""
+    url = f"{FHIR_API_BASE}/PractitionerRole"
     try:
-        print(f"[INFO] Response: {resp.json()}")
+        return parse_care_teams(iter_bundle_resources(url, headers, {"patient": icn}))
+    except FHIRSearchError as e:
+        log.error("Failed to fetch PractitionerRole resource: %s", e)
+        return None
+
+# =========================
+# FHIR Search Paging
+# =========================
+
+class FHIRSearchError(Exception):
+    """A page of a FHIR search could not be fetched or parsed."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"HTTP {status_code}: {text[:200]}")
+        self.status_code = status_code
+        self.text = text
+
+def iter_bundle_resources(url, headers, params=None, max_pages=None):
+    """
+    Yield the resources of a FHIR search one page at a time, following
+    link[rel=next] with _count=FHIR_PAGE_SIZE. Each response is parsed once
+    and dropped before the next page is fetched, and at most max_pages
+    (default FHIR_MAX_PAGES) pages are read. Raises FHIRSearchError if a
+    page fails. With params=None, url is taken as a complete next link.
+    """
+    max_pages = max_pages or FHIR_MAX_PAGES
+    if params is not None:
+        params = dict(params, _count=FHIR_PAGE_SIZE)
+    pages = 0
+    while url:
+        log.debug("Requesting: %s", url)
+        resp = va_get(url, headers=headers, params=params)
+        log.debug("Status: %s", resp.status_code)
+        if resp.status_code != 200:
+            raise FHIRSearchError(resp.status_code, resp.text)
+        try:
+            bundle = resp.json()
+        except ValueError as e:
+            raise FHIRSearchError(resp.status_code, f"Could not parse JSON: {e}")
+        pages += 1
+        entries = bundle.get("entry", [])
+        log.debug("Page %d: %d entries", pages, len(entries))
+        log_body(log, bundle, "Page %d of %s", pages, url)
+        for entry in entries:
+            if "resource" in entry:
+                yield entry["resource"]
+        url = bundle_next_link(bundle)
+        params = None  # the next link already carries the query
+        if url and pages >= max_pages:
+            log.warning("Stopped after %d pages; results truncated", pages)
+            break
+
+def bundle_next_link(bundle):
+    """Return the Bundle's link[rel=next] URL, or None on the last page."""
+    for link in bundle.get("link", []):
+        if link.get("relation") == "next":
+            return link.get("url")
+    return None
+
+def appointment_window(appt_type, now):
+    """(start, end) datetimes bounding past or upcoming appointments."""
+    if appt_type == "past":
+        return now - timedelta(days=APPOINTMENT_LOOKBACK_DAYS), now
+    return now, now + timedelta(days=APPOINTMENT_LOOKAHEAD_DAYS)
+
+def appointment_date_filters(window):
+    """FHIR date search values for a (start, end) window."""
+    start, end = window
+    return [f"ge{start.strftime('%Y-%m-%dT%H:%M:%SZ')}", f"lt{end.strftime('%Y-%m-%dT%H:%M:%SZ')}"]
+
+# =========================
+# FHIR Batch Requests
+# =========================
+
+def fhir_batch_available():
+    """True if batch mode is on and the upstream has not recently rejected a batch."""
+    if not FHIR_BATCH_ENABLED:
+        return False
+    return fhir_batch_rejected_at is None or time.time() - fhir_batch_rejected_at > FHIR_BATCH_RETRY
+
+def batch_reads(icn, now):
+    """The FHIR reads behind a summary as (resource type, relative URL, parser) batch entries."""
+    past = appointment_window("past", now)
+    upcoming = appointment_window("upcoming", now)
+
+    def search(resource_type, params):
+        return f"{resource_type}?" + urlencode(dict(params, _count=FHIR_PAGE_SIZE), doseq=True)
+
+    return [
+        ("Patient", f"Patient/{icn}", parse_patient),
+        ("Appointment", search("Appointment", {"patient": icn, "date": appointment_date_filters(past)}),
+         lambda resources: parse_appointments(resources, "past", past)),
+        ("Appointment", search("Appointment", {"patient": icn, "date": appointment_date_filters(upcoming)}),
+         lambda resources: parse_appointments(resources, "upcoming", upcoming)),
+        ("PractitionerRole", search("PractitionerRole", {"patient": icn}), parse_care_teams),
+    ]
+
+def batch_bundle(reads):
+    return {
+        "resourceType": "Bundle",
+        "type": "batch",
+        "entry": [{"request": {"method": "GET", "url": url}} for _, url, _ in reads],
+    }
+
+def batch_response_entries(status_code, body, reads, text):
+    """
+    Return the entries of a batch-response, or None if the batch was not
+    processed. Rejections (unsupported method or Bundle type, malformed
+    response) switch batch mode off for FHIR_BATCH_RETRY seconds.
+    """
+    global fhir_batch_rejected_at
+    if (status_code == 200 and isinstance(body, dict) and body.get("type") == "batch-response"
+            and len(body.get("entry", [])) == len(reads)):
+        return body["entry"]
+    if status_code == 200 or status_code in FHIR_BATCH_REJECT_STATUSES:
+        fhir_batch_rejected_at = time.time()
+        log.warning("FHIR batch rejected (%s); using individual requests for %.0fs", status_code, FHIR_BATCH_RETRY)
+    else:
+        log.error("FHIR batch failed (%s): %.200s", status_code, text)
+    return None
+
+def batch_entry_resource(resource_type, icn, entry):
+    """The resource of a successful batch-response entry, or None (logged) on failure."""
+    status = str(entry.get("response", {}).get("status", ""))
+    resource = entry.get("resource")
+    if status.startswith("2") and resource is not None:
+        return resource
+    log.error("Failed to fetch %s resource for %s in batch: %s %s", resource_type, icn, status,
+              entry.get("response", {}).get("outcome", ""))
+    return None
+
+def fetch_summary_batch(icn, headers, now):
+    """
+    Fetch a summary with one batch Bundle POST. Search results with more
+    pages continue with individual GETs on their next links. Returns
+    (summary, complete), or None if the batch was not processed and the
+    caller should fall back to individual GETs.
+    """
+    reads = batch_reads(icn, now)
+    try:
+        resp = va_post(FHIR_API_BASE, headers=dict(headers, **{"Content-Type": "application/fhir+json"}),
+                       json=batch_bundle(reads))
+        body = resp.json() if resp.status_code == 200 else None
+    except (requests.RequestException, ValueError) as e:
+        log.error("FHIR batch request failed for %s: %s", icn, e)
+        return None
+    log.debug("Batch for %s: status %s", icn, resp.status_code)
+    entries = batch_response_entries(resp.status_code, body, reads, resp.text)
+    if entries is None:
+        return None
+
+    summary = {"id": icn}
+    complete = True
+    for (resource_type, _, parse), entry in zip(reads, entries):
+        resource = batch_entry_resource(resource_type, icn, entry)
+        if resource is None:
+            note_token_rejected(summary, resource_type, entry.get("response", {}).get("status", ""))
+            complete = False
+            continue
+        if resource.get("resourceType") != "Bundle":
+            summary.update(parse(resource))
+            continue
+        resources = (e["resource"] for e in resource.get("entry", []) if "resource" in e)
+        next_url = bundle_next_link(resource)
+        if next_url and FHIR_MAX_PAGES > 1:
+            resources = itertools.chain(resources, iter_bundle_resources(next_url, headers, max_pages=FHIR_MAX_PAGES - 1))
+        try:
+            summary.update(parse(resources))
+        except FHIRSearchError as e:
+            log.error("Failed to fetch %s resource: %s", resource_type, e)
+            complete = False
+    return summary, complete
+
+async def fetch_summary_batch_async(icn, access_token, now):
+    """Async counterpart of fetch_summary_batch; None means fall back to individual GETs."""
+    client = fhir_async_client
+    reads = batch_reads(icn, now)
+    try:
+        status, body, text = await asyncio.wait_for(client.batch(batch_bundle(reads), access_token), FHIR_TIMEOUT)
     except Exception as e:
-        print(f"[ERROR] Could not parse JSON: {e}")
+        log.error("FHIR batch request failed for %s: %r", icn, e)
+        return None
+    log.debug("Batch for %s: status %s", icn, status)
+    entries = batch_response_entries(status, body, reads, text)
+    if entries is None:
+        return None
 
-    if resp.status_code == 200:
-        patient = resp.json()
-        # Name
-        if "name" in patient and len(patient["name"]) > 0:
-            n = patient["name"][0]
-            summary["name"] = f"{n.get('given', [''])[0]} {n.get('family', '')}".strip()
-        # Age and DOB
-        if "birthDate" in patient:
+    summary = {"id": icn}
+    complete = True
+    for (resource_type, _, parse), entry in zip(reads, entries):
+        resource = batch_entry_resource(resource_type, icn, entry)
+        if resource is None:
+            note_token_rejected(summary, resource_type, entry.get("response", {}).get("status", ""))
+            complete = False
+            continue
+        if resource.get("resourceType") != "Bundle":
+            summary.update(parse(resource))
+            continue
+        resources = [e["resource"] for e in resource.get("entry", []) if "resource" in e]
+        next_url = bundle_next_link(resource)
+        if next_url and FHIR_MAX_PAGES > 1:
             try:
-                birth = datetime.strptime(patient["birthDate"], "%Y-%m-%d")
-                summary["age"] = int((datetime.now() - birth).days / 365.25)
-            except Exception:
-                pass
-            summary["dob"] = patient["birthDate"]
-        # Contact info
-        phones = [tele["value"] for tele in patient.get("telecom", []) if tele.get("system") == "phone"]
-        emails = [tele["value"] for tele in patient.get("telecom", []) if tele.get("system") == "email"]
-        address = ""
-        if "address" in patient and len(patient["address"]) > 0:
-            addr = patient["address"][0]
-            address = ", ".join(addr.get("line", [])) + f", {addr.get('city','')}, {addr.get('state','')}, {addr.get('postalCode','')}"
-        if phones:
-            summary["phones"] = phones
-        if emails:
-            summary["emails"] = emails
-        if address:
-            summary["address"] = address
-        # SSN
-        ssn = None
-        for identifier in patient.get("identifier", []):
-            type_field = identifier.get("type", {})
-            codings = type_field.get("coding", [])
-            for coding in codings:
-                if (
-                    coding.get("system") == "http://terminology.hl7.org/CodeSystem/v2-0203"
-                    and coding.get("code") == "SS"
-                ):
-                    ssn = identifier.get("value")
-                    break
-            if ssn:
-                break
-        if ssn:
-            summary["ssn"] = ssn
-    else:
-        print(f"[ERROR] Failed to fetch Patient resource: {resp.text}")
-
-    # 2. Appointments (Past and Upcoming)
-    now = datetime.utcnow().isoformat() + "Z"
-    for appt_type, date_filter in [("past", f"lt{now}"), ("upcoming", f"ge{now}")]:
-        url = f"{FHIR_API_BASE}/Appointment?patient={icn}&date={date_filter}"
-        print(f"[INFO] Requesting: {url}")
-        resp = requests.get(url, headers=headers)
-        print(f"[INFO] Status: {resp.status_code}")
+                more_status, more, more_text = await asyncio.wait_for(
+                    client.search(next_url, access_token, None, max_pages=FHIR_MAX_PAGES - 1), FHIR_TIMEOUT)
+            except Exception as e:
+                more_status, more, more_text = None, None, repr(e)
+            if more is None:
+                log.error("Failed to fetch %s resource: %s %.200s", resource_type, more_status, more_text)
+                complete = False
+                continue
+            resources.extend(more)
+        summary.update(parse(resources))
+    return summary, complete
+
+# =========================
+# Incremental FHIR Sync
+# =========================
+
+# A snapshot is {"format", "window", "full_sync_at", "synced_at", "patient",
+# "appointments", "care_teams"}: the parsed Patient fields, and the parsed
+# appointments / care team entries keyed by resource id, each stored with the
+# resource's versionId and lastUpdated. Patient fields in
+# SNAPSHOT_PRIVATE_FIELDS stay out of the snapshot, in patient_identifiers.
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_PRIVATE_FIELDS = ("ssn",)
+SYNC_PARTS = ("patient", "appointments", "care_teams")
+NOT_MODIFIED = object()  # a conditional read found nothing new
+SYNC_REJECTED = object()  # the upstream refused a _lastUpdated search
+TOKEN_REFUSED = object()  # the Patient read was refused with 401/403
+
+fhir_sync_counters = {"full": 0, "incremental": 0, "patient_not_modified": 0, "resources_merged": 0}
+patient_identifiers = {}  # icn -> (Patient versionId, private fields), this worker only
+
+def fhir_incremental_available():
+    """True if incremental sync is on and the upstream has not recently rejected _lastUpdated."""
+    if not FHIR_INCREMENTAL_ENABLED or snapshot_store is None:
+        return False
+    return fhir_incremental_rejected_at is None or time.time() - fhir_incremental_rejected_at > FHIR_INCREMENTAL_RETRY
+
+def current_snapshot(icn):
+    """The stored snapshot to sync from, or None when a full fetch is due."""
+    try:
+        snapshot = snapshot_store.get(icn)
+    except (OSError, ValueError) as e:
+        log.error("Could not read FHIR snapshot for %s: %s", icn, e)
+        return None
+    if (not snapshot or snapshot.get("format") != SNAPSHOT_FORMAT
+            or snapshot.get("window") != [APPOINTMENT_LOOKBACK_DAYS, APPOINTMENT_LOOKAHEAD_DAYS]
+            or time.time() - snapshot.get("full_sync_at", 0) >= FHIR_FULL_SYNC_INTERVAL):
+        return None
+    return snapshot
+
+def fhir_instant(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def sync_reads(icn, snapshot, now):
+    """
+    The reads for one sync as (part, path, params, headers). Without a
+    snapshot: the Patient, appointments over both windows in one search, and
+    care teams. With one: a conditional Patient read and searches for what
+    changed since the last sync.
+    """
+    if snapshot is None:
+        window = (appointment_window("past", now)[0], appointment_window("upcoming", now)[1])
+        return [
+            ("patient", f"/Patient/{icn}", None, {}),
+            ("appointments", "/Appointment", {"patient": icn, "date": appointment_date_filters(window)}, {}),
+            ("care_teams", "/PractitionerRole", {"patient": icn}, {}),
+        ]
+    since = f"gt{fhir_instant(snapshot['synced_at'] - FHIR_SYNC_OVERLAP)}"
+    version_id = snapshot["patient"].get("version_id")
+    # A 304 is only usable if this worker still holds that version's private fields
+    conditional = version_id and patient_identifiers.get(icn, (None,))[0] == version_id
+    return [
+        ("patient", f"/Patient/{icn}", None, {"If-None-Match": f'W/"{version_id}"'} if conditional else {}),
+        ("appointments", "/Appointment", {"patient": icn, "_lastUpdated": since}, {}),
+        ("care_teams", "/PractitionerRole", {"patient": icn, "_lastUpdated": since}, {}),
+    ]
+
+def query_pairs(params):
+    """requests-style params ({key: value or [values]}) as the (key, value) pairs the async client takes."""
+    return [(k, v) for k, values in params.items() for v in (values if isinstance(values, list) else [values])]
+
+def sync_patient_summary(icn, headers, now):
+    """
+    Bring the veteran's snapshot up to date with the sync client and build
+    the summary from it. Returns (summary, complete), or None if the
+    upstream rejected incremental searches (the caller fetches everything).
+    """
+    snapshot = current_snapshot(icn)
+    started = time.time()
+    reads = sync_reads(icn, snapshot, now)
+    if fhir_batch_available():
+        results = fetch_sync_batch(icn, headers, reads, snapshot is not None)
+        if results is not None:
+            return save_synced_snapshot(icn, finish_sync(icn, snapshot, reads, results, started, now))
+    futures = [fhir_executor.submit(fetch_sync_read, icn, headers, read, snapshot is not None) for read in reads]
+    deadline = time.monotonic() + FHIR_TIMEOUT
+    results = []
+    for (part, _, _, _), future in zip(reads, futures):
         try:
-            print(f"[INFO] Response: {resp.json()}")
+            results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+        except FutureTimeoutError:
+            log.error("FHIR %s sync timed out for %s", part, icn)
+            results.append(None)
+        except TokenRejected as e:
+            log.error("FHIR %s sync refused for %s: %s", part, icn, e)
+            results.append(TOKEN_REFUSED)
         except Exception as e:
-            print(f"[ERROR] Could not parse JSON: {e}")
+            log.error("FHIR %s sync failed for %s: %s", part, icn, e)
+            results.append(None)
+    return save_synced_snapshot(icn, finish_sync(icn, snapshot, reads, results, started, now))
 
-        if resp.status_code == 200:
-            bundle = resp.json()
-            appts = []
-            for entry in bundle.get("entry", []):
-                appt = entry["resource"]
-                appt_date = appt.get("start")
-                if appt_date:
-                    appt_info = {
-                        "date": appt_date,
-                        "description": appt.get("description", ""),
-                        "status": appt.get("status", ""),
-                        "service_type": ", ".join([st.get("text", "") for st in appt.get("serviceType", [])]) if "serviceType" in appt else "",
-                        "reason": ", ".join([rc.get("text", "") for rc in appt.get("reasonCode", [])]) if "reasonCode" in appt else ""
-                    }
-                    appts.append(appt_info)
-            if appt_type == "past":
-                summary["past_appointments"] = appts
-            else:
-                summary["upcoming_appointments"] = appts
-        elif resp.status_code == 403:
-            print(f"[ERROR] Access denied for Appointment resource: {resp.text}")
+def fetch_sync_read(icn, headers, read, incremental):
+    """
+    One sync read: the Patient resource or a list of resources, NOT_MODIFIED,
+    SYNC_REJECTED, or None on failure. Raises TokenRejected if the Patient
+    read is refused.
+    """
+    part, path, params, extra_headers = read
+    url = FHIR_API_BASE + path
+    if params is None:
+        resp = va_get(url, headers=dict(headers, **extra_headers))
+        if resp.status_code == 304:
+            return NOT_MODIFIED
+        if str(resp.status_code) in TOKEN_REJECTED_STATUSES:
+            raise TokenRejected(f"Patient read returned {resp.status_code}")
+        if resp.status_code != 200:
+            log.error("Failed to fetch Patient resource: %.200s", resp.text)
+            return None
+        try:
+            return resp.json()
+        except ValueError as e:
+            log.error("Could not parse JSON: %s", e)
+            return None
+    try:
+        return list(iter_bundle_resources(url, headers, params))
+    except FHIRSearchError as e:
+        if incremental and e.status_code == 400:
+            return SYNC_REJECTED
+        log.error("Failed to sync %s for %s: %s", part, icn, e)
+        return None
+
+async def sync_patient_summary_async(icn, access_token, now):
+    """
+    Async counterpart of sync_patient_summary; must run on the async FHIR
+    client's event loop. Snapshot reads and writes run on snapshot_executor.
+    """
+    client = fhir_async_client
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(snapshot_executor, current_snapshot, icn)
+    started = time.time()
+    reads = sync_reads(icn, snapshot, now)
+    if fhir_batch_available():
+        results = await fetch_sync_batch_async(icn, access_token, reads, snapshot is not None)
+        if results is not None:
+            return await loop.run_in_executor(snapshot_executor, save_synced_snapshot, icn,
+                                              finish_sync(icn, snapshot, reads, results, started, now))
+
+    async def fetch(part, path, params, extra_headers):
+        if params is None:
+            status, body, text = await client.get(path, access_token, headers=extra_headers)
+            if status == 304:
+                return NOT_MODIFIED
         else:
-            print(f"[ERROR] Failed to fetch Appointment resource: {resp.text}")
-
-    # 3. PractitionerRole (Care Teams)
-    url = f"{FHIR_API_BASE}/PractitionerRole?patient={icn}"
-    print(f"[INFO] Requesting: {url}")
-    resp = requests.get(url, headers=headers)
-    print(f"[INFO] Status: {resp.status_code}")
+            status, body, text = await client.search(path, access_token, query_pairs(params))
+        if status == 200 and body is not None:
+            return body
+        if snapshot is not None and params is not None and status == 400:
+            return SYNC_REJECTED
+        log.error("Failed to sync %s for %s: %s %.200s", part, icn, status, text)
+        return TOKEN_REFUSED if params is None and str(status) in TOKEN_REJECTED_STATUSES else None
+
+    results = await asyncio.gather(
+        *(asyncio.wait_for(fetch(*read), FHIR_TIMEOUT) for read in reads), return_exceptions=True)
+    for i, ((part, _, _, _), result) in enumerate(zip(reads, results)):
+        if isinstance(result, Exception):
+            log.error("FHIR %s sync failed for %s: %r", part, icn, result)
+            results[i] = None
+    return await loop.run_in_executor(snapshot_executor, save_synced_snapshot, icn,
+                                      finish_sync(icn, snapshot, reads, results, started, now))
+
+def sync_batch_bundle(reads):
+    """The sync reads as a batch Bundle; If-None-Match becomes the entry's request.ifNoneMatch."""
+    entries = []
+    for _, path, params, extra_headers in reads:
+        url = path.lstrip("/")
+        if params is not None:
+            url += "?" + urlencode(dict(params, _count=FHIR_PAGE_SIZE), doseq=True)
+        entry_request = {"method": "GET", "url": url}
+        if "If-None-Match" in extra_headers:
+            entry_request["ifNoneMatch"] = extra_headers["If-None-Match"]
+        entries.append({"request": entry_request})
+    return {"resourceType": "Bundle", "type": "batch", "entry": entries}
+
+def sync_batch_entry(icn, read, entry, incremental):
+    """
+    One batch-response entry of a sync, read as fetch_sync_read would:
+    NOT_MODIFIED, SYNC_REJECTED, TOKEN_REFUSED, None on failure, the Patient
+    resource, or for a search (first page's resources, next link or None).
+    """
+    part, _, params, _ = read
+    response = entry.get("response", {})
+    status = str(response.get("status", ""))[:3]
+    resource = entry.get("resource")
+    if status == "304":
+        return NOT_MODIFIED
+    if status.startswith("2") and resource is not None:
+        if params is None:
+            return resource
+        return [e["resource"] for e in resource.get("entry", []) if "resource" in e], bundle_next_link(resource)
+    if incremental and params is not None and status == "400":
+        return SYNC_REJECTED
+    log.error("Failed to sync %s for %s in batch: %s %s", part, icn, response.get("status"), response.get("outcome", ""))
+    return TOKEN_REFUSED if params is None and status in TOKEN_REJECTED_STATUSES else None
+
+def fetch_sync_batch(icn, headers, reads, incremental):
+    """
+    Run the sync reads as one batch Bundle POST; searches with more pages
+    continue with individual GETs. Returns the results in fetch_sync_read's
+    terms, or None if the batch was not processed.
+    """
+    try:
+        resp = va_post(FHIR_API_BASE, headers=dict(headers, **{"Content-Type": "application/fhir+json"}),
+                       json=sync_batch_bundle(reads))
+        body = resp.json() if resp.status_code == 200 else None
+    except (requests.RequestException, ValueError) as e:
+        log.error("FHIR sync batch failed for %s: %s", icn, e)
+        return None
+    entries = batch_response_entries(resp.status_code, body, reads, resp.text)
+    if entries is None:
+        return None
+    results = []
+    for read, entry in zip(reads, entries):
+        result = sync_batch_entry(icn, read, entry, incremental)
+        if isinstance(result, tuple):
+            resources, next_url = result
+            if next_url and FHIR_MAX_PAGES > 1:
+                try:
+                    resources.extend(iter_bundle_resources(next_url, headers, max_pages=FHIR_MAX_PAGES - 1))
+                except FHIRSearchError as e:
+                    log.error("Failed to sync %s for %s: %s", read[0], icn, e)
+                    resources = None
+            result = resources
+        results.append(result)
+    return results
+
+async def fetch_sync_batch_async(icn, access_token, reads, incremental):
+    """Async counterpart of fetch_sync_batch; None means fall back to individual reads."""
+    client = fhir_async_client
     try:
-        print(f"[INFO] Response: {resp.json()}")
+        status, body, text = await asyncio.wait_for(client.batch(sync_batch_bundle(reads), access_token), FHIR_TIMEOUT)
     except Exception as e:
-        print(f"[ERROR] Could not parse JSON: {e}")
-
-    if resp.status_code == 200:
-        bundle = resp.json()
-        care_teams = []
-        for entry in bundle.get("entry", []):
-            role = entry["resource"]
-            team_info = {
-                "practitioner": role.get("practitioner", {}).get("display", ""),
-                "organization": role.get("organization", {}).get("display", ""),
-                "role": [code.get("text", "") for code in role.get("code", [])],
-                "locations": [loc.get("display", "") for loc in role.get("location", [])],
-            }
-            care_teams.append(team_info)
-        if care_teams:
-            summary["care_teams"] = care_teams
+        log.error("FHIR sync batch failed for %s: %r", icn, e)
+        return None
+    entries = batch_response_entries(status, body, reads, text)
+    if entries is None:
+        return None
+    results = []
+    for read, entry in zip(reads, entries):
+        result = sync_batch_entry(icn, read, entry, incremental)
+        if isinstance(result, tuple):
+            resources, next_url = result
+            if next_url and FHIR_MAX_PAGES > 1:
+                try:
+                    more_status, more, more_text = await asyncio.wait_for(
+                        client.search(next_url, access_token, None, max_pages=FHIR_MAX_PAGES - 1), FHIR_TIMEOUT)
+                except Exception as e:
+                    more_status, more, more_text = None, None, repr(e)
+                if more is None:
+                    log.error("Failed to sync %s for %s: %s %.200s", read[0], icn, more_status, more_text)
+                    resources = None
+                else:
+                    resources.extend(more)
+            result = resources
+        results.append(result)
+    return results
+
+def finish_sync(icn, snapshot, reads, results, started, now):
+    """
+    Merge the sync results into a copy of the snapshot and build the
+    summary. Returns (summary, complete, snapshot to save or None), or None
+    if the upstream rejected incremental searches. Parts whose read failed
+    are left out of the summary (as with a full fetch), so a revoked token
+    never gets snapshot data back; the snapshot is saved only when every
+    read succeeded.
+    """
+    global fhir_incremental_rejected_at
+    if any(result is SYNC_REJECTED for result in results):
+        fhir_incremental_rejected_at = time.time()
+        log.warning("FHIR _lastUpdated searches rejected; using full fetches for %.0fs", FHIR_INCREMENTAL_RETRY)
+        return None
+    if snapshot is None:
+        fhir_sync_counters["full"] += 1
+        snapshot = {"format": SNAPSHOT_FORMAT, "window": [APPOINTMENT_LOOKBACK_DAYS, APPOINTMENT_LOOKAHEAD_DAYS],
+                    "full_sync_at": started, "synced_at": started, "patient": {}, "appointments": {}, "care_teams": {}}
     else:
-        print(f"[ERROR] Failed to fetch PractitionerRole resource: {resp.text}")
+        fhir_sync_counters["incremental"] += 1
+        snapshot = dict(snapshot, appointments=dict(snapshot["appointments"]), care_teams=dict(snapshot["care_teams"]))
+
+    synced = set()
+    for (part, _, _, _), result in zip(reads, results):
+        if result is None or result is TOKEN_REFUSED:
+            continue
+        synced.add(part)
+        if result is NOT_MODIFIED:
+            fhir_sync_counters["patient_not_modified"] += 1
+        elif part == "patient":
+            meta = result.get("meta", {})
+            fields = parse_patient(result)
+            private = {field: fields.pop(field) for field in SNAPSHOT_PRIVATE_FIELDS if field in fields}
+            patient_identifiers[icn] = (meta.get("versionId"), private)
+            snapshot["patient"] = {"version_id": meta.get("versionId"), "last_updated": meta.get("lastUpdated"),
+                                   "fields": fields}
+        else:
+            merge_snapshot_resources(snapshot[part], part, result)
+
+    complete = len(synced) == len(SYNC_PARTS)
+    if complete:
+        snapshot["synced_at"] = started
+        prune_snapshot(snapshot, now)
+    summary = summary_from_snapshot(icn, snapshot, synced, now)
+    if TOKEN_REFUSED in results:
+        summary["token_status"] = "missing"
+    return summary, complete, snapshot if complete else None
+
+def save_synced_snapshot(icn, result):
+    """Save the snapshot from a finish_sync result; returns its (summary, complete), or None."""
+    if result is None:
+        return None
+    summary, complete, snapshot = result
+    if snapshot is not None:
+        try:
+            snapshot_store.set(icn, snapshot)
+        except Exception as e:
+            log.error("Could not save FHIR snapshot for %s: %s", icn, e)
+    return summary, complete
+
+def merge_snapshot_resources(entries, part, resources):
+    """Upsert parsed Appointment or PractitionerRole resources by id, skipping versions already stored."""
+    for resource in resources:
+        key = resource.get("id") or hashlib.sha1(json.dumps(resource, sort_keys=True).encode()).hexdigest()
+        meta = resource.get("meta", {})
+        stored = entries.get(key)
+        if stored and meta.get("versionId") and stored.get("version_id") == meta.get("versionId"):
+            continue
+        if part == "appointments":
+            parsed = parse_appointments([resource], "snapshot")["snapshot_appointments"]
+        else:
+            parsed = parse_care_teams([resource]).get("care_teams", [])
+        fhir_sync_counters["resources_merged"] += 1
+        if parsed:
+            entries[key] = {"version_id": meta.get("versionId"), "last_updated": meta.get("lastUpdated"),
+                            "data": parsed[0]}
+        else:
+            entries.pop(key, None)
+
+def prune_snapshot(snapshot, now):
+    """Drop appointments that have aged out of the lookback window."""
+    start = appointment_window("past", now)[0]
+    snapshot["appointments"] = {
+        key: entry for key, entry in snapshot["appointments"].items()
+        if (parse_fhir_datetime(entry["data"]["date"]) or start) >= start}
 
-    print(f"[SUMMARY] Final summary for {icn}: {json.dumps(summary, indent=2)}")
+def summary_from_snapshot(icn, snapshot, parts, now):
+    """Build a summary (same shape as a full fetch) from the synced parts of a snapshot."""
+    summary = {"id": icn}
+    if "patient" in parts:
+        summary.update(snapshot["patient"].get("fields", {}))
+        version_id, private = patient_identifiers.get(icn, (None, {}))
+        if version_id == snapshot["patient"].get("version_id"):
+            summary.update(private)
+    if "appointments" in parts:
+        appointments = sorted((entry["data"] for entry in snapshot["appointments"].values()),
+                              key=lambda a: parse_fhir_datetime(a["date"]) or datetime.max)
+        for appt_type in ("past", "upcoming"):
+            window = appointment_window(appt_type, now)
+            summary[f"{appt_type}_appointments"] = [a for a in appointments if in_window(a["date"], window)]
+    if "care_teams" in parts and snapshot["care_teams"]:
+        summary["care_teams"] = [entry["data"] for entry in snapshot["care_teams"].values()]
     return summary
 
+# =========================
+# FHIR Resource Parsing
+# =========================
+
+def parse_patient(patient):
+    """Extract name, age/DOB, contact info and SSN from a Patient resource."""
+    result = {}
+    # Name
+    if "name" in patient and len(patient["name"]) > 0:
+        n = patient["name"][0]
+        result["name"] = f"{n.get('given', [''])[0]} {n.get('family', '')}".strip()
+    # Age and DOB
+    if "birthDate" in patient:
+        try:
+            birth = datetime.strptime(patient["birthDate"], "%Y-%m-%d")
+            result["age"] = int((datetime.now() - birth).days / 365.25)
+        except Exception:
+            pass
+        result["dob"] = patient["birthDate"]
+    # Contact info
+    phones = [tele["value"] for tele in patient.get("telecom", []) if tele.get("system") == "phone"]
+    emails = [tele["value"] for tele in patient.get("telecom", []) if tele.get("system") == "email"]
+    address = ""
+    if "address" in patient and len(patient["address"]) > 0:
+        addr = patient["address"][0]
+        address = ", ".join(addr.get("line", [])) + f", {addr.get('city','')}, {addr.get('state','')}, {addr.get('postalCode','')}"
+    if phones:
+        result["phones"] = phones
+    if emails:
+        result["emails"] = emails
+    if address:
+        result["address"] = address
+    # SSN
+    ssn = None
+    for identifier in patient.get("identifier", []):
+        type_field = identifier.get("type", {})
+        codings = type_field.get("coding", [])
+        for coding in codings:
+            if (
+                coding.get("system") == "http://terminology.hl7.org/CodeSystem/v2-0203"
+                and coding.get("code") == "SS"
+            ):
+                ssn = identifier.get("value")
+                break
+        if ssn:
+            break
+    if ssn:
+        result["ssn"] = ssn
+    return result
+
+def parse_appointments(resources, appt_type, window=None):
+    """
+    Summarize Appointment resources under past_appointments or
+    upcoming_appointments, dropping any outside the (start, end) window
+    (in case the upstream ignores part of the date filter).
+    """
+    appts = []
+    for appt in resources:
+        appt_date = appt.get("start")
+        if appt_date and (window is None or in_window(appt_date, window)):
+            appt_info = {
+                "date": appt_date,
+                "description": appt.get("description", ""),
+                "status": appt.get("status", ""),
+                "service_type": ", ".join([st.get("text", "") for st in appt.get("serviceType", [])]) if "serviceType" in appt else "",
+                "reason": ", ".join([rc.get("text", "") for rc in appt.get("reasonCode", [])]) if "reasonCode" in appt else ""
+            }
+            appts.append(appt_info)
+    return {f"{appt_type}_appointments": appts}
+
+def parse_care_teams(resources):
+    """Summarize PractitionerRole resources as care_teams (omitted when empty)."""
+    care_teams = []
+    for role in resources:
+        team_info = {
+            "practitioner": role.get("practitioner", {}).get("display", ""),
+            "organization": role.get("organization", {}).get("display", ""),
+            "role": [code.get("text", "") for code in role.get("code", [])],
+            "locations": [loc.get("display", "") for loc in role.get("location", [])],
+        }
+        care_teams.append(team_info)
+    if care_teams:
+        return {"care_teams": care_teams}
+    return {}
+
+def in_window(timestamp, window):
+    """True if a FHIR dateTime falls in a (start, end) window of naive UTC datetimes; unparseable values are kept."""
+    moment = parse_fhir_datetime(timestamp)
+    if moment is None:
+        return True
+    start, end = window
+    return start <= moment < end
+
+def parse_fhir_datetime(timestamp):
+    """A FHIR dateTime as a naive UTC datetime, or None if it cannot be parsed."""
+    try:
+        moment = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
 # =========================
 # Veteran Assignment & Management
 # =========================
@@ -401,49 +2199,524 @@ def get_veterans():
     """
     Return all veterans for the agency, or for a specific case manager.
     Used for dashboard population and filtering.
+
+    Optional query parameters:
+      fields=id,name     only return these fields (id is always included)
+      sort=name,-dob     sort keys, "-" for descending (default: assignment order)
+      limit=N            page size; the next page's cursor is returned in the
+      cursor=...         X-Next-Cursor header (and a Link rel="next" header)
+    Responses carry a strong ETag derived from the assignment data version;
+    If-None-Match with the current ETag gets an empty 304.
     """
     user = session.get("user")
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
-    agencies = load_data()
-    agency = next((a for a in agencies if a["id"] == user["agency_id"]), None)
-    if not agency:
+    agency_id = user["agency_id"]
+    if not assignment_store.agency(agency_id):
         return jsonify({"error": "Invalid agency"}), 400
 
-    # Return all veterans for the agency
-    if request.args.get("all") == "true":
-        all_veterans = []
-        for cm in agency["case_managers"]:
-            for v in cm["veterans"]:
-                v_copy = v.copy()
-                v_copy["case_manager_id"] = cm["id"]
-                all_veterans.append(v_copy)
-        return jsonify(all_veterans)
-
-    # Return veterans for a specific case manager
-    case_manager_id = request.args.get("case_manager_id")
-    if case_manager_id:
-        case_manager = next((cm for cm in agency["case_managers"] if str(cm["id"]) == str(case_manager_id)), None)
-        if not case_manager:
+    # Return all veterans for the agency, or for a specific case manager
+    # (defaulting to the logged-in case manager)
+    case_manager_id = None
+    if request.args.get("all") != "true":
+        case_manager_id = request.args.get("case_manager_id") or user["id"]
+        if not assignment_store.case_manager(agency_id, case_manager_id):
+            return jsonify({"error": "Invalid case manager"}), 400
+
+    try:
+        query = parse_veteran_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    etag = veterans_etag(agency_id, case_manager_id, query)
+    matched = etag_matches(etag)
+    if matched:
+        response = app.response_class(status=304)
+        etag = matched
+    else:
+        page, next_cursor = page_veterans(assignment_store.veterans(agency_id, case_manager_id), query)
+        response = jsonify(page)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+            next_args = request.args.to_dict()
+            next_args["cursor"] = next_cursor
+            response.headers["Link"] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def parse_veteran_query(args, allowed_fields=VETERAN_FIELDS, sort_keys=VETERAN_FIELDS):
+    """Validate the fields/sort/limit/cursor parameters of /api/veterans; raises ValueError."""
+    fields = None
+    if args.get("fields"):
+        fields = [f.strip() for f in args["fields"].split(",") if f.strip()]
+        unknown = [f for f in fields if f not in allowed_fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        if "id" not in fields:
+            fields.insert(0, "id")
+
+    sort = []
+    for key in (args.get("sort") or "").split(","):
+        key = key.strip()
+        if not key:
+            continue
+        descending = key.startswith("-")
+        name = key.lstrip("-+")
+        if name not in sort_keys:
+            raise ValueError(f"Unknown sort key: {name}")
+        sort.append((name, descending))
+
+    limit = None
+    if args.get("limit"):
+        try:
+            limit = int(args["limit"])
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if not 1 <= limit <= VETERANS_MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {VETERANS_MAX_PAGE_SIZE}")
+
+    cursor = None
+    if args.get("cursor"):
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(args["cursor"].encode()))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        if not isinstance(cursor, list) or len(cursor) != 3 or not isinstance(cursor[0], str):
+            raise ValueError("Invalid cursor")
+        if cursor[0] != sort_spec(sort):
+            raise ValueError("Cursor was issued for a different sort")
+        if (not valid_sort_key(cursor[1], sort)
+                or not isinstance(cursor[2], int) or isinstance(cursor[2], bool) or cursor[2] < 0):
+            raise ValueError("Invalid cursor")
+        cursor = cursor[1:]
+
+    return {"fields": fields, "sort": sort, "limit": limit, "cursor": cursor}
+
+def sort_spec(sort):
+    """Normalized sort parameter ("name,-dob") recorded in cursors."""
+    return ",".join(("-" if descending else "") + name for name, descending in sort)
+
+def valid_sort_key(key, sort):
+    """True if a cursor's key has the shape page_veterans builds: one sort_value pair per sort key."""
+    if not isinstance(key, list) or len(key) != len(sort):
+        return False
+    for value in key:
+        if not isinstance(value, list) or len(value) != 2 or value[0] not in (-1, 0, 1, 2):
+            return False
+        rank, item = value
+        if isinstance(rank, bool) or isinstance(item, bool):
+            return False
+        if not (isinstance(item, (int, float)) if rank == 0 else isinstance(item, str)):
+            return False
+    return True
+
+def veterans_etag(agency_id, case_manager_id, query):
+    """Strong ETag for one /api/veterans representation: data version plus the query that shaped it."""
+    key = repr((assignment_store.version, str(agency_id), str(case_manager_id), query))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def page_veterans(veterans, query):
+    """
+    Sort, page and project a veteran list. Returns (page, next_cursor).
+    A cursor holds the sort it was issued for, the last row's sort key and its
+    position among rows with that key, so pages stay consistent when a sort
+    key (e.g. name) repeats.
+    """
+    sort = query["sort"]
+
+    def sort_key(v):
+        return [sort_value(v.get(name), descending) for name, descending in sort]
+
+    # Stable multi-key sort: apply keys from last to first
+    for name, descending in reversed(sort):
+        veterans.sort(key=lambda v: sort_value(v.get(name), descending), reverse=descending)
+
+    start = 0
+    if query["cursor"]:
+        last_key, seen = query["cursor"]
+        start = len(veterans)
+        for i, v in enumerate(veterans):
+            if veteran_after(sort_key(v), last_key, sort):
+                start = i
+                break
+            if sort_key(v) == last_key:
+                if seen == 0:
+                    start = i
+                    break
+                seen -= 1
+
+    end = len(veterans) if query["limit"] is None else start + query["limit"]
+    page = veterans[start:end]
+
+    next_cursor = None
+    if page and end < len(veterans):
+        last_key = sort_key(page[-1])
+        seen = sum(1 for v in veterans[:end] if sort_key(v) == last_key)
+        next_cursor = base64.urlsafe_b64encode(json.dumps([sort_spec(sort), last_key, seen]).encode()).decode()
+
+    if query["fields"]:
+        page = [{f: v.get(f) for f in query["fields"]} for v in page]
+    return page, next_cursor
+
+def sort_value(value, descending=False):
+    """
+    Comparable (and JSON round-trippable) sort value: numbers before text,
+    text case-insensitive, blanks last in either direction.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return [0, value]
+    if value is None or value == "":
+        return [-1 if descending else 2, ""]
+    return [1, str(value).lower()]
+
+def veteran_after(key, last_key, sort):
+    """True if a row's sort key orders strictly after the cursor's key."""
+    for value, last, (_, descending) in zip(key, last_key, sort):
+        if value != last:
+            return value < last if descending else value > last
+    return False
+
+# =========================
+# Caseload Search
+# =========================
+
+CASELOAD_FIELDS = ("id", "name", "dob", "case_manager_id", "living_situation", "last_contact",
+                   "token_status", "next_appointment")
+CASELOAD_SORT_KEYS = ("name", "last_contact", "next_appointment")
+TOKEN_STATUSES = ("active", "expired", "missing")
+
+class CaseloadIndex:
+    """
+    One agency's veterans joined with their case notes and tokens, indexed
+    for /api/caseload: rows by case manager and living situation, plus
+    sorted name-word and ICN lists for prefix search. Built from a data
+    version and replaced, never updated in place.
+    """
+
+    def __init__(self, veterans, notes, tokens, version):
+        self.version = version
+        self.rows = []
+        self.tokens = {}  # icn -> token info (or None)
+        self.by_case_manager = {}  # str(case manager id) -> [row positions]
+        self.by_living = {}  # lowercased living situation -> [row positions]
+        prefixes = []
+        for pos, v in enumerate(veterans):
+            note = notes.get(v["id"]) or {}
+            self.rows.append({
+                "id": v["id"],
+                "name": v.get("name"),
+                "dob": v.get("dob"),
+                "case_manager_id": v.get("case_manager_id"),
+                "living_situation": note.get("living_situation") or None,
+                "last_contact": note.get("last_contact") or None,
+            })
+            self.tokens[v["id"]] = tokens.get(v["id"])
+            self.by_case_manager.setdefault(str(v.get("case_manager_id")), []).append(pos)
+            self.by_living.setdefault((note.get("living_situation") or "").lower(), []).append(pos)
+            prefixes.append((v["id"].lower(), pos))
+            prefixes.extend((word, pos) for word in (v.get("name") or "").lower().split())
+        prefixes.sort()
+        self.prefix_keys = [key for key, _ in prefixes]
+        self.prefix_rows = [pos for _, pos in prefixes]
+
+    def prefix_matches(self, text):
+        """
+        Row positions where every word of text prefixes the ICN or a name
+        word (case-insensitive), so "mar jo" finds "Jones, Maria".
+        """
+        matches = None
+        for prefix in text.lower().split():
+            start = bisect.bisect_left(self.prefix_keys, prefix)
+            end = bisect.bisect_left(self.prefix_keys, prefix + "\uffff")
+            found = set(self.prefix_rows[start:end])
+            matches = found if matches is None else matches & found
+        return matches or set()
+
+caseload_indexes = {}  # str(agency id) -> CaseloadIndex
+caseload_lock = threading.Lock()
+
+def caseload_index(agency_id):
+    """The agency's CaseloadIndex, rebuilt when assignments, case notes or tokens change."""
+    version = (assignment_store.version, case_notes_store.version, token_store.version)
+    index = caseload_indexes.get(str(agency_id))
+    if index is not None and index.version == version:
+        return index
+    with caseload_lock:
+        index = caseload_indexes.get(str(agency_id))
+        if index is None or index.version != version:
+            veterans = assignment_store.veterans(agency_id)
+            index = CaseloadIndex(veterans, case_notes_store.all(),
+                                  token_manager.get_many([v["id"] for v in veterans]), version)
+            caseload_indexes[str(agency_id)] = index
+    return index
+
+@app.route("/api/caseload", methods=["GET"])
+def search_caseload():
+    """
+    Search, filter and sort the agency's caseload server-side and return one
+    page of rows (veteran, living situation, last contact, token status and
+    next known appointment).
+
+    Query parameters (all optional):
+      case_manager_id=N       one case manager (default: the logged-in one; all=true for the agency)
+      living_situation=A,B    any of these living situations ("none" for unset)
+      token_status=active,... any of active, expired, missing
+      upcoming_within=N       next appointment within N days
+      q=prefix                ICN or name-word prefix
+      sort=-last_contact      name, last_contact or next_appointment ("-" for descending)
+      fields, limit, cursor   as for /api/veterans; the total match count is in X-Total-Count
+    Appointments come from cached summaries (kept warm by the cache warmer);
+    veterans without a cached summary have no next_appointment.
+    """
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    agency_id = user["agency_id"]
+    if not assignment_store.agency(agency_id):
+        return jsonify({"error": "Invalid agency"}), 400
+
+    case_manager_id = None
+    if request.args.get("all") != "true":
+        case_manager_id = request.args.get("case_manager_id") or user["id"]
+        if not assignment_store.case_manager(agency_id, case_manager_id):
             return jsonify({"error": "Invalid case manager"}), 400
-        veterans = []
-        for v in case_manager["veterans"]:
-            v_copy = v.copy()
-            v_copy["case_manager_id"] = case_manager["id"]
-            veterans.append(v_copy)
-        return jsonify(veterans)
-
-    # Default: return logged-in case manager's Veterans
-    case_manager = next((cm for cm in agency["case_managers"] if cm["id"] == user["id"]), None)
-    if not case_manager:
+
+    try:
+        query = parse_veteran_query(request.args, CASELOAD_FIELDS, CASELOAD_SORT_KEYS)
+        filters = parse_caseload_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    index = caseload_index(agency_id)
+    rows = select_caseload_rows(index, case_manager_id, filters, query)
+    page, next_cursor = page_veterans(rows, dict(query, fields=None))
+    if page and "next_appointment" not in page[0] and (not query["fields"] or "next_appointment" in query["fields"]):
+        add_next_appointments(index, page, datetime.utcnow())
+    if query["fields"]:
+        page = [{f: row.get(f) for f in query["fields"]} for row in page]
+    response = jsonify(page)
+    response.headers["X-Total-Count"] = str(len(rows))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_args = request.args.to_dict()
+        next_args["cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def parse_caseload_filters(args):
+    """Validate the living_situation/token_status/upcoming_within/q filters; raises ValueError."""
+    def values(name):
+        return [v.strip().lower() for v in (args.get(name) or "").split(",") if v.strip()]
+
+    token_status = values("token_status")
+    unknown = [t for t in token_status if t not in TOKEN_STATUSES]
+    if unknown:
+        raise ValueError(f"Unknown token status(es): {', '.join(unknown)}")
+    upcoming_within = None
+    if args.get("upcoming_within"):
+        try:
+            upcoming_within = int(args["upcoming_within"])
+        except ValueError:
+            raise ValueError("upcoming_within must be an integer number of days")
+        if upcoming_within < 0:
+            raise ValueError("upcoming_within must not be negative")
+    living = ["" if v == "none" else v for v in values("living_situation")]
+    return {
+        "living_situation": living,
+        "token_status": token_status,
+        "upcoming_within": upcoming_within,
+        "q": (args.get("q") or "").strip(),
+    }
+
+def select_caseload_rows(index, case_manager_id, filters, query):
+    """
+    Apply the filters to an index, cheapest first (index lookups, then token
+    expiry, then cached appointments). Returns fresh row dicts in assignment
+    order with token_status set; next_appointment is only looked up here
+    when it is filtered or sorted on.
+    """
+    if case_manager_id is not None:
+        positions = index.by_case_manager.get(str(case_manager_id), [])
+    else:
+        positions = range(len(index.rows))
+    if filters["living_situation"]:
+        allowed = set()
+        for living in filters["living_situation"]:
+            allowed.update(index.by_living.get(living, ()))
+        positions = [p for p in positions if p in allowed]
+    if filters["q"]:
+        matches = index.prefix_matches(filters["q"])
+        positions = [p for p in positions if p in matches]
+
+    rows = []
+    wanted_status = set(filters["token_status"])
+    for pos in positions:
+        row = index.rows[pos]
+        token_info = index.tokens[row["id"]]
+        if token_info is None:
+            status = "missing"
+        elif token_manager.is_expired(token_info):
+            status = "expired"
+        else:
+            status = "active"
+        if wanted_status and status not in wanted_status:
+            continue
+        rows.append(dict(row, token_status=status))
+
+    if filters["upcoming_within"] is not None or "next_appointment" in {name for name, _ in query["sort"]}:
+        now = datetime.utcnow()
+        add_next_appointments(index, rows, now)
+        if filters["upcoming_within"] is not None:
+            horizon = (now + timedelta(days=filters["upcoming_within"])).strftime("%Y-%m-%dT%H:%M:%SZ")
+            rows = [row for row in rows if row["next_appointment"] and row["next_appointment"] <= horizon]
+    return rows
+
+def add_next_appointments(index, rows, now):
+    """Set next_appointment on rows from their cached summaries."""
+    summaries = summary_cache.peek_many({
+        row["id"]: index.tokens[row["id"]]["access_token"] for row in rows if index.tokens[row["id"]]})
+    for row in rows:
+        row["next_appointment"] = next_appointment(summaries.get(row["id"]), now)
+
+def next_appointment(summary, now):
+    """Earliest upcoming appointment in a summary, as a UTC 'YYYY-MM-DDTHH:MM:SSZ' string, or None."""
+    upcoming = []
+    for appt in (summary or {}).get("upcoming_appointments", []):
+        moment = parse_fhir_datetime(appt.get("date"))
+        if moment is not None and moment >= now:
+            upcoming.append(moment)
+    return min(upcoming).strftime("%Y-%m-%dT%H:%M:%SZ") if upcoming else None
+
+# =========================
+# Caseload Export
+# =========================
+
+EXPORT_FIELDS = ("id", "name", "dob", "age", "ssn_last4", "address", "phones", "emails",
+                 "case_manager_id", "case_manager", "living_situation", "last_contact", "case_notes",
+                 "token_status", "care_teams", "next_appointment", "upcoming_appointments",
+                 "past_appointments", "error", "cursor")
+
+@app.route("/api/caseload/export", methods=["GET"])
+def export_caseload():
+    """
+    Stream the agency's caseload for reporting, one row per veteran joining
+    the assignment, case notes and patient summary, ordered by ICN.
+
+    Query parameters (all optional):
+      format=csv|ndjson   default csv
+      case_manager_id=N   one case manager (default: the whole agency)
+      cached=true         summaries from the cache only; never calls the VA API
+      cursor=...          resume after the row that carried this cursor
+    Every row carries a cursor; if the download breaks, request again with
+    the cursor of the last complete row. Summaries are fetched
+    EXPORT_CHUNK_SIZE veterans at a time through the summary cache with the
+    usual bounded concurrency.
+    """
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    agency_id = user["agency_id"]
+    if not assignment_store.agency(agency_id):
+        return jsonify({"error": "Invalid agency"}), 400
+
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    case_manager_id = request.args.get("case_manager_id")
+    if case_manager_id and not assignment_store.case_manager(agency_id, case_manager_id):
         return jsonify({"error": "Invalid case manager"}), 400
-    veterans = []
-    for v in case_manager["veterans"]:
-        v_copy = v.copy()
-        v_copy["case_manager_id"] = case_manager["id"]
-        veterans.append(v_copy)
-    return jsonify(veterans)
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = json.loads(base64.urlsafe_b64decode(request.args["cursor"].encode()))[0]
+        except (ValueError, TypeError, IndexError, KeyError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        if not isinstance(after, str):
+            return jsonify({"error": "Invalid cursor"}), 400
+    cached_only = request.args.get("cached") == "true"
+
+    # The assignment rows (id, name, dob, case manager) and case manager names are
+    # held for the whole export; notes, tokens and summaries are read per chunk
+    usernames = {str(cm["id"]): cm["username"] for cm in assignment_store.case_managers(agency_id)}
+    veterans = sorted(
+        (v for v in assignment_store.veterans(agency_id, case_manager_id or None) if after is None or v["id"] > after),
+        key=lambda v: v["id"])
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, EXPORT_FIELDS)
+        if export_format == "csv":
+            writer.writeheader()
+        try:
+            for i in range(0, len(veterans), EXPORT_CHUNK_SIZE):
+                for row in export_rows(veterans[i:i + EXPORT_CHUNK_SIZE], usernames, cached_only):
+                    if export_format == "csv":
+                        writer.writerow(row)
+                    else:
+                        buffer.write(json.dumps(row, separators=(",", ":")) + "\n")
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        except Exception as e:
+            # Headers are already sent; the client resumes from its last cursor
+            log.error("Caseload export for agency %s stopped: %s", agency_id, e)
+            raise
+
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    response = app.response_class(generate(), mimetype=mimetype)
+    filename = f"caseload-{agency_id}-{datetime.utcnow():%Y%m%d}.{export_format}"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["X-Total-Count"] = str(len(veterans))
+    response.headers["Cache-Control"] = "private, no-store"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+def export_rows(veterans, usernames, cached_only):
+    """Export rows for one chunk of veterans: one case notes read, one token read, one summary batch."""
+    icns = [v["id"] for v in veterans]
+    notes = case_notes_store.get_many(icns)
+    tokens = token_manager.get_many(icns)
+    if cached_only:
+        summaries = summary_cache.peek_many(
+            {icn: token_info["access_token"] for icn, token_info in tokens.items() if token_info})
+    else:
+        summaries = get_patient_summaries(icns, tokens)
+    now = datetime.utcnow()
+    for vet in veterans:
+        icn = vet["id"]
+        summary = summaries.get(icn) or {}
+        note = notes.get(icn, {})
+        token_info = tokens.get(icn)
+        if cached_only:
+            status = "missing" if not token_info else "expired" if token_manager.is_expired(token_info) else "active"
+        else:
+            status = summary.get("token_status", "missing")
+        ssn = summary.get("ssn") or ""
+        yield {
+            "id": icn,
+            "name": summary.get("name") or vet.get("name", ""),
+            "dob": vet.get("dob") or summary.get("dob", ""),
+            "age": summary.get("age", ""),
+            "ssn_last4": ssn[-4:],
+            "address": summary.get("address", ""),
+            "phones": "; ".join(summary.get("phones", [])),
+            "emails": "; ".join(summary.get("emails", [])),
+            "case_manager_id": vet.get("case_manager_id", ""),
+            "case_manager": usernames.get(str(vet.get("case_manager_id")), ""),
+            "living_situation": note.get("living_situation") or "",
+            "last_contact": note.get("last_contact") or "",
+            "case_notes": note.get("case_notes") or "",
+            "token_status": status,
+            "care_teams": len(summary.get("care_teams", [])),
+            "next_appointment": next_appointment(summary, now) or "",
+            "upcoming_appointments": len(summary.get("upcoming_appointments", [])),
+            "past_appointments": len(summary.get("past_appointments", [])),
+            "error": summary.get("error", ""),
+            "cursor": base64.urlsafe_b64encode(json.dumps([icn]).encode()).decode(),
+        }
 
 @app.route("/api/reassign_veteran", methods=["POST"])
 def reassign_veteran():
@@ -461,34 +2734,66 @@ def reassign_veteran():
     if not veteran_id or not new_case_manager_id:
         return jsonify({"error": "Missing required fields"}), 400
 
-    agencies = load_data()
-    agency = next((a for a in agencies if a["id"] == user["agency_id"]), None)
-    if not agency:
+    agency_id = user["agency_id"]
+    if not assignment_store.agency(agency_id):
         return jsonify({"error": "Invalid agency"}), 400
 
-    new_case_manager = next(
-        (cm for cm in agency["case_managers"] if cm["id"] == new_case_manager_id),
-        None
-    )
-    if not new_case_manager:
+    if not assignment_store.case_manager(agency_id, new_case_manager_id):
         return jsonify({"error": "Invalid case manager"}), 400
 
-    # Find and update the Veteran
-    for cm in agency["case_managers"]:
-        veteran = next((v for v in cm["veterans"] if v["id"] == veteran_id), None)
-        if veteran:
-            cm["veterans"].remove(veteran)
-            new_case_manager["veterans"].append(veteran)
-            break
-    else:
+    # Move the Veteran and persist the change
+    if not assignment_store.move_veteran(agency_id, veteran_id, new_case_manager_id):
         return jsonify({"error": "Veteran not found"}), 404
-
-    # Save updated data back to JSON
-    with open("./assignments.json", "w") as file:
-        json.dump(agencies, file)
+    publish_event(agency_id, "veteran_reassigned",
+                  {"veteran_id": veteran_id, "case_manager_id": str(new_case_manager_id)})
 
     return jsonify({"success": True, "message": "Veteran reassigned successfully"})
 
+@app.route("/api/reassign_veterans", methods=["POST"])
+def reassign_veterans():
+    """
+    Reassign many veterans within the logged-in user's agency at once.
+    Expects JSON with either or both of
+      moves: [{"veteran_id": ..., "new_case_manager_id": ...}, ...]
+      from_case_manager_id / to_case_manager_id: move a whole caseload
+    Everything is validated first and applied in a single write; if any
+    move is invalid nothing changes and the problems are listed in errors.
+    """
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True) or {}
+    raw_moves = data.get("moves") or []
+    if not isinstance(raw_moves, list):
+        return jsonify({"error": "moves must be a list"}), 400
+    if len(raw_moves) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Too many moves (max {MAX_BATCH_IDS})"}), 400
+    moves = []
+    for move in raw_moves:
+        if not isinstance(move, dict) or not move.get("veteran_id") or not move.get("new_case_manager_id"):
+            return jsonify({"error": "Each move needs veteran_id and new_case_manager_id"}), 400
+        moves.append((str(move["veteran_id"]), move["new_case_manager_id"]))
+    transfers = []
+    if data.get("from_case_manager_id") or data.get("to_case_manager_id"):
+        if not data.get("from_case_manager_id") or not data.get("to_case_manager_id"):
+            return jsonify({"error": "Caseload transfers need from_case_manager_id and to_case_manager_id"}), 400
+        transfers.append((data["from_case_manager_id"], data["to_case_manager_id"]))
+    if not moves and not transfers:
+        return jsonify({"error": "Missing required fields"}), 400
+
+    agency_id = user["agency_id"]
+    if not assignment_store.agency(agency_id):
+        return jsonify({"error": "Invalid agency"}), 400
+
+    moved, errors = assignment_store.reassign_veterans(agency_id, moves, transfers)
+    if errors:
+        return jsonify({"error": "No veterans were reassigned", "errors": errors}), 400
+    log.info("Reassigned %d veterans in agency %s", len(moved), agency_id)
+    for icn, to_id in moved.items():
+        publish_event(agency_id, "veteran_reassigned", {"veteran_id": icn, "case_manager_id": to_id})
+    return jsonify({"success": True, "moved": len(moved), "message": f"{len(moved)} veteran(s) reassigned"})
+
 @app.route("/api/assign_veteran", methods=["POST"])
 def assign_veteran():
     """
@@ -502,28 +2807,25 @@ def assign_veteran():
     if not agency_id or not case_manager_id:
         return jsonify({"error": "Missing required fields"}), 400
 
-    agencies = load_data()
-    agency = next((a for a in agencies if a["id"] == agency_id), None)
-    if not agency:
+    if not assignment_store.agency(agency_id):
         return jsonify({"error": "Invalid agency"}), 400
 
-    case_manager = next((cm for cm in agency["case_managers"] if cm["id"] == case_manager_id), None)
-    if not case_manager:
+    if not assignment_store.case_manager(agency_id, case_manager_id):
         return jsonify({"error": "Invalid case manager"}), 400
 
     veteran_id = session.get("icn")
     access_token = session.get("access_token")
     refresh_token = None
-    tokens = load_tokens()
-    if veteran_id in tokens:
-        refresh_token = tokens[veteran_id].get("refresh_token")
+    token_info = token_manager.get(veteran_id) if veteran_id else None
+    if token_info:
+        refresh_token = token_info.get("refresh_token")
     if not veteran_id or not access_token:
         return jsonify({"error": "Veteran not logged in"}), 401
 
     # Fetch name and dob from FHIR Patient API
     headers = {"Authorization": f"Bearer {access_token}"}
     url = f"{FHIR_API_BASE}/Patient/{veteran_id}"
-    resp = requests.get(url, headers=headers)
+    resp = va_get(url, headers=headers)
     name = "New Veteran"
     dob = ""
     if resp.status_code == 200:
@@ -534,47 +2836,35 @@ def assign_veteran():
         dob = patient.get("birthDate", "")
 
     # Check if the veteran is already assigned in this agency
-    already_assigned = None
-    for cm in agency["case_managers"]:
-        for v in cm["veterans"]:
-            if v["id"] == veteran_id:
-                already_assigned = cm
-                break
-        if already_assigned:
-            break
+    already_assigned = assignment_store.veteran_case_manager(agency_id, veteran_id)
 
-    if already_assigned:
-        if already_assigned["id"] == case_manager_id:
-            # Same case manager: just renew tokens
-            tokens[veteran_id] = {
-                "access_token": access_token,
-                "refresh_token": refresh_token or session.get("refresh_token")
-            }
-            save_tokens(tokens)
-            return jsonify({"success": True, "message": "Access renewed for existing case manager."})
-        else:
-            # Remove from old case manager and add to new one
-            already_assigned["veterans"] = [v for v in already_assigned["veterans"] if v["id"] != veteran_id]
-            # Add to new case manager below
-
-    # Add the Veteran to the case manager's list with name and dob
-    if not any(v["id"] == veteran_id for v in case_manager["veterans"]):
-        case_manager["veterans"].append({
-            "id": veteran_id,
-            "name": name,
-            "dob": dob
+    if already_assigned and str(already_assigned["id"]) == str(case_manager_id):
+        # Same case manager: just renew tokens
+        token_manager.set(veteran_id, {
+            "access_token": access_token,
+            "refresh_token": refresh_token or session.get("refresh_token")
         })
-
-    # Save updated data back to JSON
-    with open("./assignments.json", "w") as file:
-        json.dump(agencies, file)
+        summary_cache.invalidate(veteran_id)
+        publish_event(agency_id, "veteran_assigned", {"veteran": {
+            "id": veteran_id, "name": name, "dob": dob, "case_manager_id": str(case_manager_id)}})
+        return jsonify({"success": True, "message": "Access renewed for existing case manager."})
+
+    # Add the Veteran to the case manager's list with name and dob (removing
+    # them from any previous case manager)
+    assignment_store.assign_veteran(agency_id, case_manager_id, {
+        "id": veteran_id,
+        "name": name,
+        "dob": dob
+    })
 
     # Always update tokens
-    tokens[veteran_id] = {
+    token_manager.set(veteran_id, {
         "access_token": access_token,
         "refresh_token": refresh_token or session.get("refresh_token")
-    }
-    save_tokens(tokens)
+    })
+    summary_cache.invalidate(veteran_id)
+    publish_event(agency_id, "veteran_assigned", {"veteran": {
+        "id": veteran_id, "name": name, "dob": dob, "case_manager_id": str(case_manager_id)}})
 
     return jsonify({"success": True, "message": "Veteran assigned successfully"})
 
@@ -591,13 +2881,14 @@ def save_case_notes_api():
     icn = data.get("icn")
     if not icn:
         return jsonify({"error": "Missing ICN"}), 400
-    notes = load_case_notes()
-    notes[icn] = {
+    notes = {
         "living_situation": data.get("living_situation"),
         "last_contact": data.get("last_contact"),
         "case_notes": data.get("case_notes")
     }
-    save_case_notes(notes)
+    case_notes_store.set(icn, notes)
+    index_case_notes(icn, notes)
+    publish_veteran_event(icn, "case_notes_updated", dict(notes, veteran_id=icn))
     return jsonify({"success": True})
 
 @app.route("/api/case_notes/<icn>")
@@ -605,8 +2896,165 @@ def get_case_notes_api(icn):
     """
     Get case notes for a specific veteran (ICN).
     """
-    notes = load_case_notes()
-    return jsonify(notes.get(icn, {}))
+    return jsonify(case_notes_store.get(icn))
+
+# =========================
+# Case Notes Search
+# =========================
+
+CASE_NOTES_SEARCH_FIELDS = {"living_situation": 2.0, "case_notes": 1.0}  # field -> ranking weight
+
+class CaseNotesIndex:
+    """
+    Full-text index over one agency's case notes and living situations for
+    /api/case_notes/search. Saves made in this worker are applied directly.
+    Other workers' saves and assignment changes are picked up by the next
+    search, which re-reads only the notes written since it last looked
+    (everything after a journal compaction).
+    """
+
+    def __init__(self, agency_id):
+        self.agency_id = str(agency_id)
+        self.lock = threading.Lock()
+        self.text = TextIndex(CASE_NOTES_SEARCH_FIELDS)
+        self.veterans = {}  # icn -> assignment row
+        self.notes = {}  # icn -> case notes as last indexed
+        self.version = None  # (assignment, case notes) store versions last reconciled
+
+    def refresh(self):
+        """Reconcile with the stores if either changed; caller holds self.lock."""
+        version = (assignment_store.version, case_notes_store.version)
+        if version == self.version:
+            return
+        changed = None if self.version is None else case_notes_store.changes_since(self.version[1])
+        if changed is None:
+            # First build, or the store can't say what changed: compare every note
+            self.veterans = {v["id"]: v for v in assignment_store.veterans(self.agency_id)}
+            notes = case_notes_store.get_many(self.veterans)
+            for icn in set(self.notes) - set(notes):
+                self.drop(icn)
+            changed = notes
+        elif version[0] != self.version[0]:
+            veterans = {v["id"]: v for v in assignment_store.veterans(self.agency_id)}
+            for icn in set(self.veterans) - set(veterans):
+                self.drop(icn)
+            changed.update(case_notes_store.get_many(set(veterans) - set(self.veterans)))
+            self.veterans = veterans
+        for icn, note in changed.items():
+            if icn in self.veterans:
+                self.apply(icn, note)
+        self.version = version
+
+    def apply(self, icn, note):
+        """Index one veteran's notes; caller holds self.lock."""
+        self.notes[icn] = note
+        self.text.update(icn, note)
+
+    def drop(self, icn):
+        """Unindex a veteran who left the agency or has no notes; caller holds self.lock."""
+        self.notes.pop(icn, None)
+        self.text.remove(icn)
+
+case_notes_indexes = {}  # str(agency id) -> CaseNotesIndex
+case_notes_indexes_lock = threading.Lock()
+
+def case_notes_index(agency_id):
+    with case_notes_indexes_lock:
+        index = case_notes_indexes.get(str(agency_id))
+        if index is None:
+            index = case_notes_indexes[str(agency_id)] = CaseNotesIndex(agency_id)
+    return index
+
+def index_case_notes(icn, notes):
+    """Apply a saved note to the search indexes already built for the veteran's agencies."""
+    for agency, _ in assignment_store.veteran_assignments(icn):
+        index = case_notes_indexes.get(str(agency["id"]))
+        if index is None:
+            continue
+        with index.lock:
+            if icn in index.veterans:
+                index.apply(icn, notes)
+
+@app.route("/api/case_notes/search", methods=["GET"])
+def search_case_notes():
+    """
+    Full-text search over the agency's case notes and living situations,
+    best matches first. Every word of q must match; a word also matches
+    longer words it begins ("evict" finds "eviction"), ranked below exact
+    matches, and living situation matches rank above note matches.
+
+    Query parameters:
+      q=words             required
+      case_manager_id=N   one case manager (default: the whole agency)
+      limit=N, cursor=... page size (default CASE_NOTES_SEARCH_PAGE_SIZE) and
+                          the X-Next-Cursor of the previous page
+    The total match count is in X-Total-Count.
+    """
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    agency_id = user["agency_id"]
+    if not assignment_store.agency(agency_id):
+        return jsonify({"error": "Invalid agency"}), 400
+
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "Missing q"}), 400
+    case_manager_id = request.args.get("case_manager_id")
+    if case_manager_id and not assignment_store.case_manager(agency_id, case_manager_id):
+        return jsonify({"error": "Invalid case manager"}), 400
+    try:
+        limit = int(request.args.get("limit") or CASE_NOTES_SEARCH_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= VETERANS_MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {VETERANS_MAX_PAGE_SIZE}"}), 400
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = json.loads(base64.urlsafe_b64decode(request.args["cursor"].encode()))
+        except ValueError:
+            after = None
+        if (not isinstance(after, list) or len(after) != 2 or not isinstance(after[0], (int, float))
+                or not isinstance(after[1], str)):
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    index = case_notes_index(agency_id)
+    with index.lock:
+        index.refresh()
+        results = index.text.search(q)
+        if case_manager_id:
+            results = [(icn, score) for icn, score in results
+                       if str(index.veterans[icn].get("case_manager_id")) == str(case_manager_id)]
+        start = 0
+        if after is not None:
+            # Results are ordered by (-score, icn); resume after the cursor's row
+            start = bisect.bisect_right([(-score, icn) for icn, score in results], (-after[0], after[1]))
+        page = results[start:start + limit]
+        rows = []
+        for icn, score in page:
+            veteran = index.veterans[icn]
+            note = index.notes[icn]
+            rows.append({
+                "id": icn,
+                "name": veteran.get("name"),
+                "case_manager_id": veteran.get("case_manager_id"),
+                "living_situation": note.get("living_situation") or None,
+                "last_contact": note.get("last_contact") or None,
+                "score": round(score, 4),
+                "snippet": snippet(note.get("case_notes"), q),
+            })
+
+    response = jsonify(rows)
+    response.headers["X-Total-Count"] = str(len(results))
+    if page and start + limit < len(results):
+        next_cursor = base64.urlsafe_b64encode(json.dumps([page[-1][1], page[-1][0]]).encode()).decode()
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_args = request.args.to_dict()
+        next_args["cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 # =========================
 # Consent/Token Revocation
@@ -615,17 +3063,95 @@ def get_case_notes_api(icn):
 @app.route("/api/revoke", methods=["POST"])
 def revoke_access():
     """
-    Revoke a veteran's consent/token (removes from tokens.json and session).
+    Revoke a veteran's consent/token (removes it from the token store and session).
     """
     icn = session.get("icn")
     if icn:
-        tokens = load_tokens()
-        tokens.pop(icn, None)
-        save_tokens(tokens)
+        token_manager.delete(icn)
+        summary_cache.invalidate(icn)
+        if snapshot_store is not None:
+            snapshot_store.delete(icn)
+        publish_veteran_event(icn, "consent_revoked", {"veteran_id": icn})
     session.pop("access_token", None)
     session.pop("icn", None)
     return jsonify({"message": "Access revoked."})
 
+# =========================
+# Dashboard Change Events
+# =========================
+
+def publish_event(agency_id, event_type, data):
+    """Tell the agency's open dashboards about a change (never fails the request)."""
+    try:
+        event_bus.publish(agency_id, event_type, data)
+    except Exception as e:
+        log.error("Could not publish %s event: %s", event_type, e)
+
+def publish_veteran_event(icn, event_type, data):
+    """Publish an event to every agency the veteran is assigned in."""
+    for agency_id in {str(agency["id"]) for agency, _ in assignment_store.veteran_assignments(icn)}:
+        publish_event(agency_id, event_type, data)
+
+@app.route("/api/events", methods=["GET"])
+def stream_events():
+    """
+    Server-Sent Events stream of caseload changes in the logged-in user's
+    agency: veteran_assigned, veteran_reassigned, case_notes_updated,
+    consent_revoked, and reset (reload everything). Resumes after the
+    Last-Event-ID header when the browser reconnects.
+    """
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    subscription = event_bus.subscribe(user["agency_id"], request.headers.get("Last-Event-ID"))
+    if subscription is None:
+        # At EVENTS_MAX_STREAMS: don't tie up another thread; the dashboard retries later
+        response = app.response_class(f"retry: {int(EVENTS_RETRY_AFTER * 1000)}\n\n", status=503,
+                                      mimetype="text/event-stream")
+        response.headers["Retry-After"] = str(int(EVENTS_RETRY_AFTER))
+        return response
+    deadline = time.monotonic() + EVENTS_STREAM_MAX_AGE
+
+    def generate():
+        try:
+            yield f"retry: {int(EVENTS_HEARTBEAT * 1000)}\n\n"
+            for event in subscription.events(EVENTS_HEARTBEAT, deadline):
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event_id, event_type, data = event
+                message = f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+                yield f"id: {event_id}\n{message}" if event_id else message
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    response = app.response_class(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route("/api/summary_cache/stats", methods=["GET"])
+def get_summary_cache_stats():
+    """Return patient summary cache hit/miss counters (for tuning the TTL), cache warmer and upstream protection status."""
+    if not session.get("user"):
+        return jsonify({"error": "Unauthorized"}), 401
+    stats = summary_cache.stats()
+    stats["warmer"] = cache_warmer.stats()
+    stats["upstream"] = {
+        "coalescing": summary_flights.stats(),
+        "rate_limit": fhir_rate_limiter.stats(),
+        "circuit": fhir_breaker.stats(),
+        "sync": dict(fhir_sync_counters),
+    }
+    return jsonify(stats)
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus metrics for this worker."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return app.response_class(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 # =========================
 # Agency & Case Manager Info
 # =========================
@@ -633,8 +3159,7 @@ def revoke_access():
 @app.route("/api/agencies", methods=["GET"])
 def get_agencies():
     """Return a list of all agencies (id and name only)."""
-    agencies = load_data()
-    return jsonify([{"id": a["id"], "name": a["name"]} for a in agencies])
+    return jsonify(assignment_store.agencies())
 
 @app.route("/api/case_managers", methods=["GET"])
 def get_case_managers():
@@ -643,12 +3168,10 @@ def get_case_managers():
     if not agency_id:
         return jsonify({"error": "Missing agency ID"}), 400
 
-    agencies = load_data()
-    agency = next((a for a in agencies if str(a["id"]) == agency_id), None)
-    if not agency:
+    if not assignment_store.agency(agency_id):
         return jsonify({"error": "Invalid agency ID"}), 400
 
-    return jsonify([{"id": cm["id"], "username": cm["username"]} for cm in agency["case_managers"]])
+    return jsonify([{"id": cm["id"], "username": cm["username"]} for cm in assignment_store.case_managers(agency_id)])
 
 # =========================
 # App Entry Point
@@ -0,0 +1,199 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import threading
+
+from flask import request, current_app
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Compression Helpers
+# =========================
+
+def compress_variants(body, gzip_level=9, brotli_quality=11):
+    """Return {"identity": body, "gzip": ..., "br": ...} (br only if the brotli module is installed)."""
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=gzip_level, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=brotli_quality)
+    return variants
+
+def preferred_encoding(available):
+    """Pick the best encoding the client accepts among the available ones (br, then gzip)."""
+    for encoding in ("br", "gzip"):
+        if encoding in available and request.accept_encodings[encoding] > 0:
+            return encoding
+    return "identity"
+
+def encoded_etag(etag, encoding):
+    """Strong ETags must differ per content encoding, so compressed variants get a suffix."""
+    return etag if encoding == "identity" else f"{etag}-{encoding}"
+
+def etag_matches(etag):
+    """Return the If-None-Match tag that matches etag or one of its encoded variants, else None."""
+    for encoding in ("identity", "gzip", "br"):
+        tag = encoded_etag(etag, encoding)
+        if tag in request.if_none_match:
+            return tag
+    return None
+
+def compress_response(response, min_size):
+    """
+    after_request hook: gzip (or brotli) JSON responses of at least min_size
+    bytes when the client accepts it. Streamed and already encoded responses
+    are left alone.
+    """
+    if (response.mimetype != "application/json"
+            or response.is_streamed
+            or response.direct_passthrough
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+    encoding = preferred_encoding(("br", "gzip") if brotli is not None else ("gzip",))
+    if encoding == "identity":
+        return response
+    # Favor speed for per-request bodies; static assets use the max levels
+    if encoding == "br":
+        response.set_data(brotli.compress(body, quality=4))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(encoded_etag(etag, encoding))
+    return response
+
+# =========================
+# Static Asset Pipeline
+# =========================
+
+class AssetPipeline:
+    """
+    Fingerprints the frontend's JS/CSS and serves them from /assets/ under
+    content-hashed names (e.g. SSVF_Dashboard.3f2a9c01b7de.js) with
+    immutable cache headers and precompressed gzip/brotli variants. HTML
+    pages are rewritten to reference the hashed names and served with
+    no-cache plus an ETag, so browsers revalidate the page but never
+    re-download an unchanged script. Source files are re-read when they
+    change on disk.
+    """
+
+    def __init__(self, assets, pages_dir, url_prefix="/assets/"):
+        self.assets = assets  # logical name -> source path
+        self.pages_dir = pages_dir
+        self.url_prefix = url_prefix
+        self.lock = threading.Lock()
+        self.source_keys = None
+        self.hashed = {}  # hashed name -> (content type, variants)
+        self.urls = {}  # logical name -> hashed URL
+        self.pages = {}  # page filename -> (file key, etag, variants)
+
+    # --- Build ---
+
+    def _source_keys(self):
+        keys = []
+        for path in self.assets.values():
+            try:
+                st = os.stat(path)
+                keys.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                keys.append(None)
+        return keys
+
+    def _current(self):
+        """Rebuild the fingerprinted assets if any source changed."""
+        keys = self._source_keys()
+        if keys != self.source_keys:
+            with self.lock:
+                if keys != self.source_keys:
+                    self._build()
+                    self.source_keys = keys
+        return self
+
+    def _build(self):
+        hashed, urls = {}, {}
+        for name, path in self.assets.items():
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+            except OSError as e:
+                log.warning("Asset %s not fingerprinted: %s", name, e)
+                continue
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            stem, ext = os.path.splitext(name)
+            hashed_name = f"{stem}.{digest}{ext}"
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type.endswith("javascript"):
+                content_type += "; charset=utf-8"
+            hashed[hashed_name] = (content_type, compress_variants(body))
+            urls[name] = self.url_prefix + hashed_name
+        self.hashed, self.urls, self.pages = hashed, urls, {}
+        log.info("Fingerprinted %d static assets", len(hashed))
+
+    def rewrite(self, html):
+        """Point script/link references to known assets at their hashed URLs."""
+        for name, url in self.urls.items():
+            pattern = r'((?:src|href)=")/?(?:static/)?' + re.escape(name) + '"'
+            html = re.sub(pattern, lambda m, url=url: m.group(1) + url + '"', html)
+        return html
+
+    # --- Serving ---
+
+    def asset_response(self, hashed_name):
+        """Response for a fingerprinted asset, or None if the name is unknown (e.g. an old hash)."""
+        entry = self._current().hashed.get(hashed_name)
+        if entry is None:
+            return None
+        content_type, variants = entry
+        response = self._variant_response(variants, content_type)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+    def page_response(self, filename):
+        """Response for an HTML page with rewritten asset URLs, or None if it does not exist."""
+        self._current()
+        path = os.path.join(self.pages_dir, filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        file_key = (st.st_mtime_ns, st.st_size)
+        cached = self.pages.get(filename)
+        if cached is None or cached[0] != file_key:
+            with open(path, "r", encoding="utf-8") as f:
+                body = self.rewrite(f.read()).encode("utf-8")
+            cached = (file_key, hashlib.sha256(body).hexdigest()[:32], compress_variants(body))
+            self.pages[filename] = cached
+        _, etag, variants = cached
+        response = self._variant_response(variants, "text/html; charset=utf-8", etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def _variant_response(self, variants, content_type, etag=None):
+        encoding = preferred_encoding(variants)
+        if etag is not None:
+            matched = etag_matches(etag)
+            if matched:
+                response = current_app.response_class(status=304)
+                response.set_etag(matched)
+                response.vary.add("Accept-Encoding")
+                return response
+        response = current_app.response_class(variants[encoding], content_type=content_type)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        if etag is not None:
+            response.set_etag(encoded_etag(etag, encoding))
+        response.vary.add("Accept-Encoding")
+        return response
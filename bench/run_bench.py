@@ -0,0 +1,249 @@
+"""
+Dashboard-load benchmark: drives the real Flask routes against the local
+VA stub (stub_server.py) with synthetic agencies and reports p50/p95/p99
+latency and throughput per route.
+
+    python bench/run_bench.py --sizes 10,100,1000,10000 --requests 300 --concurrency 8
+    python bench/run_bench.py --sizes 1000 --latency-ms 100 --error-rate 0.05 --json results.json
+
+Each agency size runs in a fresh process with its own data directory, so
+module-level state in app.py (caches, storage) never leaks between sizes.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+CASELOAD_SIZE = 50  # veterans per synthetic case manager
+PASSWORD = "bench"
+
+# =========================
+# Synthetic Data
+# =========================
+
+def write_agency(data_dir, size):
+    """Write assignments/tokens/case notes for one agency of `size` veterans; returns the case managers."""
+    case_managers = []
+    for cm_index in range((size + CASELOAD_SIZE - 1) // CASELOAD_SIZE or 1):
+        first = cm_index * CASELOAD_SIZE
+        case_managers.append({
+            "id": cm_index + 1,
+            "username": f"cm{cm_index + 1}",
+            "password": PASSWORD,
+            "veterans": [
+                {"id": str(10000000 + i), "name": f"Veteran {i}", "dob": f"19{50 + i % 50}-01-01"}
+                for i in range(first, min(size, first + CASELOAD_SIZE))
+            ],
+        })
+    agencies = [{"id": 1, "name": "Bench Agency", "case_managers": case_managers}]
+    expires_at = int(time.time()) + 86400
+    tokens = {
+        v["id"]: {"access_token": f"at-{v['id']}-bench", "refresh_token": f"rt-{v['id']}-bench", "expires_at": expires_at}
+        for cm in case_managers for v in cm["veterans"]
+    }
+    for name, data in (("assignments.json", agencies), ("tokens.json", tokens), ("case_notes.json", {})):
+        with open(os.path.join(data_dir, name), "w") as f:
+            json.dump(data, f)
+    return case_managers
+
+# =========================
+# Measurement
+# =========================
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def run_scenario(name, client_for_thread, send, total, concurrency):
+    """
+    Send `total` requests from `concurrency` threads. send(client, i) performs
+    request i and returns the response. Returns latency percentiles (ms),
+    throughput and error count.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        client = client_for_thread()
+        started = time.perf_counter()
+        resp = send(client, i)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed * 1000)
+            if resp.status_code >= 400:
+                errors.append(resp.status_code)
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - wall_started
+    latencies.sort()
+    return {
+        "route": name,
+        "requests": total,
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "rps": round(total / wall, 1) if wall else 0.0,
+    }
+
+# =========================
+# Benchmark (one size per process)
+# =========================
+
+def run_size(args):
+    """Import the app against a fresh synthetic agency and measure each route."""
+    data_dir = tempfile.mkdtemp(prefix=f"ssvf-bench-{args.size}-")
+    case_managers = write_agency(data_dir, args.size)
+    icns = [v["id"] for cm in case_managers for v in cm["veterans"]]
+    os.environ.update({
+        "AUTH_URL": f"{args.stub_url}/oauth2/authorization",
+        "TOKEN_URL": f"{args.stub_url}/oauth2/token",
+        "FHIR_API_BASE": f"{args.stub_url}/fhir",
+        "STORAGE_BACKEND": args.storage,
+        "SQLITE_DB": os.path.join(data_dir, "ssvf.db"),
+        "SUMMARY_WARM_ENABLED": "false",
+        "TOKEN_REFRESH_ENABLED": "false",
+    })
+    os.chdir(data_dir)
+    sys.path.insert(0, REPO_ROOT)
+    real_stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")  # the app logs every upstream call
+    import app as ssvf
+
+    local = threading.local()
+
+    def client_for_thread():
+        # One logged-in test client per thread, spread across case managers
+        if not hasattr(local, "client"):
+            local.client = ssvf.app.test_client()
+            cm = case_managers[threading.get_ident() % len(case_managers)]
+            local.client.post("/case_manager_login", json={"agency_id": "1", "username": cm["username"], "password": PASSWORD})
+        return local.client
+
+    def veteran_session(client, icn):
+        with client.session_transaction() as s:
+            s["icn"] = icn
+            s["access_token"] = f"at-{icn}-bench"
+
+    n, c = args.requests, args.concurrency
+    results = [
+        run_scenario("GET /api/veterans?all=true", client_for_thread,
+                     lambda client, i: client.get("/api/veterans?all=true"), n, c),
+        run_scenario("GET /api/veterans (case manager)", client_for_thread,
+                     lambda client, i: client.get("/api/veterans"), n, c),
+        # First pass over distinct veterans misses the summary cache; the second is served from it
+        run_scenario("GET /api/patient (cold)", client_for_thread,
+                     lambda client, i: client.get(f"/api/patient?id={icns[i % len(icns)]}"), min(n, len(icns)), c),
+        run_scenario("GET /api/patient (cached)", client_for_thread,
+                     lambda client, i: client.get(f"/api/patient?id={icns[i % len(icns)]}"), min(n, len(icns)), c),
+        run_scenario("POST /api/case_notes", client_for_thread,
+                     lambda client, i: client.post("/api/case_notes", json={
+                         "icn": icns[i % len(icns)], "living_situation": "Stable housing",
+                         "last_contact": "2024-01-01", "case_notes": f"Bench note {i}"}), n, c),
+        run_scenario("GET /api/case_notes/<icn>", client_for_thread,
+                     lambda client, i: client.get(f"/api/case_notes/{icns[i % len(icns)]}"), n, c),
+    ]
+
+    def assign(client, i):
+        veteran_session(client, icns[i % len(icns)])
+        cm = case_managers[i % len(case_managers)]
+        return client.post("/api/assign_veteran", json={"agency_id": 1, "case_manager_id": cm["id"]})
+
+    results.append(run_scenario("POST /api/assign_veteran", client_for_thread, assign, n, c))
+    sys.stdout = real_stdout
+    print(json.dumps({"size": args.size, "storage": args.storage, "results": results}))
+
+# =========================
+# Driver
+# =========================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_stub(args):
+    """Start stub_server.py on a free port and wait until it answers."""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "stub_server.py"), "--port", str(port),
+         "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+         "--error-rate", str(args.error_rate), "--appointments", str(args.appointments)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + "/stats", timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("VA stub did not start")
+
+def print_table(report):
+    header = f"{'route':<36} {'reqs':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+    for run in report:
+        print(f"\n== {run['size']} veterans ({run['storage']}) ==")
+        print(header)
+        for r in run["results"]:
+            print(f"{r['route']:<36} {r['requests']:>6} {r['errors']:>5} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['rps']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="SSVF VetConnect dashboard-load benchmark")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated agency sizes (veterans)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--stub-url", help="use an already running stub instead of starting one")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--appointments", type=int, default=20)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own logging")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)  # child process mode
+    args = parser.parse_args()
+
+    if args.size is not None:
+        run_size(args)
+        return
+
+    stub = None
+    if not args.stub_url:
+        stub, args.stub_url = start_stub(args)
+    report = []
+    try:
+        for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            cmd = [sys.executable, os.path.abspath(__file__), "--size", str(size), "--stub-url", args.stub_url,
+                   "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--storage", args.storage]
+            if args.verbose:
+                cmd.append("--verbose")
+            out = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True).stdout
+            report.append(json.loads(out.strip().splitlines()[-1]))
+            print_table(report[-1:])
+    finally:
+        if stub:
+            stub.terminate()
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
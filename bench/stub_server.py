@@ -0,0 +1,273 @@
+"""
+Local stand-in for the VA sandbox OAuth and FHIR endpoints, for measuring
+the app offline.
+
+    python bench/stub_server.py --port 8090 --latency-ms 80 --error-rate 0.02
+
+Then start the app with
+    AUTH_URL=http://127.0.0.1:8090/oauth2/authorization
+    TOKEN_URL=http://127.0.0.1:8090/oauth2/token
+    FHIR_API_BASE=http://127.0.0.1:8090/fhir
+
+Every veteran gets deterministic synthetic data seeded by their ICN, so any
+ICN works. Searches honor _count and _lastUpdated and return link[rel=next]
+pages; Patient reads honor If-None-Match; POSTing a batch Bundle to the FHIR
+base is supported. POST /touch/<icn> simulates an upstream edit of that
+veteran's Patient and one recent appointment.
+"""
+import argparse
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, parse_qsl
+
+from flask import Flask, jsonify, redirect, request
+from werkzeug.datastructures import MultiDict
+
+app = Flask(__name__)
+
+# Set from the command line (see main)
+config = {
+    "latency_ms": 50.0,
+    "jitter_ms": 20.0,
+    "error_rate": 0.0,
+    "appointments": 20,
+    "practitioners": 3,
+    "default_count": 50,
+}
+stats_lock = threading.Lock()
+stats = {"requests": 0, "errors_injected": 0, "not_modified": 0, "bytes_sent": 0}
+STARTED = datetime.utcnow().replace(microsecond=0)
+touched = {}  # icn -> (version, datetime of the last simulated edit)
+
+# =========================
+# Latency & Error Injection
+# =========================
+
+@app.before_request
+def simulate_upstream():
+    """Sleep for the configured latency and fail a fraction of requests with 503."""
+    if request.path == "/stats":
+        return None
+    delay = max(0.0, random.gauss(config["latency_ms"], config["jitter_ms"])) / 1000
+    time.sleep(delay)
+    with stats_lock:
+        stats["requests"] += 1
+        if random.random() >= config["error_rate"]:
+            return None
+        stats["errors_injected"] += 1
+    return jsonify({"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "transient"}]}), 503
+
+@app.after_request
+def count_bytes(response):
+    with stats_lock:
+        stats["bytes_sent"] += response.calculate_content_length() or 0
+    return response
+
+@app.route("/stats")
+def get_stats():
+    with stats_lock:
+        return jsonify(dict(stats, **config))
+
+@app.route("/touch/<icn>", methods=["POST"])
+def touch(icn):
+    """Bump the version of a veteran's Patient and one recent appointment."""
+    with stats_lock:
+        version = touched.get(icn, (1, None))[0] + 1
+        touched[icn] = (version, datetime.utcnow().replace(microsecond=0))
+    return jsonify({"icn": icn, "version": version})
+
+def resource_meta(icn):
+    version, updated = touched.get(icn, (1, STARTED))
+    return {"versionId": str(version), "lastUpdated": updated.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+# =========================
+# OAuth
+# =========================
+
+@app.route("/oauth2/authorization")
+def authorize():
+    """Approve immediately: redirect back with a code naming the patient (?patient=, else a random ICN)."""
+    icn = request.args.get("patient") or str(random.randint(1000000, 99999999))
+    params = {"code": f"code-{icn}-{secrets.token_hex(4)}", "state": request.args.get("state", "")}
+    return redirect(request.args["redirect_uri"] + "?" + urlencode(params))
+
+@app.route("/oauth2/token", methods=["POST"])
+def token():
+    """Authorization-code and refresh-token grants; tokens last an hour."""
+    grant_type = request.form.get("grant_type")
+    if grant_type == "authorization_code":
+        icn = request.form.get("code", "").split("-")[1:2]
+    elif grant_type == "refresh_token":
+        icn = request.form.get("refresh_token", "").split("-")[1:2]
+    else:
+        return jsonify({"error": "unsupported_grant_type"}), 400
+    if not icn:
+        return jsonify({"error": "invalid_grant"}), 400
+    return jsonify({
+        "access_token": f"at-{icn[0]}-{secrets.token_hex(8)}",
+        "refresh_token": f"rt-{icn[0]}-{secrets.token_hex(8)}",
+        "token_type": "Bearer",
+        "expires_in": 3600,
+        "patient": icn[0],
+    })
+
+# =========================
+# FHIR
+# =========================
+
+def patient_resource(icn):
+    rng = random.Random(icn)
+    return {
+        "resourceType": "Patient",
+        "id": icn,
+        "meta": resource_meta(icn),
+        "name": [{"given": [rng.choice(["Alex", "Jordan", "Sam", "Casey", "Riley"])],
+                  "family": rng.choice(["Smith", "Garcia", "Lee", "Nguyen", "Brown"])}],
+        "birthDate": f"{rng.randint(1940, 2000)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "telecom": [{"system": "phone", "value": f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"}],
+        "address": [{"line": [f"{rng.randint(1, 999)} Main St"], "city": "Seattle", "state": "WA", "postalCode": "98101"}],
+        "identifier": [{
+            "type": {"coding": [{"system": "http://terminology.hl7.org/CodeSystem/v2-0203", "code": "SS"}]},
+            "value": f"{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}",
+        }],
+    }
+
+def appointment_resources(icn):
+    """Appointments spread evenly from two years back to one year ahead of the stub's start."""
+    rng = random.Random(icn + "-appointments")
+    now = datetime.utcnow()
+    count = config["appointments"]
+    appointments = []
+    for i in range(count):
+        start = STARTED - timedelta(days=730) + timedelta(days=1095 * i / max(1, count))
+        appointments.append({
+            "resourceType": "Appointment",
+            "id": f"{icn}-a{i}",
+            "meta": resource_meta(icn) if i == count * 2 // 3 else resource_meta(None),
+            "status": "booked" if start > now else "fulfilled",
+            "start": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "description": rng.choice(["Primary care", "Mental health", "Dental", "Cardiology"]),
+            "serviceType": [{"text": rng.choice(["PCP", "MH", "DEN", "CARD"])}],
+        })
+    if icn in touched and appointments:
+        appointments[count * 2 // 3]["description"] += f" (rev {touched[icn][0]})"
+    return appointments
+
+def practitioner_role_resources(icn):
+    rng = random.Random(icn + "-roles")
+    return [{
+        "resourceType": "PractitionerRole",
+        "id": f"{icn}-r{i}",
+        "meta": resource_meta(None),
+        "practitioner": {"display": f"Dr. {rng.choice(['Adams', 'Baker', 'Clark', 'Davis'])}"},
+        "organization": {"display": "VA Puget Sound"},
+        "code": [{"text": rng.choice(["Primary Care", "Social Work"])}],
+        "location": [{"display": "Seattle VAMC"}],
+    } for i in range(config["practitioners"])]
+
+def in_date_filters(start, filters):
+    """Apply FHIR date prefixes (ge/gt/le/lt) to an ISO timestamp."""
+    for f in filters:
+        prefix, value = f[:2], f[2:]
+        if (prefix == "ge" and not start >= value) or (prefix == "gt" and not start > value) \
+                or (prefix == "le" and not start <= value) or (prefix == "lt" and not start < value):
+            return False
+    return True
+
+def search_bundle(base_url, args, resources):
+    """One page of a searchset Bundle, with a next link while entries remain."""
+    updated_filters = args.getlist("_lastUpdated")
+    if updated_filters:
+        resources = [r for r in resources if in_date_filters(r["meta"]["lastUpdated"], updated_filters)]
+    count = int(args.get("_count", config["default_count"]))
+    offset = int(args.get("_offset", 0))
+    page = resources[offset:offset + count]
+    bundle = {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": len(resources),
+        "entry": [{"resource": r} for r in page],
+        "link": [],
+    }
+    if offset + count < len(resources):
+        next_args = [(k, v) for k, v in args.items(multi=True) if k != "_offset"] + [("_offset", offset + count)]
+        bundle["link"].append({"relation": "next", "url": f"{base_url}?{urlencode(next_args)}"})
+    return bundle
+
+def fhir_read(method, path, args, host_url):
+    """Serve one FHIR read; returns (status, body). Shared by plain GETs and batch entries."""
+    if method != "GET":
+        return 405, {"resourceType": "OperationOutcome"}
+    if path.startswith("Patient/"):
+        return 200, patient_resource(path.split("/", 1)[1])
+    icn = args.get("patient")
+    if not icn:
+        return 400, {"resourceType": "OperationOutcome", "issue": [{"diagnostics": "patient is required"}]}
+    base_url = f"{host_url}fhir/{path}"
+    if path == "Appointment":
+        filters = args.getlist("date")
+        resources = [a for a in appointment_resources(icn) if in_date_filters(a["start"], filters)]
+        return 200, search_bundle(base_url, args, resources)
+    if path == "PractitionerRole":
+        return 200, search_bundle(base_url, args, practitioner_role_resources(icn))
+    return 404, {"resourceType": "OperationOutcome"}
+
+@app.route("/fhir/<path:path>")
+def fhir_get(path):
+    if not request.headers.get("Authorization", "").startswith("Bearer "):
+        return jsonify({"error": "Unauthorized"}), 401
+    status, body = fhir_read("GET", path, request.args, request.host_url)
+    if status == 200 and body.get("resourceType") == "Patient":
+        etag = f'W/"{body["meta"]["versionId"]}"'
+        if request.headers.get("If-None-Match") == etag:
+            with stats_lock:
+                stats["not_modified"] += 1
+            return "", 304, {"ETag": etag}
+        return jsonify(body), status, {"ETag": etag}
+    return jsonify(body), status
+
+@app.route("/fhir", methods=["POST"])
+@app.route("/fhir/", methods=["POST"])
+def fhir_batch():
+    """Process a batch Bundle of GETs in one round trip."""
+    bundle = request.get_json(force=True)
+    if bundle.get("type") != "batch":
+        return jsonify({"resourceType": "OperationOutcome"}), 400
+    entries = []
+    for entry in bundle.get("entry", []):
+        req = entry.get("request", {})
+        path, _, query = req.get("url", "").partition("?")
+        status, body = fhir_read(req.get("method", "GET"), path, MultiDict(parse_qsl(query)), request.host_url)
+        if status == 200 and body.get("resourceType") == "Patient" and req.get("ifNoneMatch") == f'W/"{body["meta"]["versionId"]}"':
+            with stats_lock:
+                stats["not_modified"] += 1
+            entries.append({"response": {"status": "304 Not Modified"}})
+            continue
+        entries.append({"resource": body, "response": {"status": f"{status} {'OK' if status == 200 else 'Error'}"}})
+    return jsonify({"resourceType": "Bundle", "type": "batch-response", "entry": entries})
+
+def main():
+    parser = argparse.ArgumentParser(description="Local VA OAuth/FHIR stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"], help="mean upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=config["jitter_ms"], help="latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="fraction of requests failing with 503")
+    parser.add_argument("--appointments", type=int, default=config["appointments"], help="appointments per veteran")
+    parser.add_argument("--practitioners", type=int, default=config["practitioners"], help="care team members per veteran")
+    args = parser.parse_args()
+    config.update({
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "error_rate": args.error_rate,
+        "appointments": args.appointments,
+        "practitioners": args.practitioners,
+    })
+    print(f"VA stub listening on http://{args.host}:{args.port} with {config}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+from storage import file_lock
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Caseload Change Events
+# =========================
+
+class Subscription:
+    """One open /api/events stream: events for a single agency, delivered through a bounded queue."""
+
+    def __init__(self, agency_id, max_queue):
+        self.agency_id = agency_id
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def events(self, heartbeat, deadline):
+        """
+        Yield (id, type, data) events, or None every `heartbeat` seconds with
+        nothing to send, until the monotonic deadline. A subscriber that fell
+        too far behind gets a single "reset" event and the stream ends.
+        """
+        while time.monotonic() < deadline:
+            if self.overflowed:
+                yield None, "reset", {}
+                return
+            try:
+                yield self.queue.get(timeout=min(heartbeat, max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                yield None
+
+
+class EventBus:
+    """
+    Agency-scoped change events shared by every worker on the host.
+    publish() appends one JSON line to an events file under its file lock;
+    each worker runs a thread that tails the file and hands new events to
+    its own open streams. An event's id is "<file inode>:<end offset>", so
+    a reconnecting browser (Last-Event-ID) is replayed what it missed, or
+    told to reload if the file has been rotated since. The file is rotated
+    once it grows past max_bytes; each new file starts with a marker naming
+    the file it replaced, so a worker that missed a whole file resets its
+    streams instead of silently skipping events. At most max_subscribers
+    streams (None = unlimited) are open at once in this worker.
+    """
+
+    def __init__(self, path, poll_interval=0.25, max_bytes=1024 * 1024, max_queue=1000, max_subscribers=None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.reader = None
+        self.reader_ino = None
+        self.previous_ino = None
+        self.offset = 0
+        self.started = False
+        self.counters = {"published": 0, "delivered": 0, "dropped": 0, "refused": 0}
+
+    # --- Publishing (any worker) ---
+
+    def publish(self, agency_id, event_type, data):
+        """Append an event for one agency; failures are logged, never raised to the caller."""
+        record = json.dumps({"agency_id": str(agency_id), "type": event_type, "data": data, "ts": time.time()})
+        try:
+            with file_lock(self.path):
+                marker = None
+                try:
+                    current = os.stat(self.path)
+                    if current.st_size > self.max_bytes:
+                        os.replace(self.path, self.path + ".1")
+                        marker = json.dumps({"agency_id": "", "type": "rotated", "data": {"previous": current.st_ino}})
+                except OSError:
+                    pass  # no events file yet
+                with open(self.path, "a") as f:
+                    f.write(record + "\n" if marker is None else marker + "\n" + record + "\n")
+            self.counters["published"] += 1
+        except OSError as e:
+            log.error("Could not publish %s event: %s", event_type, e)
+
+    # --- Subscribing (this worker) ---
+
+    def subscribe(self, agency_id, last_event_id=None):
+        """
+        Register a stream for an agency. Events after last_event_id that are
+        still in the current file are queued first; if they cannot be
+        replayed the stream starts with a "reset" event. Returns None if
+        max_subscribers streams are already open.
+        """
+        self.start()
+        subscription = Subscription(str(agency_id), self.max_queue)
+        with self.lock:
+            if self.max_subscribers is not None and len(self.subscribers) >= self.max_subscribers:
+                self.counters["refused"] += 1
+                return None
+            self._catch_up()
+            missed = self._replay(subscription.agency_id, last_event_id) if last_event_id else []
+            if len(missed) >= self.max_queue:
+                missed = [(None, "reset", {})]
+            for event in missed:
+                subscription.queue.put_nowait(event)
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, subscribers=len(self.subscribers))
+
+    # --- Tailing the events file ---
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self._open(seek_end=True)
+        threading.Thread(target=self._run, name="event-tail", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with self.lock:
+                    self._catch_up()
+            except Exception as e:
+                log.error("Event tailing failed: %s", e)
+
+    def _open(self, seek_end=False):
+        """Open the current events file (creating it if needed); caller holds self.lock."""
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = open(self.path, "a+b")
+        self.reader_ino = os.fstat(self.reader.fileno()).st_ino
+        self.offset = self.reader.seek(0, os.SEEK_END) if seek_end else 0
+
+    def _catch_up(self):
+        """Dispatch new events, following the file across rotations; caller holds self.lock."""
+        while True:
+            self._dispatch(self._read_new())
+            try:
+                current_ino = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                return
+            if current_ino == self.reader_ino:
+                return
+            # Rotated. Publishers may have appended to the old file between the
+            # read above and the rename; nothing is written to it after the
+            # rename (both happen under the file lock), so one more read drains it
+            self._dispatch(self._read_new())
+            self.previous_ino = self.reader_ino
+            self._open()
+
+    def _read_new(self):
+        """Complete records past self.offset in the open file, as (agency id, event) pairs."""
+        self.reader.seek(self.offset)
+        offset = self.offset
+        events = []
+        for line in self.reader:
+            if not line.endswith(b"\n"):
+                break  # still being written
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record["type"] == "rotated":
+                if record["data"]["previous"] != self.previous_ino:
+                    self._reset_all()  # a whole file went by unread
+                continue
+            events.append((record["agency_id"], (f"{self.reader_ino}:{offset}", record["type"], record["data"])))
+        self.offset = offset
+        return events
+
+    def _dispatch(self, events):
+        for agency_id, event in events:
+            for subscription in self.subscribers:
+                if subscription.agency_id != agency_id:
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                    self.counters["delivered"] += 1
+                except queue.Full:
+                    subscription.overflowed = True
+                    self.counters["dropped"] += 1
+
+    def _reset_all(self):
+        for subscription in self.subscribers:
+            subscription.overflowed = True
+
+    def _replay(self, agency_id, last_event_id):
+        """Events for agency_id after last_event_id, or a single reset event if that id is gone."""
+        try:
+            ino, offset = (int(part) for part in last_event_id.split(":"))
+        except ValueError:
+            ino, offset = None, None
+        if ino != self.reader_ino or offset is None or offset > self.offset:
+            return [(None, "reset", {})]
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != ino:
+                return [(None, "reset", {})]
+            events = []
+            f.seek(offset)
+            for line in f:
+                if offset >= self.offset or not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record["agency_id"] == agency_id:
+                    events.append((f"{ino}:{offset}", record["type"], record["data"]))
+            return events
@@ -0,0 +1,165 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+
+import aiohttp
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Async FHIR Client
+# =========================
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class AsyncFHIRClient:
+    """
+    asyncio client for the FHIR reads behind a patient summary: Patient,
+    Appointment and PractitionerRole. It runs its own event loop in a
+    background thread with one aiohttp session, so a single worker can keep
+    hundreds of upstream requests in flight within the connector's limits.
+    Sync code hands it coroutines with submit(); async views can await
+    asyncio.wrap_future(client.submit(...)).
+    """
+
+    def __init__(self, base_url, limit=100, limit_per_host=50, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_base=0.5, backoff_max=8, page_size=50, max_pages=10,
+                 observer=None, gate=None):
+        self.base_url = base_url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.observer = observer  # observer(method, url, status or "error", seconds), once per attempt
+        self.gate = gate  # gate(method, url) -> seconds to wait before an attempt; may raise to refuse it
+        self.loop = None
+        self.session = None
+
+    def start(self):
+        """Start the event loop thread and open the shared session."""
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="fhir-async", daemon=True).start()
+        self.submit(self._open_session()).result()
+
+    async def _open_session(self):
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    def submit(self, coro):
+        """Schedule a coroutine on the client's loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        if self.loop is not None:
+            self.submit(self.session.close()).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # --- Resource reads: each returns (status, parsed body or None, body text) ---
+    # Searches return the resources of every page instead of a Bundle.
+
+    async def patient(self, icn, access_token):
+        return await self.get(f"/Patient/{icn}", access_token)
+
+    async def appointments(self, icn, access_token, date_filters):
+        params = [("patient", icn)] + [("date", value) for value in date_filters]
+        return await self.search("/Appointment", access_token, params)
+
+    async def practitioner_roles(self, icn, access_token):
+        return await self.search("/PractitionerRole", access_token, [("patient", icn)])
+
+    async def search(self, path, access_token, params, max_pages=None):
+        """
+        Run a FHIR search, following link[rel=next] for up to max_pages
+        (default self.max_pages) pages of page_size entries. Each page is
+        parsed once; only its resources are kept. A failed page fails the
+        whole search.
+        """
+        max_pages = max_pages or self.max_pages
+        if params is not None:  # None: path is a next link that already carries the query
+            params = list(params) + [("_count", str(self.page_size))]
+        resources = []
+        pages = 0
+        while path:
+            status, bundle, text = await self.get(path, access_token, params)
+            if status != 200 or bundle is None:
+                return status, None, text
+            pages += 1
+            resources.extend(entry["resource"] for entry in bundle.get("entry", []) if "resource" in entry)
+            path = next((link.get("url") for link in bundle.get("link", []) if link.get("relation") == "next"), None)
+            params = None  # the next link already carries the query
+            if path and pages >= max_pages:
+                log.warning("Stopped after %d pages; results truncated", pages)
+                break
+        return 200, resources, ""
+
+    async def batch(self, bundle, access_token):
+        """POST a FHIR batch Bundle to the base URL (retried only on 429 or a failed connect)."""
+        return await self.request("POST", "", access_token, json_body=bundle)
+
+    async def get(self, path, access_token, params=None, headers=None):
+        return await self.request("GET", path, access_token, params, headers=headers)
+
+    async def request(self, method, path, access_token, params=None, json_body=None, headers=None):
+        """
+        Send a FHIR request, retrying 429/5xx (GET) and connection errors
+        with exponential backoff and full jitter (honoring Retry-After).
+        POSTs are only retried when the server cannot have processed them.
+        Extra headers (e.g. If-None-Match) are sent as given; a 304 comes
+        back as (304, None, "").
+        """
+        url = path if path.startswith(("http://", "https://")) else self.base_url + path
+        headers = dict(headers or {}, Authorization=f"Bearer {access_token}")
+        if json_body is not None:
+            headers["Content-Type"] = "application/fhir+json"
+        idempotent = method == "GET"
+        attempt = 0
+        while True:
+            if self.gate is not None:
+                delay = self.gate(method, url)
+                if delay:
+                    await asyncio.sleep(delay)
+            started = time.perf_counter()
+            try:
+                async with self.session.request(method, url, headers=headers, params=params, json=json_body) as resp:
+                    text = await resp.text()
+                    status = resp.status
+                    retry_after = resp.headers.get("Retry-After")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self._observe(method, url, "error", started)
+                retryable = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                log.warning("%s %s failed (%r); retrying in %.2fs", method, url, e, delay)
+            else:
+                self._observe(method, url, status, started)
+                retryable = status == 429 or (idempotent and status in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    try:
+                        body = json.loads(text)
+                    except ValueError:
+                        body = None
+                    return status, body, text
+                delay = self._backoff(attempt, retry_after)
+                log.warning("%s %s returned %s; retrying in %.2fs", method, url, status, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _observe(self, method, url, status, started):
+        if self.observer is not None:
+            self.observer(method, url, status, time.perf_counter() - started)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
@@ -12,6 +12,10 @@ const livingOptions = [
 // Cached list of veterans for filtering and rendering
 let cachedVeterans = [];
 
+// Incremented on every table render so rows from an older render are dropped
+let renderGeneration = 0;
+let renderScheduled = false;
+
 // State for notes modal
 let currentNotesVetId = null;
 let currentNotesLiving = null;
@@ -37,24 +41,8 @@ async function fetchVeterans(fetchAll = false) {
         alert(data.error);
         return;
     }
-    // Fetch additional details for each veteran (e.g., demographics, appointments)
-    const detailedVeterans = await Promise.all(
-        data.map(async vet => {
-            try {
-                const detailResp = await fetch(`/api/patient?id=${vet.id}`);
-                const detail = await detailResp.json();
-                // If SSN is missing, mark as missing consent/token
-                if (!detail.ssn) {
-                    return { ...vet, ...detail, token_status: "missing" };
-                }
-                return { ...vet, ...detail, token_status: "active" };
-            } catch {
-                // If fetch fails, mark as missing
-                return { ...vet, token_status: "missing" };
-            }
-        })
-    );
-    cachedVeterans = detailedVeterans;
+    // Fetch additional details for all veterans (e.g., demographics, appointments) in one batch
+    cachedVeterans = await fetchSummaries(data);
     renderTable(cachedVeterans);
 }
 
@@ -73,26 +61,43 @@ async function fetchVeteransByCaseManager(caseManagerId) {
         alert(data.error);
         return;
     }
-    // Fetch additional details for each veteran
-    cachedVeterans = await Promise.all(
-        data.map(async vet => {
-            try {
-                const detailResp = await fetch(`/api/patient?id=${vet.id}`);
-                const detail = await detailResp.json();
-                // If SSN is missing, mark as missing consent/token
-                if (!detail.ssn) {
-                    return { ...vet, ...detail, token_status: "missing" };
-                }
-                return { ...vet, ...detail, token_status: "active" };
-            } catch {
-                // If fetch fails, mark as missing
-                return { ...vet, token_status: "missing" };
-            }
-        })
-    );
+    // Fetch additional details for all veterans in one batch
+    cachedVeterans = await fetchSummaries(data);
     renderTable(cachedVeterans);
 }
 
+// Most ids the server accepts in one /api/patients call (its MAX_BATCH_IDS)
+const MAX_BATCH_IDS = 500;
+
+/**
+ * Fetches patient summaries for a list of veterans, MAX_BATCH_IDS at a time.
+ * The server sets token_status per veteran ("active", "expired", "missing"
+ * or "unavailable").
+ * @param {Array} veterans - Veteran objects from /api/veterans.
+ * @returns {Array} - Veterans merged with their summaries.
+ */
+async function fetchSummaries(veterans) {
+    if (veterans.length === 0) return [];
+    const summaries = {};
+    for (let i = 0; i < veterans.length; i += MAX_BATCH_IDS) {
+        const ids = veterans.slice(i, i + MAX_BATCH_IDS).map(vet => encodeURIComponent(vet.id)).join(',');
+        try {
+            const resp = await fetch(`/api/patients?ids=${ids}`);
+            const batch = await resp.json();
+            if (!batch.error) Object.assign(summaries, batch);
+        } catch {
+            // Veterans of a failed batch are marked unavailable below
+        }
+    }
+    return veterans.map(vet => {
+        const detail = summaries[vet.id];
+        if (!detail) {
+            return { ...vet, token_status: "unavailable" };
+        }
+        return { ...vet, ...detail };
+    });
+}
+
 /**
  * Fetches the list of case managers for the agency (used for reassignment modal).
  * Caches the result for future use.
@@ -114,76 +119,131 @@ async function loadCaseManagersForReassign() {
 
 /**
  * Renders the main veterans table and details rows.
+ * Case notes are fetched once per veteran and kept on the veteran object.
  * @param {Array} veterans - List of veteran objects to display.
  */
 function renderTable(veterans) {
     const tbody = document.getElementById('veteranTable').querySelector('tbody');
+    const generation = ++renderGeneration;
     tbody.innerHTML = '';
     veterans.forEach((vet, idx) => {
-        fetch(`/api/case_notes/${vet.id}`)
-            .then(r => r.json())
-            .then(notes => {
-                // Main row (always visible)
-                const tr = document.createElement('tr');
-                tr.className = 'main-row';
-                tr.innerHTML = `
-                    <td class="name-cell" style="cursor:pointer;">
-                        ${vet.token_status === "missing"
-                            ? '<span class="token-expired-indicator" title="Consent expired or revoked"></span>'
-                            : ''
-                        }
-                        <span onclick="toggleDetails(${idx}, cachedVeterans[${idx}])">${vet.name || ''}</span>
-                    </td>
-                    <td class="hide-mobile">${vet.ssn && vet.ssn.length >= 4 ? vet.ssn.slice(-4) : ''}</td>
-                    <td class="hide-mobile">${vet.age || ''}</td>
-                    <td class="hide-mobile">
-                        ${(vet.care_teams && vet.care_teams.length > 0) ? "Yes" : "None"}
-                    </td>
-                    <td class="hide-mobile">
-                        <select>
-                            ${livingOptions.map(opt => `<option value="${opt}"${notes.living_situation === opt ? ' selected' : ''}>${opt}</option>`).join('')}
-                        </select>
-                    </td>
-                    <td class="hide-mobile">
-                        <input type="date" value="${notes.last_contact || ''}">
-                    </td>
-                    <td class="hide-mobile">
-                        <span class="notes-preview clickable" title="${notes.case_notes || ''}" onclick="openNotesModal('${vet.id}', '${notes.case_notes || ''}', this.parentElement.parentElement.querySelector('select').value, this.parentElement.parentElement.querySelector('input').value)">
-                            ${notes.case_notes && notes.case_notes.length > 0 ? (notes.case_notes.length > 60 ? notes.case_notes.slice(0, 60) + '…' : notes.case_notes) : '—'}
-                        </span>
-                    </td>
-                    <td class="hide-mobile">${(vet.upcoming_appointments && vet.upcoming_appointments.length > 0) ? new Date(vet.upcoming_appointments[0].date).toLocaleString() : ''}</td>
-                    <td class="hide-mobile">
-                        <button class="save-btn button-green" onclick="saveNotes('${vet.id}', this)">Save</button>
-                        <span class="save-success" style="display:none;"></span>
-                    </td>
-                    <td class="hide-mobile"><button class="button-green" onclick="toggleDetails(${idx}, cachedVeterans[${idx}])">Details</button></td>
-                    <td class="hide-mobile"><button class="button-green" onclick="reassignVeteran('${vet.id}')">Reassign</button></td>
-                `;
-                tbody.appendChild(tr);
-
-                // Details row (hidden by default, shown on click)
-                const detailsTr = document.createElement('tr');
-                detailsTr.className = 'expand-row';
-                detailsTr.id = `details-row-${idx}`;
-                detailsTr.style.display = 'none';
-                const detailsTd = document.createElement('td');
-                detailsTd.colSpan = 11;
-                detailsTd.innerHTML = `
-                    <div class="mobile-details">
-                        ${renderDetails(vet)}
-                        <div style="margin-top:12px;">
-                            <button class="button-green" onclick="reassignVeteran('${vet.id}')">Reassign</button>
-                            <button class="button-green" onclick="openNotesModal('${vet.id}', '${notes.case_notes || ''}', '${notes.living_situation || ''}', '${notes.last_contact || ''}')">Edit Notes</button>
-                        </div>
-                    </div>
-                `;
-                detailsTr.appendChild(detailsTd);
-                tbody.appendChild(detailsTr);
-            });
+        loadNotes(vet).then(() => {
+            if (generation !== renderGeneration) return;
+            const [tr, detailsTr] = buildRows(vet, idx);
+            tbody.appendChild(tr);
+            tbody.appendChild(detailsTr);
+        });
+    });
+}
+
+/**
+ * Re-renders the whole table from cachedVeterans once per animation frame,
+ * however many changes arrive in between (no requests unless notes are missing).
+ */
+function scheduleRender() {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+        renderScheduled = false;
+        renderTable(cachedVeterans);
     });
 }
 
+/**
+ * Replaces one veteran's rows in place, keeping its details row open or closed.
+ * @param {number} idx - Index into cachedVeterans.
+ */
+function updateRow(idx) {
+    const row = document.getElementById(`vet-row-${idx}`);
+    const details = document.getElementById(`details-row-${idx}`);
+    if (!row || !details) return;
+    const [tr, detailsTr] = buildRows(cachedVeterans[idx], idx);
+    detailsTr.style.display = details.style.display;
+    row.replaceWith(tr);
+    details.replaceWith(detailsTr);
+}
+
+/**
+ * Fetches a veteran's case notes unless they are already cached on the object.
+ * @param {Object} vet - Veteran object
+ */
+async function loadNotes(vet) {
+    if (!vet.notes) {
+        const resp = await fetch(`/api/case_notes/${vet.id}`);
+        vet.notes = await resp.json();
+    }
+    return vet.notes;
+}
+
+/**
+ * Builds the main row and the (hidden) details row for a veteran.
+ * @param {Object} vet - Veteran object with notes loaded
+ * @param {number} idx - Index into cachedVeterans
+ * @returns {Array} - [main row, details row]
+ */
+function buildRows(vet, idx) {
+    const notes = vet.notes || {};
+    // Main row (always visible)
+    const tr = document.createElement('tr');
+    tr.className = 'main-row';
+    tr.id = `vet-row-${idx}`;
+    tr.innerHTML = `
+        <td class="name-cell" style="cursor:pointer;">
+            ${vet.token_status === "unavailable"
+                ? '<span class="token-unavailable-indicator" title="VA data temporarily unavailable"></span>'
+                : vet.token_status !== "active"
+                ? '<span class="token-expired-indicator" title="Consent expired or revoked"></span>'
+                : ''
+            }
+            <span onclick="toggleDetails(${idx}, cachedVeterans[${idx}])">${vet.name || ''}</span>
+        </td>
+        <td class="hide-mobile">${vet.ssn && vet.ssn.length >= 4 ? vet.ssn.slice(-4) : ''}</td>
+        <td class="hide-mobile">${vet.age || ''}</td>
+        <td class="hide-mobile">
+            ${(vet.care_teams && vet.care_teams.length > 0) ? "Yes" : "None"}
+        </td>
+        <td class="hide-mobile">
+            <select>
+                ${livingOptions.map(opt => `<option value="${opt}"${notes.living_situation === opt ? ' selected' : ''}>${opt}</option>`).join('')}
+            </select>
+        </td>
+        <td class="hide-mobile">
+            <input type="date" value="${notes.last_contact || ''}">
+        </td>
+        <td class="hide-mobile">
+            <span class="notes-preview clickable" title="${notes.case_notes || ''}" onclick="openNotesModal('${vet.id}', '${notes.case_notes || ''}', this.parentElement.parentElement.querySelector('select').value, this.parentElement.parentElement.querySelector('input').value)">
+                ${notes.case_notes && notes.case_notes.length > 0 ? (notes.case_notes.length > 60 ? notes.case_notes.slice(0, 60) + '…' : notes.case_notes) : '—'}
+            </span>
+        </td>
+        <td class="hide-mobile">${(vet.upcoming_appointments && vet.upcoming_appointments.length > 0) ? new Date(vet.upcoming_appointments[0].date).toLocaleString() : ''}</td>
+        <td class="hide-mobile">
+            <button class="save-btn button-green" onclick="saveNotes('${vet.id}', this)">Save</button>
+            <span class="save-success" style="display:none;"></span>
+        </td>
+        <td class="hide-mobile"><button class="button-green" onclick="toggleDetails(${idx}, cachedVeterans[${idx}])">Details</button></td>
+        <td class="hide-mobile"><button class="button-green" onclick="reassignVeteran('${vet.id}')">Reassign</button></td>
+    `;
+
+    // Details row (hidden by default, shown on click)
+    const detailsTr = document.createElement('tr');
+    detailsTr.className = 'expand-row';
+    detailsTr.id = `details-row-${idx}`;
+    detailsTr.style.display = 'none';
+    const detailsTd = document.createElement('td');
+    detailsTd.colSpan = 11;
+    detailsTd.innerHTML = `
+        <div class="mobile-details">
+            ${renderDetails(vet)}
+            <div style="margin-top:12px;">
+                <button class="button-green" onclick="reassignVeteran('${vet.id}')">Reassign</button>
+                <button class="button-green" onclick="openNotesModal('${vet.id}', '${notes.case_notes || ''}', '${notes.living_situation || ''}', '${notes.last_contact || ''}')">Edit Notes</button>
+            </div>
+        </div>
+    `;
+    detailsTr.appendChild(detailsTd);
+    return [tr, detailsTr];
+}
+
 /**
  * Renders the expanded details for a veteran, including demographics, care teams, appointments, consults, and radiology orders.
  * @param {Object} vet - Veteran object
@@ -191,7 +251,11 @@ function renderTable(veterans) {
  */
 function renderDetails(vet) {
     let html = '<div style="padding:10px;">';
-    if (vet.token_status && vet.token_status !== "active") {
+    if (vet.token_status === "unavailable") {
+        html += `<div style="color:#7f8c8d; font-weight:bold; margin-bottom:8px;">
+            ⚠ VA data is temporarily unavailable. Consent is not affected; reload to try again.
+        </div>`;
+    } else if (vet.token_status && vet.token_status !== "active") {
         html += `<div style="color:#e74c3c; font-weight:bold; margin-bottom:8px;">
             ⚠ Consent is ${vet.token_status === "revoked" ? "revoked" : "expired"}. Case manager access is restricted.
         </div>`;
@@ -319,19 +383,19 @@ function closeNotesModal() {
  * Saves notes for a veteran from the modal.
  */
 document.getElementById('saveNotesBtn').onclick = function() {
-    const newNotes = document.getElementById('modalNotes').value;
+    const notes = {
+        veteran_id: currentNotesVetId,
+        living_situation: currentNotesLiving,
+        last_contact: currentNotesContact,
+        case_notes: document.getElementById('modalNotes').value
+    };
     fetch('/api/case_notes', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-            icn: currentNotesVetId,
-            living_situation: currentNotesLiving,
-            last_contact: currentNotesContact,
-            case_notes: newNotes
-        })
+        body: JSON.stringify({ ...notes, icn: notes.veteran_id })
     }).then(r => r.json()).then(resp => {
         closeNotesModal();
-        fetchVeterans();
+        if (resp.success) applyCaseNotes(notes);
     });
 };
 
@@ -355,6 +419,8 @@ function saveNotes(vetId, btn) {
     }).then(r => r.json()).then(resp => {
         const saveMsg = tr.querySelector('.save-success');
         if (resp.success) {
+            const vet = cachedVeterans.find(v => v.id === vetId);
+            if (vet) vet.notes = { living_situation: livingSel.value, last_contact: contactInput.value, case_notes: notesPreview.title || '' };
             saveMsg.textContent = "Saved!";
             saveMsg.style.display = "";
             setTimeout(() => saveMsg.style.display = "none", 1500);
@@ -406,14 +472,77 @@ document.getElementById('confirmReassignBtn').onclick = function() {
     .then(resp => {
         if (resp.success) {
             alert("Veteran reassigned successfully!");
+            applyReassignment({ veteran_id: reassignVetId, case_manager_id: newCaseManagerId });
             closeReassignModal();
-            fetchVeterans();
         } else {
             alert(resp.error || "Failed to reassign veteran.");
         }
     });
 };
 
+/**
+ * Opens the transfer modal for moving one case manager's whole caseload.
+ */
+function openTransferModal() {
+    loadCaseManagersForReassign().then(caseManagers => {
+        ['transferFromSelect', 'transferToSelect'].forEach(id => {
+            const select = document.getElementById(id);
+            select.innerHTML = '';
+            caseManagers.forEach(cm => {
+                const option = document.createElement('option');
+                option.value = cm.id;
+                option.textContent = cm.username;
+                select.appendChild(option);
+            });
+        });
+        const selected = document.getElementById('caseManagerFilter').value;
+        if (selected && selected !== "ALL") {
+            document.getElementById('transferFromSelect').value = selected;
+        }
+        document.getElementById('transferModal').style.display = 'block';
+    });
+}
+
+/**
+ * Closes the transfer modal.
+ */
+function closeTransferModal() {
+    document.getElementById('transferModal').style.display = 'none';
+}
+
+/**
+ * Confirms the caseload transfer: one bulk request, applied all-or-nothing.
+ */
+document.getElementById('confirmTransferBtn').onclick = function() {
+    const fromId = document.getElementById('transferFromSelect').value;
+    const toId = document.getElementById('transferToSelect').value;
+    if (!fromId || !toId) return;
+    if (fromId === toId) {
+        alert("Choose two different case managers.");
+        return;
+    }
+    fetch('/api/reassign_veterans', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            from_case_manager_id: parseInt(fromId),
+            to_case_manager_id: parseInt(toId)
+        })
+    })
+    .then(r => r.json())
+    .then(resp => {
+        if (resp.success) {
+            alert(resp.message);
+            closeTransferModal();
+            // Reload whichever view is selected
+            document.getElementById('caseManagerFilter').dispatchEvent(new Event('change'));
+        } else {
+            const details = (resp.errors || []).map(e => e.error).join("\n");
+            alert((resp.error || "Failed to transfer caseload.") + (details ? "\n" + details : ""));
+        }
+    });
+};
+
 // =========================
 // Table Filtering & Details
 // =========================
@@ -485,6 +614,164 @@ function applyFilter() {
     });
 }
 
+// =========================
+// Live Updates (Server-Sent Events)
+// =========================
+
+/**
+ * True if a veteran of this case manager belongs in the current view.
+ */
+function inCurrentView(caseManagerId) {
+    const selected = document.getElementById('caseManagerFilter').value;
+    return selected === "" || selected === "ALL" || String(selected) === String(caseManagerId);
+}
+
+/**
+ * Updates a veteran's cached case notes and re-renders just that row.
+ */
+function applyCaseNotes(data) {
+    const idx = cachedVeterans.findIndex(v => v.id === data.veteran_id);
+    if (idx === -1) return;
+    cachedVeterans[idx].notes = {
+        living_situation: data.living_situation,
+        last_contact: data.last_contact,
+        case_notes: data.case_notes
+    };
+    updateRow(idx);
+}
+
+/**
+ * Marks a veteran's consent as revoked and re-renders that row.
+ */
+function applyConsentRevoked(data) {
+    const idx = cachedVeterans.findIndex(v => v.id === data.veteran_id);
+    if (idx === -1) return;
+    cachedVeterans[idx].token_status = "revoked";
+    updateRow(idx);
+}
+
+// Veterans moved into the current view whose summaries are pending or in
+// flight: id -> their latest case manager id. A bulk transfer sends one event
+// per veteran, so arrivals are collected for ARRIVALS_WINDOW_MS and fetched
+// together.
+const ARRIVALS_WINDOW_MS = 300;
+const arrivingVeterans = new Map();
+let queuedArrivals = [];
+let arrivalsTimer = null;
+
+/**
+ * Moves a veteran into or out of the current view after a reassignment.
+ * Veterans new to the view are queued for one batched summary fetch.
+ */
+function applyReassignment(data) {
+    const caseManagerId = String(data.case_manager_id);
+    if (arrivingVeterans.has(data.veteran_id)) {
+        // Already on its way in; the latest move decides where it lands
+        arrivingVeterans.set(data.veteran_id, caseManagerId);
+        return;
+    }
+    const idx = cachedVeterans.findIndex(v => v.id === data.veteran_id);
+    if (!inCurrentView(caseManagerId)) {
+        if (idx !== -1) {
+            cachedVeterans.splice(idx, 1);
+            scheduleRender();
+        }
+        return;
+    }
+    if (idx !== -1) {
+        cachedVeterans[idx].case_manager_id = caseManagerId;
+        return;
+    }
+    arrivingVeterans.set(data.veteran_id, caseManagerId);
+    queuedArrivals.push(data.veteran_id);
+    if (!arrivalsTimer) {
+        arrivalsTimer = setTimeout(fetchArrivals, ARRIVALS_WINDOW_MS);
+    }
+}
+
+/**
+ * Fetches summaries for the queued arrivals (chunked by fetchSummaries) and
+ * adds those still in the current view.
+ */
+async function fetchArrivals() {
+    arrivalsTimer = null;
+    const ids = [];
+    queuedArrivals.forEach(id => {
+        if (inCurrentView(arrivingVeterans.get(id))) ids.push(id);
+        else arrivingVeterans.delete(id);  // moved out again before the fetch
+    });
+    queuedArrivals = [];
+    const fetched = await fetchSummaries(ids.map(id => ({ id, case_manager_id: arrivingVeterans.get(id) })));
+    let added = false;
+    fetched.forEach(vet => {
+        const caseManagerId = arrivingVeterans.get(vet.id);
+        arrivingVeterans.delete(vet.id);
+        if (inCurrentView(caseManagerId) && !cachedVeterans.some(v => v.id === vet.id)) {
+            cachedVeterans.push({ ...vet, case_manager_id: caseManagerId });
+            added = true;
+        }
+    });
+    if (added) scheduleRender();
+}
+
+/**
+ * Adds or refreshes a veteran who (re)approved access; their token changed,
+ * so the summary is fetched again.
+ */
+async function applyAssignment(data) {
+    const veteran = data.veteran;
+    const idx = cachedVeterans.findIndex(v => v.id === veteran.id);
+    if (!inCurrentView(veteran.case_manager_id)) {
+        if (idx !== -1) {
+            cachedVeterans.splice(idx, 1);
+            scheduleRender();
+        }
+        return;
+    }
+    const [vet] = await fetchSummaries([veteran]);
+    const current = cachedVeterans.findIndex(v => v.id === vet.id);
+    if (current === -1) {
+        cachedVeterans.push(vet);
+        scheduleRender();
+    } else {
+        cachedVeterans[current] = { ...vet, notes: cachedVeterans[current].notes };
+        updateRow(current);
+    }
+}
+
+/**
+ * Subscribes to /api/events and patches cachedVeterans as changes arrive.
+ * The browser reconnects (resuming after the last event) on its own; a
+ * "reset" means events were missed, so the current view is reloaded.
+ * A stream refused with a 503 (the server is at its stream limit) is not
+ * retried by the browser, so it is reopened after a jittered delay, and
+ * the view is reloaded once the new stream opens.
+ * @param {boolean} resubscribing - True when reopening after a refusal.
+ */
+function subscribeToChanges(resubscribing = false) {
+    if (!window.EventSource) return;
+    const source = new EventSource('/api/events');
+    const reloadView = () => document.getElementById('caseManagerFilter').dispatchEvent(new Event('change'));
+    if (resubscribing) {
+        source.addEventListener('open', reloadView, { once: true });
+    }
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(() => subscribeToChanges(true), 15000 + Math.random() * 30000);
+        }
+    });
+    const handlers = {
+        case_notes_updated: applyCaseNotes,
+        consent_revoked: applyConsentRevoked,
+        veteran_reassigned: applyReassignment,
+        veteran_assigned: applyAssignment,
+    };
+    Object.entries(handlers).forEach(([type, handler]) => {
+        source.addEventListener(type, e => handler(JSON.parse(e.data)));
+    });
+    source.addEventListener('reset', reloadView);
+}
+
 // =========================
 // Page Initialization
 // =========================
@@ -533,4 +820,7 @@ document.addEventListener('DOMContentLoaded', async () => {
             await fetchVeteransByCaseManager(selectedCaseManagerId);
         }
     });
+
+    // Keep the table current without refetching
+    subscribeToChanges();
 });
\ No newline at end of file
@@ -0,0 +1,115 @@
+import re
+import sys
+import json
+import random
+import logging
+
+# =========================
+# Redaction
+# =========================
+
+# Dict keys whose values never reach the logs
+SENSITIVE_KEYS = {
+    "access_token", "refresh_token", "id_token", "client_secret", "password",
+    "authorization", "ssn",
+}
+REDACTED = "[REDACTED]"
+
+SSN_PATTERN = re.compile(r"\b\d{3}-\d{2}-\d{4}\b")
+BEARER_PATTERN = re.compile(r"(Bearer\s+)[\w\-.~+/=]+", re.IGNORECASE)
+# key=value / "key": "value" pairs in already formatted text (query strings, dict reprs, JSON)
+SECRET_PAIR_PATTERN = re.compile(
+    r"""((?:access_token|refresh_token|id_token|client_secret|password|ssn)['"]?\s*[:=]\s*['"]?)[^'"&\s,}]+""",
+    re.IGNORECASE)
+
+def redact_text(text):
+    """Mask SSNs, bearer tokens and token/secret fields in a formatted string."""
+    text = SSN_PATTERN.sub("***-**-****", text)
+    text = BEARER_PATTERN.sub(r"\1" + REDACTED, text)
+    return SECRET_PAIR_PATTERN.sub(r"\1" + REDACTED, text)
+
+def redact(value):
+    """Copy of a JSON-like value with sensitive keys replaced and SSNs masked in strings."""
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in SENSITIVE_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return SSN_PATTERN.sub("***-**-****", value)
+    return value
+
+# =========================
+# Formatters
+# =========================
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+def record_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS}
+
+class TextFormatter(logging.Formatter):
+    """'time LEVEL logger: message key=value ...' with secrets masked."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return redact_text(line)
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any extra={...} fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return redact_text(json.dumps(entry, default=str))
+
+# =========================
+# Setup & Payload Logging
+# =========================
+
+body_logging = {"enabled": False, "sample_rate": 1.0, "max_chars": 2000}
+
+def configure_logging(level="INFO", fmt="text", bodies=False, sample_rate=1.0, max_chars=2000):
+    """
+    Send all log records to stdout at `level` in text or JSON lines. Payload
+    dumps (log_body) are written only when `bodies` is on and DEBUG is
+    enabled; dumps longer than max_chars are sampled at sample_rate and
+    truncated.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if getattr(h, "ssvf_handler", False)]:
+        root.removeHandler(existing)
+    handler.ssvf_handler = True
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    body_logging.update(enabled=bodies, sample_rate=sample_rate, max_chars=max_chars)
+
+def log_body(logger, payload, msg, *args):
+    """
+    Log a JSON payload at DEBUG, redacted and compact. Nothing is serialized
+    unless body logging is on and DEBUG is enabled for this logger.
+    """
+    if not body_logging["enabled"] or not logger.isEnabledFor(logging.DEBUG):
+        return
+    text = json.dumps(redact(payload), separators=(",", ":"), default=str)
+    max_chars = body_logging["max_chars"]
+    if len(text) > max_chars:
+        if random.random() >= body_logging["sample_rate"]:
+            return
+        text = f"{text[:max_chars]}... ({len(text)} chars)"
+    logger.debug(msg + ": %s", *args, text)
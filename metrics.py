@@ -0,0 +1,146 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Prometheus Metrics
+# =========================
+
+# Seconds; covers cache hits (sub-millisecond) through slow upstream fan-outs
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """A labeled histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labelvalues):
+        labelvalues = tuple(str(v) for v in labelvalues)
+        with self.lock:
+            series = self.series.get(labelvalues)
+            if series is None:
+                series = self.series[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for labelvalues, values in sorted(series.items()):
+            for bound, count in zip(self.buckets + (float("inf"),), values[:len(self.buckets)] + [values[-1]]):
+                labels = _format_labels(self.labelnames, labelvalues, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    A gauge or counter whose samples are read at scrape time from
+    fn() -> [(label values tuple, value), ...], e.g. existing stats dicts.
+    """
+
+    def __init__(self, name, help_text, metric_type, fn, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for labelvalues, value in self.fn():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                log.error("Could not render metric %s: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+# =========================
+# Per-Request Phase Timing
+# =========================
+
+_request = threading.local()
+
+def begin_request():
+    """Start attributing phase time on this thread to a new request."""
+    _request.phases = {}
+    _request.depth = 0
+    _request.started = time.perf_counter()
+
+def end_request():
+    """Stop timing; returns (total seconds, {phase: seconds}) or (None, {}) if no request was started."""
+    started = getattr(_request, "started", None)
+    phases = getattr(_request, "phases", {})
+    _request.started = None
+    _request.phases = {}
+    if started is None:
+        return None, {}
+    return time.perf_counter() - started, phases
+
+@contextmanager
+def request_phase(name):
+    """
+    Attribute the time spent in this block to a phase (e.g. "upstream") of
+    the request running on this thread. Nested phases count once, for the
+    outermost block; outside a request this is a no-op.
+    """
+    if getattr(_request, "started", None) is None or _request.depth:
+        yield
+        return
+    _request.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _request.depth -= 1
+        add_phase_time(name, time.perf_counter() - started)
+
+def add_phase_time(name, seconds):
+    """Add already measured time to a phase of the current request (ignored inside another phase)."""
+    if getattr(_request, "started", None) is None or _request.depth:
+        return
+    _request.phases[name] = _request.phases.get(name, 0.0) + seconds
@@ -0,0 +1,180 @@
+import time
+import logging
+import threading
+from concurrent.futures import Future
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Request Coalescing
+# =========================
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls: while a call for a key is running, later
+    callers for the same key wait for its result instead of starting their
+    own. Works across threads and event loops because every flight is a
+    concurrent.futures.Future (async callers wrap it with asyncio.wrap_future).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> Future
+        self.counters = {"calls": 0, "shared": 0}
+
+    def begin(self, key):
+        """Join or start the flight for key; returns (future, leader). The leader must call finish()."""
+        with self.lock:
+            self.counters["calls"] += 1
+            future = self.flights.get(key)
+            if future is not None:
+                self.counters["shared"] += 1
+                return future, False
+            future = self.flights[key] = Future()
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        """Publish the leader's result (or exception) to everyone waiting on the flight."""
+        with self.lock:
+            if self.flights.get(key) is future:
+                del self.flights[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args):
+        """Return fn(*args), shared with any concurrent call for the same key."""
+        future, leader = self.begin(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, in_flight=len(self.flights))
+
+# =========================
+# Rate Limiting
+# =========================
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` calls per second on average, bursts of
+    up to `burst`. reserve() returns how long to wait instead of sleeping,
+    so threads can time.sleep() and coroutines asyncio.sleep() on the same
+    bucket. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.counters = {"delayed": 0, "rejected": 0, "wait_seconds": 0.0}
+
+    def reserve(self, max_wait=None):
+        """Take a token; returns seconds to wait before using it, or None (nothing taken) if that exceeds max_wait."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                self.counters["rejected"] += 1
+                return None
+            self.tokens -= 1
+            if wait:
+                self.counters["delayed"] += 1
+                self.counters["wait_seconds"] += wait
+            return wait
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, rate=self.rate, burst=self.burst)
+
+# =========================
+# Circuit Breaker
+# =========================
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency. After `threshold` consecutive
+    failures (errors, or calls slower than `slow_call` seconds) the circuit
+    opens and calls are refused for `cooldown` seconds. Then one probe call
+    is let through (half-open): success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(self, name, threshold, cooldown, slow_call=None):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.slow_call = slow_call
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self.counters = {"opened": 0, "rejected": 0}
+
+    def _admits(self, now):
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return now - self.opened_at >= self.cooldown
+        # half-open: one probe at a time (a probe that never reported back expires)
+        return self.probe_started is None or now - self.probe_started >= self.cooldown
+
+    def allow(self):
+        """True if a call may go ahead now; in half-open state this claims the probe."""
+        with self.lock:
+            now = time.monotonic()
+            if not self._admits(now):
+                self.counters["rejected"] += 1
+                return False
+            if self.state != "closed":
+                self.state = "half_open"
+                self.probe_started = now
+            return True
+
+    def is_open(self):
+        """True while calls are being refused (callers should use fallbacks)."""
+        with self.lock:
+            return not self._admits(time.monotonic())
+
+    def record(self, success, seconds=0.0):
+        """Report the outcome of a call."""
+        failed = not success or (self.slow_call is not None and seconds > self.slow_call)
+        with self.lock:
+            if not failed:
+                if self.state != "closed":
+                    log.info("Circuit %s closed", self.name)
+                self.state = "closed"
+                self.failures = 0
+                self.probe_started = None
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.counters["opened"] += 1
+                    log.warning("Circuit %s opened after %d failures; refusing calls for %.0fs",
+                                self.name, self.failures, self.cooldown)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probe_started = None
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, state=self.state, consecutive_failures=self.failures)
@@ -0,0 +1,124 @@
+import re
+import math
+import bisect
+
+# =========================
+# Full-Text Index
+# =========================
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+def tokenize(text):
+    """Lowercased words (letters and digits) of a text; "HUD-VASH" is ["hud", "vash"]."""
+    return WORD_RE.findall((text or "").lower())
+
+class TextIndex:
+    """
+    In-memory inverted index over documents made of a few text fields,
+    ranked with BM25. Fields carry a weight (a word in a weighted field
+    counts as that many occurrences). Documents are added, replaced and
+    removed one at a time, so the index never needs a rebuild. Not thread
+    safe; the owner serializes access.
+    """
+
+    def __init__(self, fields, k1=1.2, b=0.75, prefix_weight=0.5, max_expansions=50):
+        self.fields = fields  # field name -> weight
+        self.k1 = k1
+        self.b = b
+        self.prefix_weight = prefix_weight  # score factor for words matched only as a prefix
+        self.max_expansions = max_expansions  # indexed words tried per query prefix
+        self.postings = {}  # word -> {doc id: weighted count}
+        self.words = []  # sorted indexed words, for prefix lookups
+        self.docs = {}  # doc id -> (indexed field values, weighted length)
+        self.total_length = 0.0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def update(self, doc_id, doc):
+        """Index (or re-index) a document given as a dict of field values; returns False if unchanged."""
+        values = tuple(doc.get(field) or "" for field in self.fields)
+        current = self.docs.get(doc_id)
+        if current is not None and current[0] == values:
+            return False
+        self.remove(doc_id)
+        counts = {}
+        for value, weight in zip(values, self.fields.values()):
+            for word in tokenize(value):
+                counts[word] = counts.get(word, 0.0) + weight
+        if not counts:
+            return True
+        for word, count in counts.items():
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = {}
+                bisect.insort(self.words, word)
+            posting[doc_id] = count
+        length = sum(counts.values())
+        self.docs[doc_id] = (values, length)
+        self.total_length += length
+        return True
+
+    def remove(self, doc_id):
+        current = self.docs.pop(doc_id, None)
+        if current is None:
+            return
+        values, length = current
+        self.total_length -= length
+        for word in {word for value in values for word in tokenize(value)}:
+            posting = self.postings[word]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+
+    def search(self, query):
+        """
+        Documents matching every word of the query, as (doc id, score) pairs,
+        best first (ties by doc id). Each query word matches indexed words it
+        is a prefix of, scored prefix_weight times lower than an exact match.
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words or not self.docs:
+            return []
+        per_word = sorted((self._word_scores(word) for word in words), key=len)
+        scores = per_word[0]
+        for word_scores in per_word[1:]:
+            scores = {doc_id: score + word_scores[doc_id] for doc_id, score in scores.items() if doc_id in word_scores}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def _word_scores(self, word):
+        """BM25 score of each document for one query word (its best-scoring expansion)."""
+        start = bisect.bisect_left(self.words, word)
+        end = bisect.bisect_left(self.words, word + "\uffff", start,
+                              min(len(self.words), start + self.max_expansions))
+        average = self.total_length / len(self.docs)
+        scores = {}
+        for candidate in self.words[start:end]:
+            posting = self.postings[candidate]
+            idf = math.log(1 + (len(self.docs) - len(posting) + 0.5) / (len(posting) + 0.5))
+            factor = 1.0 if candidate == word else self.prefix_weight
+            for doc_id, count in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.docs[doc_id][1] / average)
+                score = factor * idf * count * (self.k1 + 1) / (count + norm)
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+        return scores
+
+def snippet(text, query, width=160):
+    """About width characters of text around its first word matching a query word (by prefix)."""
+    text = text or ""
+    words = tuple(tokenize(query))
+    start = 0
+    for match in WORD_RE.finditer(text):
+        if words and match.group().lower().startswith(words):
+            start = max(0, match.start() - width // 4)
+            break
+    if start:
+        # Begin on a word boundary
+        space = text.find(" ", start, match.start())
+        start = space + 1 if space != -1 else start
+    excerpt = text[start:start + width].strip()
+    return ("…" if start else "") + excerpt + ("…" if start + width < len(text) else "")
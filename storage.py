@@ -0,0 +1,1085 @@
+import os
+import re
+import json
+import copy
+import hashlib
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+# =========================
+# File Locking & Atomic Writes
+# =========================
+
+def _lock_fd(f, blocking=True):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+def _unlock_fd(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive cross-process lock for a data file, held on a sidecar
+    path + ".lock" file. Not reentrant: never nest two file_lock(path) calls
+    for the same path, even in one thread.
+    """
+    with open(path + ".lock", "a+") as f:
+        _lock_fd(f)
+        try:
+            yield
+        finally:
+            _unlock_fd(f)
+
+def try_lock(path):
+    """Take a non-blocking exclusive lock on path; returns the open file (keep it to hold the lock) or None."""
+    f = open(path, "a+")
+    try:
+        _lock_fd(f, blocking=False)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+def atomic_write(path, content):
+    """Write to a temp file in the same directory, fsync it, then rename it over path."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write_json(path, data):
+    atomic_write(path, json.dumps(data))
+
+def stat_key(st):
+    """Identity of a file version: atomic renames change the inode even within one mtime tick."""
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def path_key(path):
+    try:
+        return stat_key(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+def read_json_file(path, default):
+    """Return (data, key) for a JSON file, keyed by the stat of the file actually read."""
+    try:
+        with open(path, "r") as f:
+            key = stat_key(os.fstat(f.fileno()))
+            content = f.read().strip()
+    except FileNotFoundError:
+        return default, None
+    return (json.loads(content) if content else default), key
+
+# =========================
+# Timing Hook
+# =========================
+
+_observer = None
+
+def set_observer(observer):
+    """Register observer(store, operation, seconds), called after each storage load, save or query."""
+    global _observer
+    _observer = observer
+
+@contextmanager
+def timed(store, operation):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _observer is not None:
+            _observer(store, operation, time.perf_counter() - started)
+
+# =========================
+# JSON Storage
+# =========================
+
+class AssignmentIndex:
+    """
+    Immutable snapshot of assignments.json with lookup indexes.
+    Ids are indexed as strings so JSON ints and query-string values both match.
+    """
+
+    def __init__(self, agencies, version):
+        self.agencies = agencies
+        self.version = version
+        self.agencies_by_id = {}
+        self.case_managers_by_id = {}
+        self.case_managers_by_username = {}
+        self.veteran_index = {}  # icn -> [(agency, case_manager, veteran), ...]
+        for agency in agencies:
+            agency_key = str(agency["id"])
+            self.agencies_by_id[agency_key] = agency
+            for cm in agency["case_managers"]:
+                self.case_managers_by_id[(agency_key, str(cm["id"]))] = cm
+                self.case_managers_by_username[(agency_key, cm["username"].lower())] = cm
+                for v in cm["veterans"]:
+                    self.veteran_index.setdefault(v["id"], []).append((agency, cm, v))
+
+
+def plan_reassignment(current, case_manager_ids, moves, transfers):
+    """
+    Resolve a bulk reassignment against the current assignments.
+    current: {icn: case manager id} and case_manager_ids are string ids.
+    Returns ({icn: new case manager id}, errors); a veteran named twice
+    with different targets is an error.
+    """
+    targets, errors = {}, []
+    for from_id, to_id in transfers:
+        from_id, to_id = str(from_id), str(to_id)
+        for cm_id in (from_id, to_id):
+            if cm_id not in case_manager_ids:
+                errors.append({"case_manager_id": cm_id, "error": "Invalid case manager"})
+        if from_id == to_id:
+            errors.append({"case_manager_id": from_id, "error": "Cannot transfer a caseload to the same case manager"})
+        for icn, cm_id in current.items():
+            if cm_id == from_id:
+                targets[icn] = to_id
+    for icn, to_id in moves:
+        to_id = str(to_id)
+        if to_id not in case_manager_ids:
+            errors.append({"veteran_id": icn, "error": "Invalid case manager"})
+        elif icn not in current:
+            errors.append({"veteran_id": icn, "error": "Veteran not found"})
+        elif targets.get(icn, to_id) != to_id:
+            errors.append({"veteran_id": icn, "error": "Conflicting moves"})
+        else:
+            targets[icn] = to_id
+    return targets, errors
+
+
+class JsonAssignmentStore:
+    """
+    Agency/case manager/veteran assignments, loaded once from a JSON file.
+    Reads are served from an in-memory AssignmentIndex and the file is only
+    re-parsed when it changes on disk (e.g. written by another worker).
+    Returned dicts are shared with the index and must be treated as
+    read-only; use the write methods below, which lock the file across
+    processes and replace it atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.file_key = None
+        self.index = AssignmentIndex([], None)
+
+    def _current(self):
+        """Return the current index, reloading it if the file changed on disk."""
+        if path_key(self.path) != self.file_key:
+            with self.lock:
+                if path_key(self.path) != self.file_key:
+                    with timed("assignments", "load"):
+                        agencies, key = read_json_file(self.path, [])
+                    self.index = AssignmentIndex(agencies, key)
+                    self.file_key = key
+        return self.index
+
+    @property
+    def version(self):
+        """Opaque value that changes whenever the assignment data changes."""
+        return self._current().version
+
+    # --- Reads ---
+
+    def all_agencies(self):
+        """Return the full nested agency/case manager/veteran structure."""
+        return self._current().agencies
+
+    def agencies(self):
+        return [{"id": a["id"], "name": a["name"]} for a in self._current().agencies]
+
+    def agency(self, agency_id):
+        return self._current().agencies_by_id.get(str(agency_id))
+
+    def case_managers(self, agency_id):
+        agency = self.agency(agency_id)
+        return agency["case_managers"] if agency else []
+
+    def case_manager(self, agency_id, case_manager_id):
+        return self._current().case_managers_by_id.get((str(agency_id), str(case_manager_id)))
+
+    def case_manager_by_username(self, agency_id, username):
+        return self._current().case_managers_by_username.get((str(agency_id), username.lower()))
+
+    def veterans(self, agency_id, case_manager_id=None):
+        """
+        Return copies of the veterans for an agency (or one of its case
+        managers), each tagged with its case_manager_id.
+        """
+        if case_manager_id is None:
+            case_managers = self.case_managers(agency_id)
+        else:
+            cm = self.case_manager(agency_id, case_manager_id)
+            case_managers = [cm] if cm else []
+        veterans = []
+        for cm in case_managers:
+            for v in cm["veterans"]:
+                v_copy = v.copy()
+                v_copy["case_manager_id"] = cm["id"]
+                veterans.append(v_copy)
+        return veterans
+
+    def veteran_assignments(self, icn):
+        """Return [(agency, case_manager), ...] for every agency the veteran is assigned in."""
+        return [(agency, cm) for agency, cm, _ in self._current().veteran_index.get(icn, [])]
+
+    def veteran_case_manager(self, agency_id, icn):
+        """Return the case manager a veteran is assigned to within an agency, or None."""
+        for agency, cm, _ in self._current().veteran_index.get(icn, []):
+            if str(agency["id"]) == str(agency_id):
+                return cm
+        return None
+
+    # --- Writes ---
+
+    def move_veteran(self, agency_id, icn, new_case_manager_id):
+        """
+        Move a veteran to another case manager in the same agency.
+        Returns False if the veteran or case manager is not found.
+        """
+        with self.lock, file_lock(self.path):
+            agencies = copy.deepcopy(self._current().agencies)
+            agency = next((a for a in agencies if str(a["id"]) == str(agency_id)), None)
+            if not agency:
+                return False
+            new_cm = next((cm for cm in agency["case_managers"] if str(cm["id"]) == str(new_case_manager_id)), None)
+            if not new_cm:
+                return False
+            for cm in agency["case_managers"]:
+                veteran = next((v for v in cm["veterans"] if v["id"] == icn), None)
+                if veteran:
+                    cm["veterans"].remove(veteran)
+                    new_cm["veterans"].append(veteran)
+                    break
+            else:
+                return False
+            self._save(agencies)
+            return True
+
+    def reassign_veterans(self, agency_id, moves=(), transfers=()):
+        """
+        Apply many reassignments in one locked read-modify-write.
+        moves: [(icn, new case manager id)]; transfers: [(from id, to id)],
+        moving every veteran of a case manager. Everything is validated
+        against the current file first; returns (moved, errors), moved being
+        {icn: new case manager id}, and writes nothing if there are any errors.
+        """
+        with self.lock, file_lock(self.path):
+            agencies = copy.deepcopy(self._current().agencies)
+            agency = next((a for a in agencies if str(a["id"]) == str(agency_id)), None)
+            if not agency:
+                return {}, [{"error": "Invalid agency"}]
+            case_managers = {str(cm["id"]): cm for cm in agency["case_managers"]}
+            current = {v["id"]: str(cm["id"]) for cm in agency["case_managers"] for v in cm["veterans"]}
+            targets, errors = plan_reassignment(current, set(case_managers), moves, transfers)
+            if errors:
+                return {}, errors
+            moved = {icn: to for icn, to in targets.items() if current[icn] != to}
+            if not moved:
+                return {}, []
+            # Keep each list's order; moved veterans go to the end of their new list
+            arriving = {cm_id: [] for cm_id in case_managers}
+            for cm_id, cm in case_managers.items():
+                staying = []
+                for v in cm["veterans"]:
+                    (arriving[moved[v["id"]]] if v["id"] in moved else staying).append(v)
+                cm["veterans"] = staying
+            for cm_id, veterans in arriving.items():
+                case_managers[cm_id]["veterans"].extend(veterans)
+            self._save(agencies)
+            return moved, []
+
+    def assign_veteran(self, agency_id, case_manager_id, veteran):
+        """
+        Assign a veteran to a case manager, removing them from any other case
+        manager in the same agency. Returns False if the agency or case
+        manager is not found.
+        """
+        with self.lock, file_lock(self.path):
+            agencies = copy.deepcopy(self._current().agencies)
+            agency = next((a for a in agencies if str(a["id"]) == str(agency_id)), None)
+            if not agency:
+                return False
+            case_manager = next((cm for cm in agency["case_managers"] if str(cm["id"]) == str(case_manager_id)), None)
+            if not case_manager:
+                return False
+            for cm in agency["case_managers"]:
+                if cm is not case_manager:
+                    cm["veterans"] = [v for v in cm["veterans"] if v["id"] != veteran["id"]]
+            if not any(v["id"] == veteran["id"] for v in case_manager["veterans"]):
+                case_manager["veterans"].append(veteran)
+            self._save(agencies)
+            return True
+
+    def _save(self, agencies):
+        """Atomically replace the assignments file and swap in a fresh index (caller holds the file lock)."""
+        with timed("assignments", "save"):
+            atomic_write_json(self.path, agencies)
+        key = path_key(self.path)
+        self.index = AssignmentIndex(agencies, key)
+        self.file_key = key
+
+
+class JsonTokenStore:
+    """
+    OAuth tokens by ICN, stored in a single JSON file.
+    Each worker keeps the parsed file and re-reads it only when it changes;
+    writes lock the file across processes and replace it atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.cache = {}
+        self.cache_key = None
+
+    def _read(self):
+        if path_key(self.path) != self.cache_key:
+            with self.lock:
+                if path_key(self.path) != self.cache_key:
+                    with timed("tokens", "load"):
+                        self.cache, self.cache_key = read_json_file(self.path, {})
+        return self.cache
+
+    @property
+    def version(self):
+        """Changes whenever the token file changes (in any process)."""
+        self._read()
+        return self.cache_key
+
+    def all(self):
+        return dict(self._read())
+
+    def get(self, icn):
+        return self._read().get(icn)
+
+    def get_many(self, icns):
+        tokens = self._read()
+        return {icn: tokens[icn] for icn in icns if icn in tokens}
+
+    def set(self, icn, token_info):
+        with self.lock, file_lock(self.path):
+            tokens = dict(self._read())
+            tokens[icn] = token_info
+            self._save(tokens)
+
+    def set_many(self, token_infos):
+        """Store several tokens with a single file write."""
+        with self.lock, file_lock(self.path):
+            tokens = dict(self._read())
+            tokens.update(token_infos)
+            self._save(tokens)
+
+    def delete(self, icn):
+        with self.lock, file_lock(self.path):
+            tokens = dict(self._read())
+            if tokens.pop(icn, None) is not None:
+                self._save(tokens)
+
+    def _save(self, tokens):
+        log.debug("Saving tokens to %s", self.path)
+        with timed("tokens", "save"):
+            atomic_write_json(self.path, tokens)
+        self.cache, self.cache_key = tokens, path_key(self.path)
+
+
+class JsonCaseNotesStore:
+    """
+    Case notes by ICN: a JSON snapshot (case_notes.json) plus an append-only
+    journal of edits. Reads are served from an in-memory map built from the
+    snapshot and journal; each worker tails journal records appended by the
+    others and reloads when another worker compacts. Each write appends one
+    fsync'd record under a cross-process lock. A background thread
+    periodically compacts the journal into the snapshot and moves the
+    compacted records to a history file, which keeps the full edit trail.
+    """
+
+    def __init__(self, path, compact_interval=0):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.history_path = path + ".history"
+        self.lock = threading.Lock()
+        self.notes = {}
+        self.snapshot_key = None
+        self.reader = None  # journal being tailed; its inode identifies the journal generation
+        self.journal_ino = None
+        self.journal_offset = 0
+        self.journal_records = 0
+        self.journal_icns = []  # (journal offset after the record, icn) per record tailed
+        self.journal = None  # append handle
+        with self.lock:
+            self._sync()
+        if compact_interval > 0:
+            threading.Thread(target=self._compact_loop, args=(compact_interval,),
+                             name="case-notes-compactor", daemon=True).start()
+
+    # --- Keeping the in-memory map current (caller holds self.lock) ---
+
+    def _sync(self, have_file_lock=False):
+        """Tail new journal records, or reload if the snapshot or journal was replaced."""
+        journal_key = path_key(self.journal_path)
+        journal_ino = journal_key[2] if journal_key else None
+        if (path_key(self.path) != self.snapshot_key or journal_ino != self.journal_ino
+                or (journal_key and journal_key[1] < self.journal_offset)):
+            if have_file_lock:
+                self._reload()
+            else:
+                with file_lock(self.path):
+                    self._reload()
+        elif journal_key and journal_key[1] > self.journal_offset:
+            self._tail()
+
+    def _reload(self):
+        """Rebuild the map from the snapshot plus the journal (caller holds the file lock)."""
+        with timed("case_notes", "load"):
+            self.notes, self.snapshot_key = read_json_file(self.path, {})
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.journal_ino = None
+        self.journal_offset = 0
+        self.journal_records = 0
+        self.journal_icns = []
+        if os.path.exists(self.journal_path):
+            self.reader = open(self.journal_path, "rb")
+            self.journal_ino = os.fstat(self.reader.fileno()).st_ino
+            self._tail()
+            # No writer can be mid-append while we hold the lock, so leftover
+            # bytes are a torn record from a crash; cut them off so the next
+            # append starts on a fresh line
+            size = os.fstat(self.reader.fileno()).st_size
+            if size > self.journal_offset:
+                log.warning("Dropping torn record at byte %d of %s", self.journal_offset, self.journal_path)
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(self.journal_offset)
+
+    def _tail(self):
+        """Apply complete journal records past the current offset."""
+        self.reader.seek(self.journal_offset)
+        for line in self.reader:
+            if not line.endswith(b"\n"):
+                break  # still being written by another worker
+            self.journal_offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                log.warning("Skipping unreadable record in %s", self.journal_path)
+                continue
+            self.notes[record["icn"]] = record["note"]
+            self.journal_records += 1
+            self.journal_icns.append((self.journal_offset, record["icn"]))
+
+    # --- Store interface ---
+
+    @property
+    def version(self):
+        """Changes whenever any worker writes or compacts the case notes."""
+        with self.lock:
+            self._sync()
+            return (self.snapshot_key, self.journal_ino, self.journal_offset)
+
+    def all(self):
+        with self.lock:
+            self._sync()
+            return dict(self.notes)
+
+    def get(self, icn):
+        with self.lock:
+            self._sync()
+            return dict(self.notes.get(icn, {}))
+
+    def get_many(self, icns):
+        with self.lock:
+            self._sync()
+            return {icn: dict(self.notes[icn]) for icn in icns if icn in self.notes}
+
+    def changes_since(self, version):
+        """
+        {icn: note} for notes written after the given version, or None if
+        that can't be told (the journal was compacted since): re-read them all.
+        """
+        with self.lock:
+            self._sync()
+            if version is None or version[0] != self.snapshot_key or version[2] > self.journal_offset:
+                return None
+            # A journal created since (none existed at that version) holds only newer records
+            if version[1] != self.journal_ino and version[1:] != (None, 0):
+                return None
+            changed = {}
+            for offset, icn in reversed(self.journal_icns):
+                if offset <= version[2]:
+                    break
+                changed.setdefault(icn, dict(self.notes[icn]))
+            return changed
+
+    def set(self, icn, note):
+        record = json.dumps({"ts": time.time(), "icn": icn, "note": note})
+        with self.lock, file_lock(self.path):
+            if self.journal is not None:
+                current = path_key(self.journal_path)
+                if current is None or os.fstat(self.journal.fileno()).st_ino != current[2]:
+                    # Another worker rotated the journal since we opened it
+                    self.journal.close()
+                    self.journal = None
+            if self.journal is None:
+                self.journal = open(self.journal_path, "a")
+            with timed("case_notes", "save"):
+                self.journal.write(record + "\n")
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+            self._sync(have_file_lock=True)
+
+    def compact(self):
+        """
+        Fold the journal into a new snapshot, archive the journal records,
+        then swap in an empty journal. Snapshot and journal are both replaced
+        by rename, so other workers see new inodes and reload. Replaying a
+        journal over a snapshot that already contains it is harmless, so a
+        crash between the steps loses nothing.
+        """
+        with self.lock, file_lock(self.path):
+            self._sync(have_file_lock=True)
+            if self.journal_records == 0:
+                return
+            started = time.perf_counter()
+            atomic_write_json(self.path, self.notes)
+            with open(self.journal_path, "rb") as src, open(self.history_path, "ab") as dst:
+                dst.write(src.read(self.journal_offset))
+                dst.flush()
+                os.fsync(dst.fileno())
+            atomic_write(self.journal_path, "")
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            log.info("Compacted %d case note records into %s", self.journal_records, self.path)
+            self._reload()
+            if _observer is not None:
+                _observer("case_notes", "compact", time.perf_counter() - started)
+
+    def _compact_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.compact()
+            except Exception as e:
+                log.error("Case notes compaction failed: %s", e)
+
+
+class JsonSnapshotStore:
+    """
+    Per-veteran FHIR snapshots (see incremental sync in app.py), one JSON
+    file per ICN in a directory so a sync rewrites only its own veteran.
+    """
+
+    SAFE_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, icn):
+        name = icn if self.SAFE_NAME.fullmatch(icn) else hashlib.sha1(icn.encode()).hexdigest()
+        return os.path.join(self.directory, name + ".json")
+
+    def get(self, icn):
+        with timed("fhir_snapshots", "load"):
+            data, _ = read_json_file(self._path(icn), None)
+        return data
+
+    def set(self, icn, snapshot):
+        with timed("fhir_snapshots", "save"):
+            atomic_write_json(self._path(icn), snapshot)
+
+    def delete(self, icn):
+        try:
+            os.unlink(self._path(icn))
+        except FileNotFoundError:
+            pass
+
+
+class JsonStorage:
+    """The original JSON-file storage: assignments, tokens and case notes (plus FHIR snapshots)."""
+
+    def __init__(self, assignments_path, tokens_path, case_notes_path, compact_interval=0, snapshots_path=None):
+        self.assignments = JsonAssignmentStore(assignments_path)
+        self.tokens = JsonTokenStore(tokens_path)
+        self.case_notes = JsonCaseNotesStore(case_notes_path, compact_interval)
+        self.snapshots = JsonSnapshotStore(snapshots_path) if snapshots_path else None
+
+# =========================
+# SQLite Storage
+# =========================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS agencies (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS case_managers (
+    agency_id INTEGER NOT NULL REFERENCES agencies(id),
+    id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (agency_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_case_managers_username ON case_managers (agency_id, username COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS veterans (
+    agency_id INTEGER NOT NULL,
+    icn TEXT NOT NULL,
+    case_manager_id INTEGER NOT NULL,
+    name TEXT,
+    dob TEXT,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (agency_id, icn),
+    FOREIGN KEY (agency_id, case_manager_id) REFERENCES case_managers (agency_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_veterans_case_manager ON veterans (agency_id, case_manager_id, seq);
+CREATE INDEX IF NOT EXISTS idx_veterans_icn ON veterans (icn);
+CREATE TABLE IF NOT EXISTS tokens (
+    icn TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS case_notes (
+    icn TEXT PRIMARY KEY,
+    living_situation TEXT,
+    last_contact TEXT,
+    case_notes TEXT,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS fhir_snapshots (
+    icn TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+def _int_id(value):
+    """Coerce an agency/case manager id from JSON or a query string; None if invalid."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SQLiteDatabase:
+    """Per-thread SQLite connections (WAL mode) plus a write-transaction helper."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self.local.conn = conn
+        return conn
+
+    def query(self, sql, params=()):
+        with timed("sqlite", "query"):
+            return self.connection().execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        with timed("sqlite", "query"):
+            return self.connection().execute(sql, params).fetchone()
+
+    def meta_value(self, key, default="0"):
+        row = self.query_one("SELECT value FROM meta WHERE key = ?", (key,))
+        return row["value"] if row else default
+
+    def bump_counter(self, conn, key):
+        """Increment a version counter in meta (inside the caller's transaction)."""
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1", (key,))
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE so concurrent writers (threads or processes) serialize."""
+        conn = self.connection()
+        with timed("sqlite", "transaction"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+
+class SQLiteAssignmentStore:
+    """Assignments in SQLite; same interface as JsonAssignmentStore."""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def version(self):
+        return self.db.meta_value("assignments_version")
+
+    # --- Reads ---
+
+    def all_agencies(self):
+        agencies = []
+        for a in self.db.query("SELECT id, name FROM agencies ORDER BY seq"):
+            agency = {"id": a["id"], "name": a["name"], "case_managers": []}
+            for cm in self.case_managers(a["id"]):
+                cm["veterans"] = [
+                    {"id": v["id"], "name": v["name"], "dob": v["dob"]}
+                    for v in self.veterans(a["id"], cm["id"])
+                ]
+                agency["case_managers"].append(cm)
+            agencies.append(agency)
+        return agencies
+
+    def agencies(self):
+        return [dict(r) for r in self.db.query("SELECT id, name FROM agencies ORDER BY seq")]
+
+    def agency(self, agency_id):
+        row = self.db.query_one("SELECT id, name FROM agencies WHERE id = ?", (_int_id(agency_id),))
+        return dict(row) if row else None
+
+    def case_managers(self, agency_id):
+        rows = self.db.query(
+            "SELECT id, username, password FROM case_managers WHERE agency_id = ? ORDER BY seq",
+            (_int_id(agency_id),))
+        return [dict(r) for r in rows]
+
+    def case_manager(self, agency_id, case_manager_id):
+        row = self.db.query_one(
+            "SELECT id, username, password FROM case_managers WHERE agency_id = ? AND id = ?",
+            (_int_id(agency_id), _int_id(case_manager_id)))
+        return dict(row) if row else None
+
+    def case_manager_by_username(self, agency_id, username):
+        row = self.db.query_one(
+            "SELECT id, username, password FROM case_managers WHERE agency_id = ? AND username = ? COLLATE NOCASE",
+            (_int_id(agency_id), username))
+        return dict(row) if row else None
+
+    def veterans(self, agency_id, case_manager_id=None):
+        sql = (
+            "SELECT v.icn AS id, v.name, v.dob, v.case_manager_id FROM veterans v "
+            "JOIN case_managers cm ON cm.agency_id = v.agency_id AND cm.id = v.case_manager_id "
+            "WHERE v.agency_id = ?"
+        )
+        params = [_int_id(agency_id)]
+        if case_manager_id is not None:
+            sql += " AND v.case_manager_id = ?"
+            params.append(_int_id(case_manager_id))
+        sql += " ORDER BY cm.seq, v.seq"
+        return [dict(r) for r in self.db.query(sql, params)]
+
+    def veteran_assignments(self, icn):
+        rows = self.db.query(
+            "SELECT a.id AS agency_id, a.name AS agency_name, cm.id, cm.username, cm.password "
+            "FROM veterans v JOIN agencies a ON a.id = v.agency_id "
+            "JOIN case_managers cm ON cm.agency_id = v.agency_id AND cm.id = v.case_manager_id "
+            "WHERE v.icn = ? ORDER BY a.seq", (icn,))
+        return [
+            ({"id": r["agency_id"], "name": r["agency_name"]},
+             {"id": r["id"], "username": r["username"], "password": r["password"]})
+            for r in rows
+        ]
+
+    def veteran_case_manager(self, agency_id, icn):
+        row = self.db.query_one(
+            "SELECT cm.id, cm.username, cm.password FROM veterans v "
+            "JOIN case_managers cm ON cm.agency_id = v.agency_id AND cm.id = v.case_manager_id "
+            "WHERE v.agency_id = ? AND v.icn = ?", (_int_id(agency_id), icn))
+        return dict(row) if row else None
+
+    # --- Writes ---
+
+    def move_veteran(self, agency_id, icn, new_case_manager_id):
+        agency_id, new_case_manager_id = _int_id(agency_id), _int_id(new_case_manager_id)
+        with self.db.transaction() as conn:
+            if not conn.execute("SELECT 1 FROM case_managers WHERE agency_id = ? AND id = ?",
+                                (agency_id, new_case_manager_id)).fetchone():
+                return False
+            cur = conn.execute(
+                "UPDATE veterans SET case_manager_id = ?, seq = ? WHERE agency_id = ? AND icn = ?",
+                (new_case_manager_id, self._next_seq(conn, agency_id), agency_id, icn))
+            if cur.rowcount == 0:
+                return False
+            self.db.bump_counter(conn, "assignments_version")
+        return True
+
+    def reassign_veterans(self, agency_id, moves=(), transfers=()):
+        agency_id = _int_id(agency_id)
+        with self.db.transaction() as conn:
+            if not conn.execute("SELECT 1 FROM agencies WHERE id = ?", (agency_id,)).fetchone():
+                return {}, [{"error": "Invalid agency"}]
+            case_manager_ids = {str(r["id"]) for r in conn.execute(
+                "SELECT id FROM case_managers WHERE agency_id = ?", (agency_id,))}
+            current = {r["icn"]: str(r["case_manager_id"]) for r in conn.execute(
+                "SELECT icn, case_manager_id FROM veterans WHERE agency_id = ? ORDER BY seq", (agency_id,))}
+            targets, errors = plan_reassignment(current, case_manager_ids, moves, transfers)
+            if errors:
+                return {}, errors
+            moved = [(icn, to) for icn, to in targets.items() if current[icn] != to]
+            if not moved:
+                return {}, []
+            # Moved veterans go to the end of their new list, in their current order
+            order = {icn: i for i, icn in enumerate(current)}
+            moved.sort(key=lambda m: order[m[0]])
+            seq = self._next_seq(conn, agency_id)
+            conn.executemany(
+                "UPDATE veterans SET case_manager_id = ?, seq = ? WHERE agency_id = ? AND icn = ?",
+                [(int(to), seq + i, agency_id, icn) for i, (icn, to) in enumerate(moved)])
+            self.db.bump_counter(conn, "assignments_version")
+        return dict(moved), []
+
+    def assign_veteran(self, agency_id, case_manager_id, veteran):
+        agency_id, case_manager_id = _int_id(agency_id), _int_id(case_manager_id)
+        with self.db.transaction() as conn:
+            if not conn.execute("SELECT 1 FROM case_managers WHERE agency_id = ? AND id = ?",
+                                (agency_id, case_manager_id)).fetchone():
+                return False
+            current = conn.execute("SELECT case_manager_id FROM veterans WHERE agency_id = ? AND icn = ?",
+                                   (agency_id, veteran["id"])).fetchone()
+            if current and current["case_manager_id"] == case_manager_id:
+                return True
+            conn.execute(
+                "INSERT OR REPLACE INTO veterans (agency_id, icn, case_manager_id, name, dob, seq) VALUES (?, ?, ?, ?, ?, ?)",
+                (agency_id, veteran["id"], case_manager_id, veteran.get("name"), veteran.get("dob"),
+                 self._next_seq(conn, agency_id)))
+            self.db.bump_counter(conn, "assignments_version")
+        return True
+
+    def _next_seq(self, conn, agency_id):
+        row = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM veterans WHERE agency_id = ?", (agency_id,)).fetchone()
+        return row[0]
+
+
+class SQLiteTokenStore:
+    """OAuth tokens by ICN in SQLite; same interface as JsonTokenStore."""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def version(self):
+        return self.db.meta_value("tokens_version")
+
+    def all(self):
+        return {r["icn"]: json.loads(r["data"]) for r in self.db.query("SELECT icn, data FROM tokens")}
+
+    def get(self, icn):
+        row = self.db.query_one("SELECT data FROM tokens WHERE icn = ?", (icn,))
+        return json.loads(row["data"]) if row else None
+
+    def get_many(self, icns):
+        icns = list(icns)
+        tokens = {}
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(icns), 500):
+            chunk = icns[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for r in self.db.query(f"SELECT icn, data FROM tokens WHERE icn IN ({placeholders})", chunk):
+                tokens[r["icn"]] = json.loads(r["data"])
+        return tokens
+
+    def set(self, icn, token_info):
+        with self.db.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO tokens (icn, data, updated_at) VALUES (?, ?, ?)",
+                         (icn, json.dumps(token_info), time.time()))
+            self.db.bump_counter(conn, "tokens_version")
+
+    def set_many(self, token_infos):
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO tokens (icn, data, updated_at) VALUES (?, ?, ?)",
+                             [(icn, json.dumps(info), now) for icn, info in token_infos.items()])
+            self.db.bump_counter(conn, "tokens_version")
+
+    def delete(self, icn):
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM tokens WHERE icn = ?", (icn,))
+            self.db.bump_counter(conn, "tokens_version")
+
+
+class SQLiteCaseNotesStore:
+    """Case notes by ICN in SQLite; same interface as JsonCaseNotesStore."""
+
+    FIELDS = ("living_situation", "last_contact", "case_notes")
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def version(self):
+        return self.db.meta_value("case_notes_version")
+
+    def all(self):
+        rows = self.db.query("SELECT icn, living_situation, last_contact, case_notes FROM case_notes")
+        return {r["icn"]: {f: r[f] for f in self.FIELDS} for r in rows}
+
+    def get(self, icn):
+        row = self.db.query_one(
+            "SELECT living_situation, last_contact, case_notes FROM case_notes WHERE icn = ?", (icn,))
+        return {f: row[f] for f in self.FIELDS} if row else {}
+
+    def get_many(self, icns):
+        icns = list(icns)
+        notes = {}
+        for i in range(0, len(icns), 500):
+            chunk = icns[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for r in self.db.query(
+                    f"SELECT icn, living_situation, last_contact, case_notes FROM case_notes WHERE icn IN ({placeholders})",
+                    chunk):
+                notes[r["icn"]] = {f: r[f] for f in self.FIELDS}
+        return notes
+
+    def changes_since(self, version):
+        """{icn: note} for notes written after the given version (each row records the version it was written at)."""
+        if version is None:
+            return None
+        rows = self.db.query(
+            "SELECT icn, living_situation, last_contact, case_notes FROM case_notes WHERE version > ?", (int(version),))
+        return {r["icn"]: {f: r[f] for f in self.FIELDS} for r in rows}
+
+    def set(self, icn, note):
+        with self.db.transaction() as conn:
+            self.db.bump_counter(conn, "case_notes_version")
+            conn.execute(
+                "INSERT OR REPLACE INTO case_notes (icn, living_situation, last_contact, case_notes, updated_at, version) "
+                "VALUES (?, ?, ?, ?, ?, (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'case_notes_version'))",
+                (icn, note.get("living_situation"), note.get("last_contact"), note.get("case_notes"), time.time()))
+
+
+class SQLiteSnapshotStore:
+    """Per-veteran FHIR snapshots in SQLite; same interface as JsonSnapshotStore."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, icn):
+        row = self.db.query_one("SELECT data FROM fhir_snapshots WHERE icn = ?", (icn,))
+        return json.loads(row["data"]) if row else None
+
+    def set(self, icn, snapshot):
+        with self.db.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO fhir_snapshots (icn, data, updated_at) VALUES (?, ?, ?)",
+                         (icn, json.dumps(snapshot), time.time()))
+
+    def delete(self, icn):
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM fhir_snapshots WHERE icn = ?", (icn,))
+
+
+class SQLiteStorage:
+    """
+    SQLite storage for assignments, tokens, case notes and FHIR snapshots.
+    On first use the existing JSON files are imported (one-shot migration).
+    """
+
+    def __init__(self, path, assignments_path=None, tokens_path=None, case_notes_path=None):
+        self.db = SQLiteDatabase(path)
+        self.db.connection().executescript(SQLITE_SCHEMA)
+        self.upgrade_schema()
+        self.assignments = SQLiteAssignmentStore(self.db)
+        self.tokens = SQLiteTokenStore(self.db)
+        self.case_notes = SQLiteCaseNotesStore(self.db)
+        self.snapshots = SQLiteSnapshotStore(self.db)
+        self.migrate_from_json(assignments_path, tokens_path, case_notes_path)
+
+    def upgrade_schema(self):
+        """Add columns introduced after a database was created."""
+        with self.db.transaction() as conn:
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(case_notes)")}
+            if "version" not in columns:
+                conn.execute("ALTER TABLE case_notes ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_case_notes_version ON case_notes (version)")
+
+    def migrate_from_json(self, assignments_path, tokens_path, case_notes_path):
+        """Import the JSON stores once; later starts find the 'migrated' marker and skip."""
+        with self.db.transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+                return
+            agencies = JsonAssignmentStore(assignments_path).all_agencies() if assignments_path else []
+            veteran_seq = 0
+            for a_seq, agency in enumerate(agencies):
+                conn.execute("INSERT INTO agencies (id, name, seq) VALUES (?, ?, ?)",
+                             (agency["id"], agency["name"], a_seq))
+                for cm_seq, cm in enumerate(agency["case_managers"]):
+                    conn.execute(
+                        "INSERT INTO case_managers (agency_id, id, username, password, seq) VALUES (?, ?, ?, ?, ?)",
+                        (agency["id"], cm["id"], cm["username"], cm["password"], cm_seq))
+                    for v in cm["veterans"]:
+                        veteran_seq += 1
+                        conn.execute(
+                            "INSERT OR REPLACE INTO veterans (agency_id, icn, case_manager_id, name, dob, seq) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (agency["id"], v["id"], cm["id"], v.get("name"), v.get("dob"), veteran_seq))
+            tokens = JsonTokenStore(tokens_path).all() if tokens_path else {}
+            for icn, token_info in tokens.items():
+                conn.execute("INSERT INTO tokens (icn, data, updated_at) VALUES (?, ?, ?)",
+                             (icn, json.dumps(token_info), time.time()))
+            notes = JsonCaseNotesStore(case_notes_path).all() if case_notes_path else {}
+            for icn, note in notes.items():
+                conn.execute(
+                    "INSERT INTO case_notes (icn, living_situation, last_contact, case_notes, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (icn, note.get("living_situation"), note.get("last_contact"), note.get("case_notes"), time.time()))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (str(time.time()),))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('assignments_version', '1')")
+            log.info("Migrated %d agencies, %d tokens and %d case notes into %s", len(agencies), len(tokens), len(notes), self.db.path)
+
+# =========================
+# Backend Selection
+# =========================
+
+def create_storage(backend, assignments_path, tokens_path, case_notes_path, sqlite_path=None, compact_interval=0,
+                   snapshots_path=None):
+    """Return the storage backend named by STORAGE_BACKEND ("json" or "sqlite")."""
+    if backend == "json":
+        return JsonStorage(assignments_path, tokens_path, case_notes_path, compact_interval, snapshots_path)
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path, assignments_path, tokens_path, case_notes_path)
+    raise ValueError(f"Unknown storage backend: {backend}")
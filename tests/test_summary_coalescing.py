@@ -0,0 +1,46 @@
+import os
+import asyncio
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("TOKEN_REFRESH_ENABLED", "false")
+os.environ.setdefault("SUMMARY_WARM_ENABLED", "false")
+
+import app
+
+ICN = "1012345678V000001"
+TOKEN = "at-coalescing-test"
+
+def test_timed_out_batch_degrades_concurrent_single_request(monkeypatch):
+    """A single-ICN request sharing a fetch with a timed-out batch gets a degraded summary, not a 500."""
+    if app.fhir_async_client is None:
+        pytest.skip("async FHIR client unavailable")
+    started = threading.Event()
+
+    async def slow_build(icn, access_token):
+        started.set()
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(app, "build_patient_summary_async", slow_build)
+    monkeypatch.setattr(app, "SUMMARY_BATCH_TIMEOUT", 1.0)
+    monkeypatch.setattr(app.token_manager, "get", lambda icn: {"access_token": TOKEN})
+    monkeypatch.setattr(app.token_manager, "is_expired", lambda token_info: False)
+
+    batch = {}
+    batch_thread = threading.Thread(target=lambda: batch.update(app.fetch_summaries_async({ICN: TOKEN})))
+    batch_thread.start()
+    assert started.wait(5)
+
+    # Joins the batch's flight for the same ICN and token, then outlives the batch timeout
+    with app.app.test_client() as client:
+        begun = time.monotonic()
+        response = client.get("/api/patient", query_string={"id": ICN})
+    batch_thread.join(10)
+
+    assert response.status_code == 200
+    assert response.get_json() == {"id": ICN, "error": "Timed out"}
+    assert time.monotonic() - begun < 10
+    assert batch[ICN]["token_status"] == "unavailable"
+    assert app.summary_flights.stats()["in_flight"] == 0